@@ -0,0 +1,126 @@
+"""Measure api latency with many concurrent editor clients
+
+Starts the hub on a generated corpus (see corpus.py) in a separate
+process, then runs --clients clients at once, each asking for
+--requests completions and keyword lists, and reports latency
+percentiles in milliseconds.
+
+With --wsgi-only the server runs every request through flask, as
+all requests were before the native api handlers, for comparison:
+
+    python benchmarks/concurrency.py
+    python benchmarks/concurrency.py --wsgi-only
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import corpus
+
+PREFIXES = ["cl", "wait", "in", "se", "sh", "ver", "tab", "al", "sc", "lo"]
+
+
+def serve(dirname, port, wsgi_only, ready):
+    import tornado.ioloop
+    from tornado.httpserver import HTTPServer
+    from tornado.wsgi import WSGIContainer
+    from rfhub import handlers
+    from rfhub.app import RobotHub
+
+    sys.argv = ["rfhub", "--no-installed-keywords", "--no-import-sandbox", dirname]
+    hub = RobotHub()
+    if wsgi_only:
+        application = WSGIContainer(hub.app)
+    else:
+        application = handlers.make_application(hub.app, hub.kwdb, hub.args.api_threads)
+    HTTPServer(application).listen(port, address="127.0.0.1")
+    ready.set()
+    tornado.ioloop.IOLoop.current().start()
+
+
+async def client(port, requests, seed, latencies):
+    from tornado.httpclient import AsyncHTTPClient
+    http = AsyncHTTPClient()
+    rand = random.Random(seed)
+    for i in range(requests):
+        if i % 5 == 4:
+            url = "/api/keywords/?fields=name,library&pattern=%s*" % rand.choice(PREFIXES)
+        else:
+            url = "/api/completions/?prefix=%s" % rand.choice(PREFIXES)
+        start = time.perf_counter()
+        await http.fetch("http://127.0.0.1:%d%s" % (port, url))
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_clients(port, clients, requests):
+    from tornado.httpclient import AsyncHTTPClient
+    AsyncHTTPClient.configure(None, max_clients=clients)
+    latencies = []
+    await asyncio.gather(*[client(port, requests, seed, latencies) for seed in range(clients)])
+    return latencies
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure api latency under concurrent load")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--resources", type=int, default=20)
+    parser.add_argument("--keywords", type=int, default=50, help="keywords per file")
+    parser.add_argument("--wsgi-only", action="store_true", default=False,
+                        help="serve every request through flask")
+    parser.add_argument("--output", help="write results to this json file")
+    args = parser.parse_args()
+
+    dirname = tempfile.mkdtemp(prefix="rfhub-bench-")
+    server = None
+    try:
+        corpus.generate(dirname, args.resources, args.keywords, libraries=0, specs=2)
+        port = free_port()
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(target=serve, args=(dirname, port, args.wsgi_only, ready))
+        server.start()
+        if not ready.wait(120):
+            sys.exit("server did not start")
+        start = time.perf_counter()
+        latencies = asyncio.run(run_clients(port, args.clients, args.requests))
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+        shutil.rmtree(dirname)
+
+    results = {"requests": len(latencies), "requests per second": len(latencies) / elapsed}
+    for (name, fraction) in (("p50 ms", 0.5), ("p90 ms", 0.9), ("p99 ms", 0.99)):
+        results[name] = percentile(latencies, fraction) * 1000
+    results["max ms"] = max(latencies) * 1000
+    for (name, value) in results.items():
+        print("%-22s %10.1f" % (name, value))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
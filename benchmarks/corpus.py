@@ -0,0 +1,87 @@
+"""Generate synthetic keyword corpora for benchmarking
+
+A corpus is a folder with:
+
+    resources/resource_N.robot   N resource files with M keywords each
+    libraries/Library_N.py       python libraries whose keywords have long docs
+    specs/Spec_N.xml             libdoc XML specs
+
+Everything is generated from a fixed seed, so the same parameters
+always produce the same corpus.
+
+    python benchmarks/corpus.py DIR [--resources N] [--keywords M] ...
+"""
+
+import argparse
+import os
+import random
+
+WORDS = ("click element wait until page contains input text select from list "
+         "should be visible verify table row cell button link frame window "
+         "alert cookie screenshot locator timeout value attribute checkbox").split()
+
+
+def generate(dirname, resources=20, keywords=50, libraries=5, specs=5, doc_lines=20, seed=0):
+    """Write a corpus to dirname, returning a dictionary describing it"""
+    rand = random.Random(seed)
+
+    def name():
+        return " ".join(rand.choice(WORDS).capitalize() for _ in range(3))
+
+    def doc(lines):
+        return [" ".join(rand.choice(WORDS) for _ in range(10)) for _ in range(lines)]
+
+    os.makedirs(os.path.join(dirname, "resources"), exist_ok=True)
+    for r in range(resources):
+        with open(os.path.join(dirname, "resources", "resource_%d.robot" % r), "w") as f:
+            f.write("*** Settings ***\nDocumentation    Synthetic resource file %d\n\n" % r)
+            f.write("*** Keywords ***\n")
+            for k in range(keywords):
+                f.write("%s %d\n" % (name(), k))
+                f.write("    [Documentation]    %s\n" % "\n    ...    ".join(doc(3)))
+                f.write("    [Arguments]    ${locator}    ${timeout}=%d\n" % (k % 5))
+                f.write("    Log    ${locator}\n\n")
+
+    os.makedirs(os.path.join(dirname, "libraries"), exist_ok=True)
+    for lib in range(libraries):
+        with open(os.path.join(dirname, "libraries", "Library_%d.py" % lib), "w") as f:
+            f.write('"""Synthetic library %d"""\n\n' % lib)
+            for k in range(keywords):
+                f.write("\ndef %s_%d(locator, timeout=%d):\n" % (name().lower().replace(" ", "_"), k, k % 5))
+                f.write('    """%s\n    """\n' % "\n    ".join(doc(doc_lines)))
+                f.write("    pass\n")
+
+    os.makedirs(os.path.join(dirname, "specs"), exist_ok=True)
+    for s in range(specs):
+        with open(os.path.join(dirname, "specs", "Spec_%d.xml" % s), "w") as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<keywordspec name="Spec_%d" type="library" format="ROBOT" generated="20200101 00:00:00">\n' % s)
+            f.write("<version>1.0</version>\n<scope>global</scope>\n<namedargs>yes</namedargs>\n")
+            f.write("<doc>Synthetic spec %d</doc>\n" % s)
+            for k in range(keywords):
+                f.write('<kw name="%s %d">\n<arguments>\n<arg>locator</arg>\n<arg>timeout=%d</arg>\n</arguments>\n'
+                        % (name(), k, k % 5))
+                f.write("<doc>%s</doc>\n<tags>\n</tags>\n</kw>\n" % "\n".join(doc(doc_lines)))
+            f.write("</keywordspec>\n")
+
+    return {"resources": resources, "libraries": libraries, "specs": specs,
+            "keywords_per_file": keywords, "doc_lines": doc_lines, "seed": seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic keyword corpus")
+    parser.add_argument("dirname")
+    parser.add_argument("--resources", type=int, default=20)
+    parser.add_argument("--keywords", type=int, default=50, help="keywords per file")
+    parser.add_argument("--libraries", type=int, default=5)
+    parser.add_argument("--specs", type=int, default=5)
+    parser.add_argument("--doc-lines", type=int, default=20,
+                        help="lines of documentation per library and spec keyword")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate(args.dirname, args.resources, args.keywords, args.libraries,
+                   args.specs, args.doc_lines, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Benchmark the hub against a synthetic corpus
+
+This generates a corpus (see corpus.py), then times:
+
+  - ingestion of the whole corpus into a fresh KeywordTable
+  - search, get_keywords and get_keyword_hierarchy
+  - the api and doc endpoints, through the Flask test client
+  - how long it takes for a changed file to be reloaded by the watchdog
+
+Every timing is the best of --repeat runs, in seconds. Results can
+be written as json, and compared against an earlier run:
+
+    python benchmarks/run.py --output baseline.json
+    ... make changes ...
+    python benchmarks/run.py --compare baseline.json
+
+With --compare, every timing more than --threshold (default 20%)
+slower than the baseline is reported, and the exit code is 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import corpus
+from rfhub.kwdb import KeywordTable
+from rfhub.version import __version__
+
+
+def best(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def bench_queries(dirname, db, repeat):
+    results = {}
+
+    def ingest():
+        kwdb = KeywordTable(db)
+        kwdb.add_folder(dirname, watch=False)
+        kwdb.observer.stop()
+    results["ingest"] = best(ingest, repeat)
+
+    kwdb = KeywordTable(db)
+    kwdb.add_folder(dirname, watch=False)
+    kwdb.observer.stop()
+    results["get_keywords"] = best(lambda: kwdb.get_keywords(), repeat)
+    results["get_keywords (pattern)"] = best(lambda: kwdb.get_keywords("click*"), repeat)
+    results["get_keyword_hierarchy"] = best(lambda: kwdb.get_keyword_hierarchy(), repeat)
+    results["search"] = best(lambda: kwdb.search("wait until"), repeat)
+    results["search (name)"] = best(lambda: kwdb.search("wait until", mode="name"), repeat)
+    return results
+
+
+def bench_api(dirname, db, repeat):
+    """Time the endpoints, and the watchdog reload latency"""
+    from rfhub.app import RobotHub
+
+    old_argv = sys.argv
+    sys.argv = ["rfhub", "--db", db, "--no-installed-keywords", dirname]
+    try:
+        hub = RobotHub()
+    finally:
+        sys.argv = old_argv
+    client = hub.app.test_client()
+    collection_id = hub.kwdb.get_collections()[0]["collection_id"]
+
+    results = {}
+    urls = {
+        "GET /api/keywords/": "/api/keywords/",
+        "GET /api/keywords/?fields=name": "/api/keywords/?fields=name,library",
+        "GET /api/libraries/": "/api/libraries/",
+        "GET /doc/": "/doc/",
+        "GET /doc/keywords/<id>/": "/doc/keywords/%s/" % collection_id,
+        "GET /doc/search/": "/doc/search/?pattern=wait",
+    }
+    for (label, url) in urls.items():
+        results[label] = best(lambda: client.get(url), repeat)
+
+    results["watchdog reload"] = min(watchdog_latency(hub.kwdb, dirname, i) for i in range(repeat))
+    hub.kwdb.observer.stop()
+    return results
+
+
+def watchdog_latency(kwdb, dirname, index, timeout=10):
+    """Append a keyword to a resource file, and wait until it can be found"""
+    path = os.path.join(dirname, "resources", "resource_0.robot")
+    collection_id = kwdb.storage.get_collection_ids(os.path.abspath(path))[0]
+    name = "Benchmark Reload Keyword %d" % index
+    start = time.perf_counter()
+    with open(path, "a") as f:
+        f.write("%s\n    No operation\n\n" % name)
+    while time.perf_counter() - start < timeout:
+        if kwdb.get_keyword(collection_id, name):
+            return time.perf_counter() - start
+        time.sleep(0.005)
+    return float("inf")
+
+
+def compare(results, baseline, threshold):
+    """Print a comparison table, returning the names of regressed timings"""
+    regressions = []
+    print("%-36s %12s %12s %8s" % ("", "baseline", "current", "change"))
+    for (name, seconds) in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print("%-36s %12s %12.4f" % (name, "-", seconds))
+            continue
+        change = (seconds - old) / old if old else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("%-36s %12.4f %12.4f %+7.0f%%%s" % (name, old, seconds, change * 100, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hub against a synthetic corpus")
+    parser.add_argument("--db", default="sqlite:///:memory:", help="storage to benchmark")
+    parser.add_argument("--resources", type=int, default=20)
+    parser.add_argument("--keywords", type=int, default=50, help="keywords per file")
+    parser.add_argument("--libraries", type=int, default=5)
+    parser.add_argument("--specs", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results to this json file")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare results with an earlier json file")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fraction a timing may grow before it counts as a regression (default=0.2)")
+    args = parser.parse_args()
+
+    dirname = tempfile.mkdtemp(prefix="rfhub-bench-")
+    try:
+        description = corpus.generate(dirname, args.resources, args.keywords, args.libraries, args.specs)
+        results = bench_queries(dirname, args.db, args.repeat)
+        results.update(bench_api(dirname, args.db, args.repeat))
+    finally:
+        shutil.rmtree(dirname)
+
+    report = {"meta": {"corpus": description, "db": args.db, "repeat": args.repeat,
+                       "rfhub": __version__, "python": platform.python_version()},
+              "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.threshold)
+        sys.exit(1 if regressions else 0)
+    else:
+        for (name, seconds) in results.items():
+            print("%-36s %10.4f" % (name, seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare the speed of the storage backends
+
+Usage:
+
+    python benchmarks/storage_benchmark.py [--collections N] [--keywords M]
+           [--repeat R] [--db URL ...]
+
+Every backend is loaded with the same synthetic catalog, then each
+query is run R times; the best time for each is reported in
+milliseconds.
+"""
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from rfhub.storage import create_storage
+
+
+def make_catalog(n_collections, n_keywords):
+    """Return a list of (collection name, [(name, doc, args), ...]) pairs"""
+    catalog = []
+    for c in range(n_collections):
+        keywords = []
+        for k in range(n_keywords):
+            # page-object libraries repeat docs and signatures a lot,
+            # so only some of them are unique
+            doc = "Keyword number %s\nDetails for keyword %s" % (k % 50, k % 50)
+            args = ["locator", "timeout=%s" % (k % 5)]
+            keywords.append(("Page %s Keyword %s" % (c, k), doc, args))
+        catalog.append(("Collection%s" % c, keywords))
+    return catalog
+
+
+def load(storage, catalog):
+    storage.reset()
+    for (name, keywords) in catalog:
+        collection_id = storage.add_collection("/tmp/%s.robot" % name, name, "resource",
+                                               "Synthetic collection %s" % name)
+        storage.add_keywords(collection_id, keywords)
+
+
+def run(url, catalog, repeat):
+    storage = create_storage(url)
+    timings = {"load": min(timeit.repeat(lambda: load(storage, catalog), number=1, repeat=repeat))}
+
+    ids = [c["collection_id"] for c in storage.get_collections()]
+    names = [(ids[i], kw[0]) for i, (_, keywords) in enumerate(catalog) for kw in keywords]
+    sample = random.Random(0).sample(names, min(100, len(names)))
+
+    queries = {
+        "get_collections": lambda: storage.get_collections(),
+        "get_keywords": lambda: storage.get_keywords(),
+        "get_keyword x%s" % len(sample): lambda: [storage.get_keyword(c, k) for (c, k) in sample],
+        "get_keyword_data": lambda: storage.get_keyword_data(ids[0]),
+        "get_keyword_hierarchy": lambda: storage.get_keyword_hierarchy(),
+        "search": lambda: storage.search("details for keyword 4*"),
+        "search (name)": lambda: storage.search("keyword 4*", mode="name"),
+    }
+    for (label, query) in queries.items():
+        timings[label] = min(timeit.repeat(query, number=1, repeat=repeat))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the speed of the storage backends")
+    parser.add_argument("--collections", type=int, default=50)
+    parser.add_argument("--keywords", type=int, default=100,
+                        help="number of keywords per collection")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--db", action="append",
+                        help="backend url to benchmark (default: sqlite:///:memory: and memory://)")
+    args = parser.parse_args()
+
+    urls = args.db or ["sqlite:///:memory:", "memory://"]
+    catalog = make_catalog(args.collections, args.keywords)
+    results = [(url, run(url, catalog, args.repeat)) for url in urls]
+
+    print("%d collections x %d keywords, best of %d (ms)" % (args.collections, args.keywords, args.repeat))
+    print("%-24s" % "" + "".join("%22s" % url for url in urls))
+    for label in results[0][1]:
+        print("%-24s" % label + "".join("%22.2f" % (timings[label] * 1000) for (url, timings) in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,3 @@
-import pkg_resources
-from rfhub import kwdb
 from .version import __version__
 
 # this will be defined once the app starts
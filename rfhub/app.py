@@ -4,6 +4,8 @@ import inspect
 import os
 import signal
 import sys
+import threading
+import time
 
 import flask
 import robot.errors
@@ -12,10 +14,22 @@ from flask import current_app
 from rfhub.version import __version__
 from robot.utils.argumentparser import ArgFileParser
 from tornado.httpserver import HTTPServer
-from tornado.wsgi import WSGIContainer
+
+try:
+    from werkzeug.middleware.dispatcher import DispatcherMiddleware
+except ImportError:
+    # werkzeug < 0.15
+    from werkzeug.wsgi import DispatcherMiddleware
 
 from rfhub import blueprints
+from rfhub import catalogs
+from rfhub import handlers
+from rfhub import metrics
+from rfhub import scheduler
+from rfhub import snapshot
+from rfhub import staticsite
 from rfhub.kwdb import KeywordTable
+from rfhub.sandbox import ImportSandbox
 
 
 class RobotHub(object):
@@ -29,30 +43,65 @@ class RobotHub(object):
             print(__version__)
             sys.exit(0)
 
-        self.kwdb = KeywordTable(self.args.db, poll=self.args.poll)
-
-        if not self.args.web:
-            print("Loading libraries data")
-            self.kwdb.reset()
-            for lib in self.args.library:
-                try:
-                    self.kwdb.add_library(lib)
-                except robot.errors.DataError as e:
-                    sys.stderr.write("unable to load library '%s': %s\n" % (lib, e))
-            self._load_keyword_data(self.args.path, self.args.no_installed_keywords)
-
-        if not self.args.worker:
-            self.app = flask.Flask(__name__)
-
-            with self.app.app_context():
-                current_app.kwdb = self.kwdb
+        try:
+            self.catalogs = catalogs.parse_catalogs(self.args.catalog)
+        except ValueError as e:
+            sys.stderr.write("invalid --catalog: %s\n" % e)
+            sys.exit(1)
 
-            self.app.add_url_rule("/", "home", self._root)
-            self.app.add_url_rule("/ping", "ping", self._ping)
-            self.app.add_url_rule("/favicon.ico", "favicon", self._favicon)
-            self.app.register_blueprint(blueprints.api, url_prefix="/api")
-            self.app.register_blueprint(blueprints.doc, url_prefix="/doc")
-            self.app.register_blueprint(blueprints.dashboard, url_prefix="/dashboard")
+        if self.args.snapshot:
+            try:
+                self.kwdb = snapshot.open_snapshot(self.args.snapshot, poll=self.args.poll)
+            except snapshot.SnapshotError as e:
+                sys.stderr.write("unable to open snapshot: %s\n" % e)
+                sys.exit(1)
+        else:
+            sandbox = None
+            if not self.args.no_import_sandbox:
+                sandbox = ImportSandbox(timeout=self.args.import_timeout,
+                                        memory_limit=self.args.import_memory_limit)
+            try:
+                # only a hub that loads keywords (and keeps running)
+                # has files to watch
+                self.kwdb = KeywordTable(self.args.db, poll=self.args.poll, sandbox=sandbox,
+                                         read_urls=self.args.db_read,
+                                         watch=not (self.args.web or self.args.worker),
+                                         index_usages=self.args.index_usages)
+            except ValueError as e:
+                sys.stderr.write("invalid --db-read: %s\n" % e)
+                sys.exit(1)
+
+        # with --progressive, the hub starts serving right away
+        # and loads keywords in the background (see start)
+        self.progressive = (self.args.progressive and not self.args.worker and
+                            not self.args.export_snapshot and not self.args.export_static)
+        if not self.args.web and not self.args.snapshot and not self.progressive:
+            self._load()
+
+        if self.args.export_snapshot:
+            snapshot.export_snapshot(self.kwdb, self.args.export_snapshot)
+            print("Snapshot written to " + self.args.export_snapshot)
+
+        if not self.args.worker or self.args.export_static:
+            self.app = self._create_app(self.kwdb)
+
+            # each catalog is an app of its own, under /t/<name>
+            self.mounts = []
+            all_roots = [root for (name, roots) in self.catalogs for root in roots]
+            for (name, roots) in self.catalogs:
+                catalog = catalogs.Catalog(self.kwdb, name, roots, all_roots)
+                self.mounts.append(("/t/" + name, self._create_app(catalog), catalog))
+            if self.mounts:
+                self.app.wsgi_app = DispatcherMiddleware(
+                    self.app.wsgi_app, dict((prefix, app) for (prefix, app, kwdb) in self.mounts))
+
+        if self.args.export_static:
+            try:
+                count = staticsite.export_static(self.app, self.args.export_static)
+            except staticsite.StaticExportError as e:
+                sys.stderr.write("unable to export static site: %s\n" % e)
+                sys.exit(1)
+            print("Static site (%d files) written to %s" % (count, self.args.export_static))
 
     def start(self):
         """Start the app"""
@@ -60,13 +109,22 @@ class RobotHub(object):
             print("Closing application - worker mode")
             return
         if self.args.debug:
+            self._start_loading()
             self.app.run(port=self.args.port, debug=self.args.debug, host=self.args.interface)
         else:
             root = "http://%s:%s" % (self.args.interface, self.args.port)
             print("tornado web server running on " + root)
             self.shutdown_requested = False
-            http_server = HTTPServer(WSGIContainer(self.app))
+            tasks = scheduler.Scheduler(self.args.api_threads)
+            # file changes are reloaded when the api has nothing more urgent to do
+            self.kwdb.reload_executor = tasks.executor(scheduler.BACKGROUND)
+            http_server = HTTPServer(handlers.make_application(self.app, self.kwdb, self.args.api_threads,
+                                                              self.mounts, self.args.max_streams,
+                                                              self.args.stream_queue, tasks,
+                                                              self.args.rate_limit),
+                                     xheaders=self.args.behind_proxy)
             http_server.listen(port=self.args.port, address=self.args.interface)
+            self._start_loading()
 
             signal.signal(signal.SIGINT, self.signal_handler)
             tornado.ioloop.PeriodicCallback(self.check_shutdown_flag, 500).start()
@@ -82,16 +140,54 @@ class RobotHub(object):
             tornado.ioloop.IOLoop.instance().stop()
             print("web server stopped.")
 
+    def _create_app(self, kwdb):
+        """Return a flask app serving the keywords in kwdb"""
+        app = flask.Flask(__name__)
+
+        with app.app_context():
+            current_app.kwdb = kwdb
+
+        app.add_url_rule("/", "home", self._root)
+        app.add_url_rule("/ping", "ping", self._ping)
+        app.add_url_rule("/metrics", "metrics", self._metrics)
+        app.before_request(self._start_request_timer)
+        app.after_request(self._record_request_time)
+        app.add_url_rule("/favicon.ico", "favicon", self._favicon)
+        app.register_blueprint(blueprints.api, url_prefix="/api")
+        app.register_blueprint(blueprints.doc, url_prefix="/doc")
+        app.register_blueprint(blueprints.dashboard, url_prefix="/dashboard")
+        app.config["RFHUB_CLIENT_SEARCH"] = self.args.client_search
+        self._precompile_templates(app)
+        return app
+
     def _parse_args(self):
         parser = argparse.ArgumentParser()
         parser.add_argument("--web", action="store_true", default=False,
                             help="Does not load libraries before server start, relies on worker process to load it")
         parser.add_argument("--worker", action="store_true", default=False,
                             help="Load libraries to database and does not start web server")
-        parser.add_argument("--db", default="sqlite:///:memory:",
-                            help="use the given database URL (default=sqlite:///:memory:)")
+        parser.add_argument("--db", "--db-write", dest="db", default="sqlite:///:memory:",
+                            help="use the given database URL, or memory:// for a pure "
+                                 "in-memory catalog (default=sqlite:///:memory:)")
+        parser.add_argument("--db-read", action="append", default=[], metavar="URL",
+                            help="answer queries from the database at URL, a read replica of --db; "
+                                 "may be given more than once")
+        parser.add_argument("--snapshot", metavar="FILE",
+                            help="serve the keywords in a snapshot FILE (read-only, nothing is loaded)")
+        parser.add_argument("--export-snapshot", metavar="FILE",
+                            help="after loading, write all keyword data to a snapshot FILE")
+        parser.add_argument("--export-static", metavar="DIR",
+                            help="after loading, write the documentation as a static web site to DIR")
         parser.add_argument("-l", "--library", action="append", default=[],
                             help="load the given LIBRARY (eg: -l DatabaseLibrary)")
+        parser.add_argument("--catalog", action="append", default=[], metavar="NAME=PATH",
+                            help="also serve the keywords in PATH (and any libraries not loaded from the "
+                                 "path of another catalog) under /t/NAME; may be given more than once")
+        parser.add_argument("--index-usages", action="store_true", default=False,
+                            help="also find where each keyword is called, in every test suite and "
+                                 "resource file in the given paths")
+        parser.add_argument("--spec", action="append", default=[],
+                            help="load libdoc spec files (xml or json) from a file, folder or archive")
         parser.add_argument("-i", "--interface", default="127.0.0.1",
                             help="use the given network interface (default=127.0.0.1)")
         parser.add_argument("-p", "--port", default=7070, type=int,
@@ -106,8 +202,37 @@ class RobotHub(object):
                             help="turn on debug mode")
         parser.add_argument("--no-installed-keywords", action="store_true", default=False,
                             help="do not load some common installed keyword libraries, such as BuiltIn")
+        parser.add_argument("--no-library-cache", action="store_true", default=False,
+                            help="document installed libraries again instead of using the cached documentation")
+        parser.add_argument("--no-import-sandbox", action="store_true", default=False,
+                            help="import libraries in the hub process rather than in worker processes")
+        parser.add_argument("--import-timeout", type=int, default=60, metavar="SECONDS",
+                            help="give up on a library that takes longer than this to import (default=60)")
+        parser.add_argument("--import-memory-limit", type=int, default=None, metavar="MB",
+                            help="limit the memory a library import worker may use")
+        parser.add_argument("--api-threads", type=int, default=8, metavar="N",
+                            help="number of threads answering /api/keywords, /api/libraries and "
+                                 "/api/completions requests (default=8)")
+        parser.add_argument("--max-streams", type=int, default=4, metavar="N",
+                            help="number of keyword lists sent at once; others wait their turn (default=4)")
+        parser.add_argument("--stream-queue", type=int, default=32, metavar="N",
+                            help="number of keyword lists that may wait for their turn; requests "
+                                 "beyond that are answered with 429 Too Many Requests (default=32)")
+        parser.add_argument("--rate-limit", type=float, default=0, metavar="N",
+                            help="requests each client may make a second to the api endpoints served by "
+                                 "tornado, on average; keyword lists count as 10 (default=0, no limit)")
+        parser.add_argument("--behind-proxy", action="store_true", default=False,
+                            help="trust the X-Real-Ip and X-Forwarded-For headers set by a reverse proxy, "
+                                 "so that --rate-limit applies to each client rather than to the proxy")
+        parser.add_argument("--client-search", action="store_true", default=False,
+                            help="search the docs in the browser, using an index downloaded once, "
+                                 "rather than asking the hub for every search")
+        parser.add_argument("--progressive", action="store_true", default=False,
+                            help="start serving right away, and load libraries and paths in the background")
         parser.add_argument("--poll", action="store_true", default=False,
                             help="use polling behavior instead of events to reload keywords on changes (useful in VMs)")
+        parser.add_argument("--profile-startup", type=int, default=0, metavar="N",
+                            help="after loading, list the N files and libraries that took the longest")
         parser.add_argument("--root", action="store", default="/dashboard",
                             help="Redirect root url (http://localhost:port/) to this url (eg: /dashboard, /doc)")
         parser.add_argument("--version", action="store_true", default=False,
@@ -117,20 +242,103 @@ class RobotHub(object):
         return parser.parse_args()
 
     def _favicon(self):
-        static_dir = os.path.join(self.app.root_path, 'static')
-        return flask.send_from_directory(os.path.join(self.app.root_path, 'static'),
+        return flask.send_from_directory(os.path.join(current_app.root_path, 'static'),
                                          'favicon.ico', mimetype='image/vnd.microsoft.icon')
 
     def _root(self):
-        return flask.redirect(self.args.root)
+        return flask.redirect(flask.request.script_root + self.args.root)
 
     def _ping(self):
-        """This function is called via the /ping url"""
+        """This function is called via the /ping url
+
+        The answer is "pong", as it always was. With --progressive
+        the hub answers as soon as it is listening, and the response
+        says how far loading has got; clients that ask for json get
+        that in any mode.
+        """
+        accept = flask.request.accept_mimetypes
+        if self.progressive or accept.best_match(["text/plain", "application/json"]) == "application/json":
+            return flask.jsonify(self.kwdb.progress.as_dict())
         return "pong"
 
-    def _load_keyword_data(self, paths, no_install_keywords):
+    def _metrics(self):
+        """This function is called via the /metrics url"""
+        return flask.Response(metrics.registry.render(),
+                              mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+    def _start_request_timer(self):
+        flask.g.request_start = time.perf_counter()
+
+    def _record_request_time(self, response):
+        start = getattr(flask.g, "request_start", None)
+        if start is not None:
+            metrics.registry.observe("rfhub_request_seconds", time.perf_counter() - start,
+                                     endpoint=flask.request.endpoint or "(unknown)",
+                                     method=flask.request.method)
+        return response
+
+    def _precompile_templates(self, app):
+        """Compile every template now rather than on its first request"""
+        env = app.jinja_env
+        for name in env.list_templates(extensions=["html"]):
+            env.get_template(name)
+
+    def _print_startup_profile(self, elapsed, count):
+        """Print the files and libraries that took the longest to load"""
+        print("Loaded keyword data in %.2f seconds; the slowest %d were:" % (elapsed, count))
+        for (source, kind, seconds) in metrics.registry.slowest(count):
+            print("  %8.3fs  %-9s %s" % (seconds, kind, source))
+
+    def _start_loading(self):
+        """With --progressive, start loading keywords in the background"""
+        if self.progressive and not self.args.web and not self.args.snapshot:
+            self.kwdb.progress.start()
+            threading.Thread(target=self._load, name="rfhub-loader", daemon=True).start()
+
+    def _load(self):
+        """Load the libraries, specs and paths given on the command line"""
+        progress = self.kwdb.progress
+        if not progress.loading:
+            progress.start()
+        print("Loading libraries data")
+        load_start = time.perf_counter()
+        try:
+            self.kwdb.reset()
+            paths = list(self.args.path)
+            for (name, roots) in self.catalogs:
+                paths.extend(root for root in roots if root not in paths)
+            progress.expect((0 if self.args.no_installed_keywords else 1) +
+                            len(self.args.library) + len(self.args.spec) +
+                            sum(self.kwdb.count_files(path) for path in paths))
+            for lib in self.args.library:
+                try:
+                    self.kwdb.add_library(lib)
+                except robot.errors.DataError as e:
+                    sys.stderr.write("unable to load library '%s': %s\n" % (lib, e))
+                progress.step(lib)
+            for spec in self.args.spec:
+                try:
+                    self.kwdb.add_spec(spec)
+                except Exception as e:
+                    sys.stderr.write("unable to load spec '%s': %s\n" % (spec, e))
+                progress.step(spec)
+            self._load_keyword_data(paths, self.args.no_installed_keywords,
+                                    not self.args.no_library_cache)
+            if self.kwdb.sandbox is not None:
+                # don't keep idle workers around; they are started
+                # again if a library needs to be reloaded
+                self.kwdb.sandbox.close()
+        finally:
+            progress.finish()
+        if self.progressive:
+            print("Loaded keyword data in %.2f seconds" % (time.perf_counter() - load_start))
+        if self.args.profile_startup:
+            self._print_startup_profile(time.perf_counter() - load_start, self.args.profile_startup)
+
+    def _load_keyword_data(self, paths, no_install_keywords, use_cache=True):
         if not no_install_keywords:
-            self.kwdb.add_installed_libraries()
+            self.kwdb.add_installed_libraries(use_cache)
+            self.kwdb.progress.step("(installed libraries)")
 
         for path in paths:
             try:
@@ -6,13 +6,19 @@ This blueprint provides the /api interface.
 '''
 
 from flask import Blueprint
+from . import changes
+from . import duplicates
 from . import keywords
 from . import libraries
+from . import search
 
 blueprint = Blueprint('api', __name__)
 
 endpoints = [
+    changes.ApiEndpoint(blueprint),
+    duplicates.ApiEndpoint(blueprint),
     keywords.ApiEndpoint(blueprint),
-    libraries.ApiEndpoint(blueprint)
+    libraries.ApiEndpoint(blueprint),
+    search.ApiEndpoint(blueprint)
 ]
 
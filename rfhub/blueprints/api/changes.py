@@ -0,0 +1,101 @@
+'''
+This provides the view function for the /api/changes endpoint
+
+Clients keeping a local copy of the catalog ask for what changed since
+the data version they last saw, rather than downloading everything:
+
+    /api/changes?since=<version>&epoch=<epoch>
+
+Collections added since then are returned with all their keywords;
+collections that were reloaded are returned with only the keywords
+that were added or modified, plus the names of the keywords that were
+removed. Collections that were removed are listed in "removed".
+
+If the client has no version yet, or its version is from another
+epoch (see KeywordTable.get_epoch), everything is returned and "full"
+is true: the client should throw away what it has.
+'''
+
+import flask
+from flask import current_app
+
+COLLECTION_FIELDS = ("collection_id", "name", "type", "doc", "version", "scope",
+                     "namedargs", "path", "doc_format")
+
+
+class ApiEndpoint(object):
+    def __init__(self, blueprint):
+        blueprint.add_url_rule("/changes", view_func = self.get_changes)
+
+    def get_changes(self):
+        try:
+            since = int(flask.request.args.get('since', "0"))
+        except ValueError:
+            flask.abort(400)
+        epoch = flask.request.args.get('epoch', "")
+        return flask.jsonify(changes_since(current_app.kwdb, since, epoch))
+
+
+def changes_since(kwdb, since, epoch):
+    '''Return everything that changed after data version 'since' '''
+    # read the version first; anything that changes while we're
+    # working is sent again the next time the client asks
+    version = kwdb.get_version()
+    full = since <= 0 or epoch != kwdb.get_epoch() or since > version
+    if full:
+        since = 0
+
+    # the latest change to every collection, and to every keyword
+    # of collections that were reloaded
+    latest = {}
+    added = set()
+    keyword_changes = {}
+    for (change_version, collection_id, name, keyword, event) in kwdb.get_changes(since):
+        if change_version > version:
+            break
+        if keyword is None:
+            latest[collection_id] = (change_version, name, event)
+            if event == "added":
+                added.add(collection_id)
+        else:
+            keyword_changes.setdefault(collection_id, {})[keyword] = event
+
+    if full:
+        # every collection, including any loaded before there was a
+        # change log (eg: in snapshots)
+        latest = dict((c["collection_id"], (latest.get(c["collection_id"], (0,))[0], c["name"], "added"))
+                      for c in kwdb.get_collections())
+        added = set(latest)
+
+    collections = []
+    removed = []
+    for (collection_id, (change_version, name, event)) in sorted(latest.items()):
+        if event == "removed":
+            removed.append({"collection_id": collection_id, "name": name,
+                            "change_version": change_version})
+            continue
+        collection = kwdb.get_collection(collection_id)
+        if collection is None:
+            # removed after we read the version
+            continue
+        data = dict((field, collection[field]) for field in COLLECTION_FIELDS)
+        data["change_version"] = change_version
+        keywords = kwdb.get_keyword_data(collection_id)
+        if collection_id in added:
+            data["keywords"] = [_keyword(keyword) for keyword in keywords]
+            data["removed_keywords"] = []
+        else:
+            changed = keyword_changes.get(collection_id, {})
+            data["keywords"] = [_keyword(keyword) for keyword in keywords
+                                if changed.get(keyword[1]) in ("added", "updated")]
+            data["removed_keywords"] = sorted(name for (name, event) in changed.items()
+                                              if event == "removed")
+        collections.append(data)
+
+    return {"epoch": kwdb.get_epoch(), "version": version, "full": full,
+            "collections": collections, "removed": removed}
+
+
+def _keyword(keyword_data):
+    (keyword_id, name, args, doc) = keyword_data
+    return {"name": name, "args": args, "doc": doc}
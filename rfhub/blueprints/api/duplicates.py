@@ -0,0 +1,47 @@
+'''
+This provides the /api/duplicates endpoint, which lists keywords
+that look copy-pasted (see rfhub.duplicates)
+
+    /api/duplicates/?limit=100
+
+The response has "names", "exact" and "similar" objects, each with
+the "total" number of groups of that kind, and the largest "groups"
+(at most limit of them).
+'''
+
+import flask
+from flask import current_app
+
+# how many groups of each kind are returned, unless asked otherwise
+DEFAULT_LIMIT = 100
+
+
+class ApiEndpoint(object):
+    def __init__(self, blueprint):
+        blueprint.add_url_rule("/duplicates/", view_func = self.get_duplicates)
+
+    def get_duplicates(self):
+        try:
+            limit = max(0, int(flask.request.args.get("limit", DEFAULT_LIMIT)))
+        except ValueError:
+            return flask.jsonify(error="limit must be an integer"), 400
+        return flask.jsonify(**duplicate_list(current_app.kwdb, limit, flask.url_for))
+
+
+def duplicate_list(kwdb, limit, url_for):
+    '''Return the largest groups of each kind of duplicates in kwdb'''
+    result = {}
+    for (kind, groups) in sorted(kwdb.duplicates.find().items()):
+        result[kind] = {
+            "total": len(groups),
+            "groups": [dict(group, keywords=[_keyword(keyword, url_for) for keyword in group["keywords"]])
+                       for group in groups[:limit]]
+        }
+    return result
+
+
+def _keyword(keyword, url_for):
+    (collection_id, library, name) = keyword
+    return {"collection_id": collection_id, "library": library, "name": name,
+            "api_keyword_url": url_for("api.get_library_keyword", collection_id=collection_id, keyword=name),
+            "doc_keyword_url": url_for("doc.doc_for_library", collection_id=collection_id, keyword=name)}
@@ -2,92 +2,343 @@
 This provides the view functions for the /api/keywords endpoints
 '''
 
+import functools
+import operator
+import re
+
 import flask
 from flask import current_app
-from robot.libdocpkg.htmlwriter import DocToHtml
+from robot.utils import normalize
+
+from rfhub.storage.base import glob_escape, normalize_name, synopsis
+from rfhub.streaming import encode_list
+from rfhub.usages import usage_names
+
+ALL_FIELDS = ("collection_id","library", "name","synopsis","doc","htmldoc","args",
+              "doc_keyword_url", "api_keyword_url", "api_library_url")
+
+# the database columns (see Storage.get_keyword_fields) each field needs
+FIELD_COLUMNS = {
+    "collection_id": ("collection_id",),
+    "library": ("library",),
+    "name": ("name",),
+    "synopsis": ("synopsis",),
+    "doc": ("doc",),
+    "htmldoc": ("doc",),
+    "args": ("args",),
+    "doc_keyword_url": ("collection_id", "name"),
+    "api_keyword_url": ("collection_id", "name"),
+    "api_library_url": ("collection_id",),
+    # not one of ALL_FIELDS; it has to be asked for
+    "usage_count": ("library", "name"),
+}
+
+# the endpoint of each url field, and the columns its url values come from
+URL_FIELDS = {
+    "doc_keyword_url": ("doc.doc_for_library", (("collection_id", "collection_id"), ("keyword", "name"))),
+    "api_keyword_url": ("api.get_library_keyword", (("collection_id", "collection_id"), ("keyword", "name"))),
+    "api_library_url": ("api.get_library_keywords", (("collection_id", "collection_id"),)),
+}
+
+# how many keywords are read from the database (and sent) at a time
+CHUNK_SIZE = 500
+
+# the most keywords that can be looked up in one request
+MAX_LOOKUPS = 5000
+
+# how many usages of a keyword are returned at once, unless asked otherwise
+USAGES_PAGE_SIZE = 100
+MAX_USAGES_PAGE_SIZE = 1000
+
 
 class ApiEndpoint(object):
     def __init__(self, blueprint):
         blueprint.add_url_rule("/keywords/", view_func = self.get_keywords)
         blueprint.add_url_rule("/keywords/<collection_id>", view_func = self.get_library_keywords)
         blueprint.add_url_rule("/keywords/<collection_id>/<keyword>", view_func = self.get_library_keyword)
+        blueprint.add_url_rule("/keywords/<collection_id>/<keyword>/usages", view_func = self.get_keyword_usages)
+        blueprint.add_url_rule("/keywords/batch", view_func = self.lookup_keywords, methods=["POST"])
+        blueprint.add_url_rule("/completions/", view_func = self.get_completions)
 
     def get_library_keywords(self,collection_id):
-
-        query_pattern = flask.request.args.get('pattern', "*").strip().lower()
-        keywords = current_app.kwdb.get_keywords(query_pattern)
-
-        req_fields  = flask.request.args.get('fields', "*").strip().lower()
-        if (req_fields == "*"):
-            fields = ("collection_id","library", "name","synopsis","doc","htmldoc","args",
-                      "doc_keyword_url", "api_keyword_url", "api_library_url")
-        else:
-            fields = [x.strip() for x in req_fields.split(",")]
-
-        result = []
-        for (keyword_collection_id, keyword_collection_name,
-             keyword_name, keyword_doc, keyword_args) in keywords:
-            if collection_id == "" or collection_id == keyword_collection_id:
-                data = {}
-                if ("collection_id" in fields): data["collection_id"] = keyword_collection_id
-                if ("library" in fields): data["library"] = keyword_collection_name
-                if ("name" in fields): data["name"] = keyword_name
-                if ("synopsis" in fields): data["synopsis"] = keyword_doc.strip().split("\n")[0]
-                if ("doc" in fields): data["doc"] = keyword_doc
-                if ("args" in fields): data["args"] = keyword_args
-
-                if ("doc_keyword_url" in fields):
-                    data["doc_keyword_url"] = flask.url_for("doc.doc_for_library",
-                                                            collection_id=keyword_collection_id,
-                                                            keyword=keyword_name)
-                if ("api_keyword_url" in fields):
-                    data["api_keyword_url"] = flask.url_for(".get_library_keyword",
-                                                            collection_id=keyword_collection_id,
-                                                            keyword=keyword_name)
-
-                if ("api_library_url" in fields):
-                    data["api_library_url"] = flask.url_for(".get_library_keywords",
-                                                            collection_id=keyword_collection_id)
-                if ("htmldoc" in fields):
-                    try:
-                        data["htmldoc"] = DocToHtml("ROBOT")(keyword_doc)
-                    except Exception as e:
-                        data["htmldoc"] = "";
-                        htmldoc = "bummer", e
-
-
-                result.append(data)
-
-        return flask.jsonify(keywords=result)
+        chunks = keyword_chunks(current_app.kwdb, collection_id,
+                                flask.request.args.get('pattern', "*"),
+                                flask.request.args.get('fields', "*"),
+                                flask.url_for)
+        return flask.Response(flask.stream_with_context(encode_list("keywords", chunks)),
+                              mimetype="application/json")
 
     def get_keywords(self):
         # caller wants a list of keywords
         collection_id = flask.request.args.get('collection_id', "")
         return self.get_library_keywords(collection_id)
 
-    def get_library_keyword(self, collection_id, keyword):
-        kwdb = current_app.kwdb
+    def get_completions(self):
+        result = completions(current_app.kwdb,
+                             flask.request.args.get('prefix', ""),
+                             flask.request.args.get('limit', "20"))
+        return flask.jsonify(completions=result)
 
-        # if collection_id is a name, redirect?
-        collections = kwdb.get_collections(pattern=collection_id.strip().lower())
-        if len(collections) == 1:
-            collection_id = collections[0]["collection_id"]
-        else:
-            # need to redirect to a disambiguation page
-            flask.abort(404)
+    def lookup_keywords(self):
+        try:
+            result = lookup_keywords(current_app.kwdb, flask.request.get_json(force=True, silent=True))
+        except ValueError as e:
+            return flask.jsonify(error=str(e)), 400
+        return flask.jsonify(keywords=result)
 
+    def get_library_keyword(self, collection_id, keyword):
         try:
-            keyword = kwdb.get_keyword(collection_id, keyword)
+            keyword = library_keyword(current_app.kwdb, collection_id, keyword, flask.url_for)
 
         except Exception as e:
             current_app.logger.warning(e)
             flask.abort(404)
 
         if keyword:
-            lib_url = flask.url_for(".get_library", collection_id=keyword["collection_id"])
-            keyword["library_url"] = lib_url
             return flask.jsonify(keyword)
         else:
             flask.abort(404)
 
 
+    def get_keyword_usages(self, collection_id, keyword):
+        kwdb = current_app.kwdb
+        collection = kwdb.get_collection(_find_collection_id(kwdb, collection_id))
+        keyword = kwdb.get_keyword(collection["collection_id"], keyword)
+        if not keyword:
+            flask.abort(404)
+
+        try:
+            offset = max(0, int(flask.request.args.get("offset", 0)))
+            limit = min(MAX_USAGES_PAGE_SIZE, max(1, int(flask.request.args.get("limit", USAGES_PAGE_SIZE))))
+        except ValueError:
+            return flask.jsonify(error="offset and limit must be integers"), 400
+        (total, calls) = kwdb.get_usages(collection["name"], keyword["name"], offset, limit)
+
+        next_url = None
+        if offset + len(calls) < total:
+            next_url = flask.url_for(".get_keyword_usages", collection_id=collection["collection_id"],
+                                     keyword=keyword["name"], offset=offset + len(calls), limit=limit)
+        return flask.jsonify(collection_id=collection["collection_id"], library=collection["name"],
+                             name=keyword["name"], total=total, offset=offset, limit=limit,
+                             next=next_url,
+                             usages=[{"path": path, "owner": owner, "line": lineno, "call": name}
+                                     for (path, owner, lineno, name) in calls])
+
+
+def _find_collection_id(kwdb, collection_id):
+    '''Return the id of a collection given by id or name, or abort with a 404'''
+    collection_id = find_collection_id(kwdb, collection_id)
+    if collection_id is None:
+        # need to redirect to a disambiguation page
+        flask.abort(404)
+    return collection_id
+
+
+def find_collection_id(kwdb, collection_id):
+    '''Return the id of a collection given by id or name, or None'''
+    # collection_id may also be the name of a collection
+    # (api_keyword_url gives the id). Names are never looked up
+    # as ids: some databases refuse to compare them to integers
+    if str(collection_id).isdigit() and kwdb.get_collection(collection_id) is not None:
+        return collection_id
+    collections = kwdb.get_collections(pattern=str(collection_id).strip().lower())
+    if len(collections) == 1:
+        return collections[0]["collection_id"]
+    return None
+
+
+def library_keyword(kwdb, collection_id, name, url_for):
+    '''Return the data of one keyword, or None if there is no such keyword
+
+    collection_id may also be the name of a collection. Like
+    keyword_chunks, this is shared by the flask view and the
+    tornado handler.
+    '''
+    collection_id = find_collection_id(kwdb, collection_id)
+    if collection_id is None:
+        return None
+    keyword = kwdb.get_keyword(collection_id, name)
+    if not keyword:
+        return None
+    keyword["library_url"] = url_for("api.get_library", collection_id=keyword["collection_id"])
+    return keyword
+
+
+def keyword_list(kwdb, collection_id, pattern, req_fields, url_for):
+    '''Return the data for a list of keywords
+
+    This reads the whole list at once; see keyword_chunks.
+    '''
+    return [keyword for chunk in keyword_chunks(kwdb, collection_id, pattern, req_fields, url_for)
+            for keyword in chunk]
+
+
+def keyword_chunks(kwdb, collection_id, pattern, req_fields, url_for, chunk_size=CHUNK_SIZE):
+    '''Yield the data for a list of keywords, in lists of at most chunk_size
+
+    This is shared by the flask view and the tornado handler (see
+    rfhub.handlers); url_for is whatever builds urls in the caller.
+
+    Only the columns needed for the requested fields are read from
+    the database, and the work to be done for each field is decided
+    once, up front, rather than for every keyword. The rows are read
+    a chunk at a time, so that a list of every keyword never has to
+    be in memory all at once (see rfhub.streaming).
+    '''
+    req_fields = req_fields.strip().lower()
+    if (req_fields == "*"):
+        fields = ALL_FIELDS
+    else:
+        fields = [x.strip() for x in req_fields.split(",")]
+    fields = [field for field in fields if field in FIELD_COLUMNS]
+
+    columns = sorted(set(column for field in fields for column in FIELD_COLUMNS[field]))
+    if not columns:
+        return
+
+    column = dict((name, operator.itemgetter(index)) for (index, name) in enumerate(columns))
+    getters = []
+    # the html of the docs in the current chunk
+    htmldocs = {}
+    for field in fields:
+        if field in ("collection_id", "library", "name", "synopsis", "doc", "args"):
+            getters.append((field, column[field]))
+        elif field == "usage_count":
+            counts = kwdb.get_usage_counts()
+            getters.append((field, lambda row, library=column["library"], name=column["name"]:
+                            sum(counts.get(usage_name, 0)
+                                for usage_name in usage_names(library(row), name(row)))))
+        elif field == "htmldoc":
+            getters.append((field, lambda row, doc=column["doc"]: htmldocs[doc(row)]))
+        else:
+            (endpoint, url_values) = URL_FIELDS[field]
+            template = UrlTemplate(url_for, endpoint, *[name for (name, source) in url_values])
+            values = [column[source] for (name, source) in url_values]
+            getters.append((field, lambda row, template=template, values=values:
+                            template(*[value(row) for value in values])))
+
+    for rows in kwdb.iter_keyword_fields(columns, pattern.strip().lower(), collection_id or None, chunk_size):
+        if "htmldoc" in fields:
+            docs = [column["doc"](row) for row in rows]
+            htmldocs.clear()
+            htmldocs.update(zip(docs, kwdb.docs_to_html(docs)))
+        yield [dict((field, getter(row)) for (field, getter) in getters) for row in rows]
+
+
+class UrlTemplate(object):
+    '''A url built once with url_for, with placeholders for some of its values
+
+    Building urls with url_for for every keyword of a large list
+    is slow; filling in a template is not. The values are quoted
+    by the url map's own converter, the way url_for would quote
+    them. url_for may carry the map it builds urls with in its
+    url_map attribute (see rfhub.handlers); flask.url_for uses the
+    current app's.
+    '''
+
+    def __init__(self, url_for, endpoint, *names):
+        placeholders = ["__rfhub_%s__" % name for name in names]
+        url = url_for(endpoint, **dict(zip(names, placeholders)))
+        parts = re.split("(%s)" % "|".join(placeholders), url)
+        self.positions = [names.index(name) for name in
+                          (part[len("__rfhub_"):-2] for part in parts[1::2])]
+        literals = [part.replace("%", "%%") for part in parts[0::2]]
+        self.format = "%s".join(literals)
+        url_map = getattr(url_for, "url_map", None) or flask.current_app.url_map
+        self.quote = _quoter(url_map.converters["default"](url_map))
+
+    def __call__(self, *values):
+        return self.format % tuple(self.quote(str(values[position])) for position in self.positions)
+
+
+# keyword names and collection ids show up in several url fields,
+# and on every request, so remember how they're quoted
+_quoters = {}
+
+
+def _quoter(converter):
+    '''Return a function quoting url values with converter, remembering the results'''
+    if type(converter) not in _quoters:
+        _quoters[type(converter)] = functools.lru_cache(maxsize=100000)(converter.to_url)
+    return _quoters[type(converter)]
+
+
+def completions(kwdb, prefix, limit=20):
+    '''Return keywords whose name starts with prefix, for editors
+
+    Matches are sorted by name, and at most 'limit' are returned;
+    both are left to the database, since this is asked for on every
+    keystroke. The prefix is matched literally, wildcards and all.
+    '''
+    try:
+        limit = max(0, int(limit))
+    except ValueError:
+        limit = 20
+    columns = ("collection_id", "library", "name", "synopsis", "args")
+    keywords = kwdb.get_keyword_fields(columns, "^" + glob_escape(prefix.strip().lower()) + "*",
+                                       limit=limit, by_name=True)
+    return [dict(zip(columns, keyword)) for keyword in keywords]
+
+
+def lookup_keywords(kwdb, body):
+    '''Look up many keywords at once, the way robot would resolve them
+
+    body is the decoded json of the request: either a list, or an
+    object with the list in "keywords". Each item is a keyword name
+    (which may be qualified with a library name, as in "BuiltIn.Log"),
+    or an object with a "name" and an optional "library".
+
+    Returns a list with, for each item in order, the library and name
+    that were asked for and all matching keywords. Names are matched
+    the way robot matches them: case, spaces and underscores don't
+    matter, and "a.b.c" is first looked for as a keyword named "a.b.c",
+    then as keyword "b.c" in library "a", then as "c" in "a.b".
+    All names are looked up in a single query.
+
+    Raises ValueError if body isn't in the expected format.
+    '''
+    items = body.get("keywords") if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        raise ValueError("expected a list of keywords")
+    if len(items) > MAX_LOOKUPS:
+        raise ValueError("too many keywords; at most %d can be looked up at once" % MAX_LOOKUPS)
+
+    lookups = []
+    for item in items:
+        if isinstance(item, str):
+            (library, name) = (None, item)
+        elif isinstance(item, dict) and isinstance(item.get("name"), str):
+            (library, name) = (item.get("library"), item["name"])
+        else:
+            raise ValueError("expected a keyword name or an object with a name: %r" % (item,))
+        if library:
+            candidates = [(library, name)]
+        else:
+            tokens = name.split(".")
+            candidates = [(None, name)] + [(".".join(tokens[:i]), ".".join(tokens[i:]))
+                                           for i in range(1, len(tokens))]
+        lookups.append((library, name, candidates))
+
+    by_name = {}
+    names = set(keyword_name for (library, name, candidates) in lookups
+                for (library_name, keyword_name) in candidates)
+    for keyword in kwdb.find_keywords(names):
+        by_name.setdefault(normalize_name(keyword[2]), []).append(keyword)
+
+    result = []
+    for (library, name, candidates) in lookups:
+        matches = []
+        for (library_name, keyword_name) in candidates:
+            matches = [keyword for keyword in by_name.get(normalize_name(keyword_name), [])
+                       if library_name is None or normalize(library_name) == normalize(keyword[1])]
+            if matches:
+                break
+        result.append({
+            "library": library,
+            "name": name,
+            "matches": [{"collection_id": collection_id, "library": collection_name,
+                         "name": keyword_name, "synopsis": synopsis(doc), "args": args}
+                        for (collection_id, collection_name, keyword_name, doc, args)
+                        in sorted(matches, key=lambda keyword: (keyword[1].lower(), keyword[0]))]
+        })
+    return result
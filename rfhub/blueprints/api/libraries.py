@@ -12,11 +12,7 @@ class ApiEndpoint(object):
         blueprint.add_url_rule("/libraries/<int:collection_id>", view_func = self.get_library)
 
     def get_libraries(self):
-        kwdb = current_app.kwdb
-
-        query_pattern = flask.request.args.get('pattern', "*").strip().lower()
-        libraries = kwdb.get_collections(query_pattern)
-
+        libraries = library_list(current_app.kwdb, flask.request.args.get('pattern', "*"))
         return flask.jsonify(libraries=libraries)
 
     def get_library(self, collection_id):
@@ -27,3 +23,8 @@ class ApiEndpoint(object):
         if collection is None:
             flask.abort(404)
         return flask.jsonify(collection=collection)
+
+
+def library_list(kwdb, pattern):
+    '''Return the libraries matching pattern (shared with rfhub.handlers)'''
+    return kwdb.get_collections(pattern.strip().lower())
@@ -0,0 +1,83 @@
+'''
+This provides a compact index of every keyword, for searching
+without asking the hub
+
+    /api/search-index.json
+
+The index is a json object:
+
+    {"epoch": <epoch>, "version": <data version>,
+     "libraries": [[collection_id, name], ...],
+     "keywords": [[library, name, synopsis, normalized name], ...]}
+
+where library is a position in "libraries", and the normalized name
+is the name the way robot matches it (see normalize_name). Keywords
+are grouped by library, and sorted by name within each.
+
+The index only changes when the data version does, so it is encoded
+(and gzipped) once per version, and sent with an ETag: clients that
+already have it get a 304.
+'''
+
+import gzip
+import json
+import threading
+
+import flask
+from flask import current_app
+
+from rfhub.storage.base import normalize_name
+
+
+class ApiEndpoint(object):
+    def __init__(self, blueprint):
+        blueprint.add_url_rule("/search-index.json", view_func = self.get_search_index)
+        # epoch: (version, json, gzipped json)
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def get_search_index(self):
+        (etag, body, gzipped) = self._encode(current_app.kwdb)
+        response = flask.Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        # the index may be cached, as long as it is checked every time
+        response.headers["Cache-Control"] = "no-cache"
+        response.vary.add("Accept-Encoding")
+        response = response.make_conditional(flask.request)
+        if response.status_code == 200 and "gzip" in flask.request.headers.get("Accept-Encoding", ""):
+            response.set_data(gzipped)
+            response.headers["Content-Encoding"] = "gzip"
+        return response
+
+    def _encode(self, kwdb):
+        '''Return the etag, json and gzipped json of the current index'''
+        epoch = kwdb.get_epoch()
+        version = kwdb.get_version()
+        with self._lock:
+            encoded = self._encoded.get(epoch)
+        if encoded is None or encoded[0] != version:
+            index = search_index(kwdb)
+            body = json.dumps(index, separators=(",", ":")).encode("utf-8")
+            encoded = (index["version"], body, gzip.compress(body))
+            with self._lock:
+                self._encoded[epoch] = encoded
+        (version, body, gzipped) = encoded
+        return ("%s:%d" % (epoch, version), body, gzipped)
+
+
+def search_index(kwdb):
+    '''Return the search index of everything in kwdb'''
+    # read the version first, like changes_since does; the index
+    # is never older than the version it claims
+    epoch = kwdb.get_epoch()
+    version = kwdb.get_version()
+    libraries = []
+    positions = {}
+    keywords = []
+    for (collection_id, library, name, synopsis) in kwdb.get_keyword_fields(
+            ("collection_id", "library", "name", "synopsis")):
+        if collection_id not in positions:
+            positions[collection_id] = len(libraries)
+            libraries.append([collection_id, library])
+        keywords.append([positions[collection_id], name, synopsis, normalize_name(name)])
+    return {"epoch": epoch, "version": version, "libraries": libraries, "keywords": keywords}
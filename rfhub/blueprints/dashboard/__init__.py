@@ -1,6 +1,8 @@
 import flask
 from flask import current_app
 
+from rfhub.blueprints.api.duplicates import DEFAULT_LIMIT, duplicate_list
+
 blueprint = flask.Blueprint('dashboard', __name__,
                             template_folder="templates")
 
@@ -10,5 +12,15 @@ def home():
     return flask.render_template("dashboard.html")
 
 
+@blueprint.route("/duplicates")
+def duplicates():
+    try:
+        limit = max(0, int(flask.request.args.get("limit", DEFAULT_LIMIT)))
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    return flask.render_template("duplicates.html", limit=limit,
+                                 duplicates=duplicate_list(current_app.kwdb, limit, flask.url_for))
+
+
 
     
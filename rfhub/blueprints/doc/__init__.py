@@ -2,45 +2,35 @@
 
 import flask
 from flask import current_app
-import json
+from rfhub import metrics
+from rfhub.blueprints.doc.fragments import FragmentCache, fragment_key
 from rfhub.version import __version__
 
 blueprint = flask.Blueprint('doc', __name__,
                             template_folder="templates",
                             static_folder="static")
 
+# rendered keyword tables, library indexes and nav panels
+fragments = FragmentCache()
+
 @blueprint.route("/")
 @blueprint.route("/keywords/")
 def doc():
     """Show a list of libraries, along with the nav panel on the left"""
     kwdb = current_app.kwdb
 
-    libraries = get_collections(kwdb, libtype="library")
-    resource_files = get_collections(kwdb, libtype="resource")
-    hierarchy = get_navpanel_data(kwdb)
-
-    return flask.render_template("home.html",
-                                 data={"libraries": libraries,
-                                       "version": __version__,
+    return render_template("home.html",
+                                 data={"version": __version__,
                                        "libdoc": None,
-                                       "hierarchy": hierarchy,
-                                       "resource_files": resource_files
+                                       "index": get_index(kwdb),
+                                       "navpanel": get_navpanel(kwdb)
                                    })
 
 
 @blueprint.route("/index")
 def index():
     """Show a list of available libraries, and resource files"""
-    kwdb = current_app.kwdb
-
-    libraries = get_collections(kwdb, libtype="library")
-    resource_files = get_collections(kwdb, libtype="resource")
-
-    return flask.render_template("libraryNames.html",
-                                 data={"libraries": libraries,
-                                       "version": __version__,
-                                       "resource_files": resource_files
-                                   })
+    return get_index(current_app.kwdb)
 
 
 @blueprint.route("/search/")
@@ -85,7 +75,7 @@ def search():
                          })
 
     keywords.sort(key=lambda kw: kw["name"])
-    return flask.render_template("search.html",
+    return render_template("search.html",
                                  data={"keywords": keywords,
                                        "version": __version__,
                                        "pattern": pattern
@@ -102,30 +92,53 @@ def search():
 def doc_for_library(collection_id, keyword=""):
     kwdb = current_app.kwdb
 
-    keywords = []
-    for (keyword_id, name, args, doc) in kwdb.get_keyword_data(collection_id):
-        # args is a json list; convert it to actual list, and
-        # then convert that to a string
-        args = ", ".join(json.loads(args))
-        doc = doc_to_html(doc)
-        target = name == keyword
-        keywords.append((name, args, doc, target))
-
     # this is the introduction documentation for the library
     libdoc = kwdb.get_collection(collection_id)
+    if libdoc is None:
+        flask.abort(404)
     libdoc["doc"] = doc_to_html(libdoc["doc"], libdoc["doc_format"])
 
-    # this data is necessary for the nav panel
-    hierarchy = get_navpanel_data(kwdb)
-
-    return flask.render_template("library.html",
-                                 data={"keywords": keywords,
+    return render_template("library.html",
+                                 data={"keywords": get_keyword_table(kwdb, collection_id),
+                                       "keyword": keyword,
                                        "version": __version__,
                                        "libdoc": libdoc,
-                                       "hierarchy": hierarchy,
+                                       "navpanel": get_navpanel(kwdb),
                                        "collection_id": collection_id
                                    })
 
+def get_keyword_table(kwdb, collection_id):
+    """Return the rows of the keyword table of a collection, as HTML"""
+    def render():
+        keywords = []
+        keyword_data = kwdb.get_keyword_data(collection_id)
+        htmldocs = kwdb.docs_to_html([doc for (keyword_id, name, args, doc) in keyword_data])
+        for ((keyword_id, name, args, doc), htmldoc) in zip(keyword_data, htmldocs):
+            # args is a list; convert it to a string
+            args = ", ".join(args)
+            keywords.append((name, args, htmldoc))
+        return render_template("keywordTable.html", keywords=keywords)
+    return fragments.get(fragment_key(kwdb, "keywords", collection_id), render)
+
+def get_index(kwdb):
+    """Return the list of libraries and resource files, as HTML"""
+    def render():
+        return render_template("libraryNames.html",
+                               data={"libraries": get_collections(kwdb, libtype="library"),
+                                     "resource_files": get_collections(kwdb, libtype="resource")
+                                 })
+    return fragments.get(fragment_key(kwdb, "index"), render)
+
+def get_navpanel(kwdb):
+    """Return the nav panel, as HTML
+
+    Every page shares one copy; the collection being viewed is
+    expanded in the browser (see doc.js).
+    """
+    def render():
+        return render_template("navpanel.html", hierarchy=get_navpanel_data(kwdb))
+    return fragments.get(fragment_key(kwdb, "navpanel"), render)
+
 def get_collections(kwdb, libtype="*"):
     """Get list of collections from kwdb, then add urls necessary for hyperlinks"""
     collections = kwdb.get_collections(libtype=libtype)
@@ -149,6 +162,12 @@ def get_navpanel_data(kwdb):
     return data
 
 
+def render_template(template_name, **context):
+    """Render a template, recording how long it took"""
+    with metrics.timer("rfhub_render_seconds", template=template_name):
+        return flask.render_template(template_name, **context)
+
+
 def doc_to_html(doc, doc_format="ROBOT"):
     """Convert documentation to HTML"""
     from robot.libdocpkg.htmlwriter import DocToHtml
@@ -0,0 +1,57 @@
+"""Caching of rendered HTML fragments for the doc pages
+
+The keyword table of a library, the library/resource index and the
+nav panel only change when keyword data changes, so they are rendered
+once and reused until it does. Fragments are keyed by the data
+version (see KeywordTable.get_version), so a reload simply makes the
+old fragments unreachable; they fall out of the cache as new ones are
+added.
+"""
+
+import collections
+import threading
+
+import flask
+from markupsafe import Markup
+
+
+class FragmentCache(object):
+    """A least-recently-used cache of rendered HTML
+
+    At most maxsize fragments are kept.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._fragments = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, render):
+        """Return the fragment for key, calling render() if it isn't cached"""
+        with self._lock:
+            if key in self._fragments:
+                self._fragments.move_to_end(key)
+                return self._fragments[key]
+        html = Markup(render())
+        with self._lock:
+            self._fragments[key] = html
+            while len(self._fragments) > self.maxsize:
+                self._fragments.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def __len__(self):
+        return len(self._fragments)
+
+
+def fragment_key(kwdb, name, collection_id=None):
+    """Return the cache key for a fragment of the current keyword data
+
+    Urls in fragments depend on where the hub is mounted, so that is
+    part of the key too.
+    """
+    return (name, str(collection_id), flask.request.script_root,
+            kwdb.get_epoch(), kwdb.get_version())
@@ -14,8 +14,59 @@ $(document).ready(function () {
     return str.indexOf(suffix, str.length - suffix.length) !== -1;
   }
 
+  // with --client-search, searches run in a web worker (search.js)
+  // against a downloaded index, rather than on the hub
+  var searchWorker = null;
+  var lastSearch = 0;
+  var searchField = $('#search-pattern');
+  if (window.Worker && searchField.data('url_search_index')) {
+    searchWorker = new Worker(searchField.data('url_search_worker'));
+    searchWorker.onmessage = function (e) {
+      if (e.data.error !== undefined) {
+        // fall back to searching on the hub
+        searchWorker.terminate();
+        searchWorker = null;
+        if (e.data.id === lastSearch) {
+          renderKeywords(e.data.pattern);
+        }
+      } else if (e.data.id === lastSearch) {
+        $('#right').html(renderSearchResults(e.data.pattern, e.data.keywords));
+      }
+    };
+    searchWorker.postMessage({ index: searchField.data('url_search_index') });
+  }
+
+  // the same html as the search.html template
+  function renderSearchResults(pattern, keywords) {
+    var url = searchField.data('url_keyword');
+    var rows = $('<tbody>');
+    _.each(keywords, function (keyword) {
+      var synopsis = keyword.synopsis === '' ?
+          $('<small><i>no documentation available</i></small>') : document.createTextNode(keyword.synopsis);
+      $('<tr>')
+        .attr('id', 'row-' + keyword.library.toLowerCase() + '.' + keyword.name.toLowerCase().replace(/ /g, '-'))
+        .append($('<td>').text(keyword.library))
+        .append($('<td>').append($('<a>').text(keyword.name).attr('href', url
+            .replace('__collection_id__', keyword.collection_id)
+            .replace('__keyword__', encodeURIComponent(keyword.name)))))
+        .append($('<td valign="top">').append(synopsis))
+        .appendTo(rows);
+    });
+    return $('<div>')
+      .append($('<h1>').text('Search results'))
+      .append($("<p id='result-count'>")
+              .text("Searching for '" + pattern + "' found " + keywords.length + ' keywords'))
+      .append($("<table id='keyword-table' class='table-striped table-hover' border=0 width=100%>")
+              .append('<thead><tr><th>Library/Resource</th><th>Keyword Name</th><th>Synopsis</th></tr></thead>')
+              .append(rows));
+  }
+
   function renderKeywords(pattern, element) {
-    if (! _.isEmpty(pattern)) {
+    element = element || searchField;
+    lastSearch += 1;
+    if (! _.isEmpty(pattern) && searchWorker !== null) {
+      searchWorker.postMessage({ id: lastSearch, pattern: pattern });
+    } else if (! _.isEmpty(pattern)) {
         $.get(element.data('url_search'), { pattern: pattern })
         .done(function (responseData) {
           $('#right').html(responseData);
@@ -57,6 +108,17 @@ $(document).ready(function () {
     renderKeywords(params.pattern);
     setSearchFieldValue(params.pattern);
   }
+  // the nav panel is cached too, so the current collection is expanded here
+  var collectionId = $('#right').attr('data-collection-id');
+  if (collectionId) {
+    $('#left li[data-collection-id="' + collectionId + '"] > ul.tree').removeClass('collapse');
+  }
+  // the keyword table is cached, so the selected keyword is marked here
+  // (or, in a static export, by the url's fragment)
+  var selected = $('table[data-selected]').data('selected') || location.hash.substring(1);
+  if (selected) {
+    $(document.getElementById(selected)).addClass('selected');
+  }
   if ($('.selected').length > 0) {
     $("#right").scrollTo(".selected");
   }
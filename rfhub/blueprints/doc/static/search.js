@@ -0,0 +1,129 @@
+// A web worker that searches the keyword index (/api/search-index.json)
+// for doc.js, so that searching needs no requests to the hub.
+//
+// doc.js first sends {index: <url>}, and then {id: <n>, pattern: <pattern>}
+// for every search. Each search is answered with the pattern (without any
+// in:<library> filters), and either the matching keywords or an error.
+
+var index = null;
+var error = null;
+var pending = [];
+
+function load(url) {
+  var request = new XMLHttpRequest();
+  request.open('GET', url);
+  request.onload = function () {
+    if (request.status === 200) {
+      try {
+        index = JSON.parse(request.responseText);
+      } catch (e) {
+        error = 'invalid search index';
+      }
+    } else {
+      error = 'search index returned status ' + request.status;
+    }
+    answer();
+  };
+  request.onerror = function () {
+    error = 'unable to load the search index';
+    answer();
+  };
+  request.send();
+}
+
+function answer() {
+  while (pending.length > 0) {
+    var message = pending.shift();
+    if (error !== null) {
+      self.postMessage({id: message.id, pattern: message.pattern, error: error});
+    } else {
+      var result = search(message.pattern);
+      self.postMessage({id: message.id, pattern: result.pattern, keywords: result.keywords});
+    }
+  }
+}
+
+// the same rules as glob_to_regex in rfhub/storage/base.py
+function globToRegex(string) {
+  var anchorStart = string.charAt(0) === '^';
+  var anchorEnd = string.slice(-1) === '$' && string.slice(-2) !== '\\$';
+  if (anchorStart) {
+    string = string.substring(1);
+  }
+  if (anchorEnd) {
+    string = string.substring(0, string.length - 1);
+  }
+  var parts = (string.match(/\\[\s\S]|[\s\S]/g) || []).map(function (token) {
+    if (token === '*') {
+      return '[\\s\\S]*';
+    } else if (token === '?') {
+      return '[\\s\\S]';
+    } else {
+      return token.charAt(token.length - 1).replace(/[.*+?^${}()|[\]\\\/]/g, '\\$&');
+    }
+  });
+  var regex = parts.join('');
+  regex = anchorStart ? '^' + regex : regex;
+  regex = anchorEnd ? regex + '$' : regex;
+  return new RegExp(regex, 'i');
+}
+
+// the same rules as the /doc/search/ page
+function search(pattern) {
+  pattern = pattern.trim().toLowerCase();
+  var mode = 'both';
+  if (pattern.indexOf('name:') === 0) {
+    pattern = pattern.substring(5).trim();
+    mode = 'name';
+  }
+
+  // in:<collection> limits the results to collections starting with <collection>
+  var filters = {};
+  var filtered = false;
+  var words = [];
+  pattern.split(' ').forEach(function (word) {
+    if (word.indexOf('in:') === 0) {
+      index.libraries.forEach(function (library) {
+        var name = library[1].toLowerCase();
+        if (name.indexOf(word.substring(3)) === 0) {
+          filters[name] = true;
+          filtered = true;
+        }
+      });
+    } else {
+      words.push(word);
+    }
+  });
+  pattern = words.join(' ');
+
+  var regex = globToRegex(pattern);
+  // also match the way robot does, ignoring spaces and underscores
+  var normalized = globToRegex(pattern.replace(/[ _]/g, ''));
+  var keywords = [];
+  index.keywords.forEach(function (keyword) {
+    var library = index.libraries[keyword[0]];
+    if (filtered && !filters[library[1].toLowerCase()]) {
+      return;
+    }
+    if (regex.test(keyword[1]) || normalized.test(keyword[3]) ||
+        (mode !== 'name' && regex.test(keyword[2]))) {
+      keywords.push({collection_id: library[0], library: library[1],
+                     name: keyword[1], synopsis: keyword[2]});
+    }
+  });
+  keywords.sort(function (a, b) {
+    return a.name < b.name ? -1 : (a.name > b.name ? 1 : 0);
+  });
+  return {pattern: pattern, keywords: keywords};
+}
+
+self.onmessage = function (e) {
+  if (e.data.index) {
+    load(e.data.index);
+  } else {
+    pending.push(e.data);
+    if (index !== null || error !== null) {
+      answer();
+    }
+  }
+};
@@ -0,0 +1,176 @@
+"""catalogs - several named views of one KeywordTable
+
+A hub can serve a catalog per team, each under its own url prefix
+(eg: /t/payments/doc, /t/payments/api), from a single process:
+
+    rfhub --catalog payments=/src/payments/tests --catalog search=/src/search/tests
+
+Everything is loaded into one KeywordTable, so libraries every team
+uses (BuiltIn, SeleniumLibrary, ...) are loaded and stored only once.
+A Catalog shows the collections loaded from its own roots, and
+everything that wasn't loaded from the roots of some other catalog.
+"""
+
+import os
+import re
+import threading
+
+from rfhub.duplicates import DuplicateIndex
+
+# catalog names become part of urls
+NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+class Catalog(object):
+    """A KeywordTable that only shows some of another's collections
+
+    Catalogs answer the same queries as a KeywordTable; loading
+    data is left to the KeywordTable itself.
+    """
+
+    def __init__(self, kwdb, name, roots, all_roots):
+        self.kwdb = kwdb
+        self.name = name
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.all_roots = [os.path.abspath(root) for root in all_roots]
+        # (data version, ids of the collections this catalog shows)
+        self._visible = (None, frozenset())
+        self._lock = threading.Lock()
+        self.duplicates = DuplicateIndex(self)
+
+    def shows(self, path):
+        """Return True if the collection loaded from path is in this catalog"""
+        if path is None:
+            return True
+        return _is_under(path, self.roots) or not _is_under(path, self.all_roots)
+
+    def get_collection(self, collection_id):
+        collection = self.kwdb.get_collection(collection_id)
+        if collection is not None and self.shows(collection["path"]):
+            return collection
+        return None
+
+    def get_collections(self, pattern="*", libtype="*"):
+        return [c for c in self.kwdb.get_collections(pattern, libtype) if self.shows(c["path"])]
+
+    def get_keyword_data(self, collection_id):
+        if not self._is_visible(collection_id):
+            return []
+        return self.kwdb.get_keyword_data(collection_id)
+
+    def get_keyword(self, collection_id, name):
+        if not self._is_visible(collection_id):
+            return {}
+        return self.kwdb.get_keyword(collection_id, name)
+
+    def find_keywords(self, names):
+        visible = self._visible_ids()
+        return [row for row in self.kwdb.find_keywords(names) if row[0] in visible]
+
+    def get_keyword_hierarchy(self, pattern="*"):
+        visible = self._visible_ids()
+        return [c for c in self.kwdb.get_keyword_hierarchy(pattern) if c["collection_id"] in visible]
+
+    def search(self, pattern="*", mode="both"):
+        visible = self._visible_ids()
+        return [row for row in self.kwdb.search(pattern, mode) if row[0] in visible]
+
+    def get_keywords(self, pattern="*"):
+        visible = self._visible_ids()
+        return [row for row in self.kwdb.get_keywords(pattern) if row[0] in visible]
+
+    def get_keyword_fields(self, columns, pattern="*", collection_id=None, limit=None, by_name=False):
+        if collection_id is not None:
+            if not self._is_visible(collection_id):
+                return []
+            return self.kwdb.get_keyword_fields(columns, pattern, collection_id, limit, by_name)
+        # the limit applies to the visible rows, so it can't be
+        # left to the KeywordTable
+        visible = self._visible_ids()
+        columns = tuple(columns)
+        if "collection_id" in columns:
+            index = columns.index("collection_id")
+            rows = self.kwdb.get_keyword_fields(columns, pattern, by_name=by_name)
+            return [row for row in rows if row[index] in visible][:limit]
+        rows = self.kwdb.get_keyword_fields(("collection_id",) + columns, pattern, by_name=by_name)
+        return [row[1:] for row in rows if row[0] in visible][:limit]
+
+    def iter_keyword_fields(self, columns, pattern="*", collection_id=None, chunk_size=1000):
+        if collection_id is not None and not self._is_visible(collection_id):
+            return
+        columns = tuple(columns)
+        if "collection_id" in columns:
+            (index, start) = (columns.index("collection_id"), 0)
+        else:
+            (index, start, columns) = (0, 1, ("collection_id",) + columns)
+        for rows in self.kwdb.iter_keyword_fields(columns, pattern, collection_id, chunk_size):
+            visible = self._visible_ids()
+            rows = [row[start:] for row in rows if row[index] in visible]
+            if rows:
+                yield rows
+
+    def get_usages(self, library, name, offset=0, limit=None):
+        return self.kwdb.get_usages(library, name, offset, limit)
+
+    def get_calls(self, path):
+        return self.kwdb.get_calls(path)
+
+    def get_usage_counts(self):
+        return self.kwdb.get_usage_counts()
+
+    def docs_to_html(self, docs):
+        return self.kwdb.docs_to_html(docs)
+
+    def get_version(self):
+        return self.kwdb.get_version()
+
+    def get_epoch(self):
+        # versions are shared, but what they cover is not
+        return "%s-%s" % (self.kwdb.get_epoch(), self.name)
+
+    def get_changes(self, since=0):
+        # collections that are gone can't be checked, so their
+        # removal is passed on to every catalog
+        visible = self._visible_ids()
+        return [change for change in self.kwdb.get_changes(since)
+                if change[1] in visible or (change[3] is None and change[4] == "removed")]
+
+    def _is_visible(self, collection_id):
+        try:
+            return int(collection_id) in self._visible_ids()
+        except (TypeError, ValueError):
+            return False
+
+    def _visible_ids(self):
+        """Return the ids of the collections shown, computed only after changes"""
+        version = self.kwdb.get_version()
+        with self._lock:
+            (visible_version, visible) = self._visible
+        if visible_version != version:
+            visible = frozenset(c["collection_id"] for c in self.kwdb.get_collections()
+                                if self.shows(c["path"]))
+            with self._lock:
+                self._visible = (version, visible)
+        return visible
+
+
+def parse_catalogs(specs):
+    """Parse NAME=PATH strings, returning an ordered list of (name, [paths])
+
+    Raises ValueError if a spec is malformed.
+    """
+    catalogs = {}
+    for spec in specs:
+        (name, sep, path) = spec.partition("=")
+        if not sep or not path or not NAME_PATTERN.match(name):
+            raise ValueError("expected NAME=PATH, where NAME has only letters, digits, '.', '-' and '_': %s"
+                             % spec)
+        catalogs.setdefault(name, []).append(path)
+    return list(catalogs.items())
+
+
+def _is_under(path, roots):
+    for root in roots:
+        if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+            return True
+    return False
@@ -0,0 +1,195 @@
+"""duplicates - find copy-pasted keywords
+
+Three kinds of duplicates are reported:
+
+    names      keywords with the same name (the way robot matches
+               names) in more than one collection
+    exact      keywords with identical docs, arguments and bodies
+    similar    keywords whose docs and bodies are nearly the same
+
+Near-duplicates are found with MinHash signatures and locality
+sensitive hashing, rather than by comparing every pair of keywords:
+each keyword's doc (word 3-grams) and body (pairs of consecutive
+calls) is reduced to a short signature, and only keywords whose
+signatures agree on a whole band are compared. Bodies come from the
+keyword usage index (see rfhub.usages), so they are only known for
+resource files loaded with --index-usages.
+
+Signatures are kept per collection, and only the collections the
+change log says have changed are looked at again.
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+
+from rfhub.storage.base import normalize_name
+from rfhub.usages import call_name, is_usage_file
+
+# signature length, and how it is split into bands for hashing
+PERMUTATIONS = 32
+BANDS = 8
+ROWS = PERMUTATIONS // BANDS
+
+# keywords are similar if this fraction of their signatures agree
+# (an estimate of the Jaccard similarity of their features)
+THRESHOLD = 0.8
+
+# keywords with fewer features than this are too short to compare
+MIN_FEATURES = 4
+
+_MASK = (1 << 64) - 1
+# the hash functions are hash(feature) xor'ed with these; they only
+# need to stay the same within a process
+_PERMUTATION_MASKS = [random.Random(seed).getrandbits(64) for seed in range(PERMUTATIONS)]
+
+
+class DuplicateIndex(object):
+    """Finds duplicate keywords in a KeywordTable (or a Catalog)"""
+
+    def __init__(self, kwdb):
+        self.kwdb = kwdb
+        self._lock = threading.Lock()
+        self._epoch = None
+        self._version = None
+        # collection_id: [(collection_id, library, name, normalized name,
+        #                  exact key or None, signature or None)]
+        self._entries = {}
+        self._result = None
+
+    def find(self):
+        """Return the duplicate groups of each kind
+
+        The result is a dictionary with "names", "exact" and
+        "similar" lists of groups, largest first. Every group has
+        the "keywords" in it, as (collection_id, library, name)
+        tuples; similar groups also have their "similarity".
+        """
+        with self._lock:
+            if self._refresh() or self._result is None:
+                self._result = self._group()
+            return self._result
+
+    def _refresh(self):
+        """Bring the signatures up to date, returning True if anything changed"""
+        epoch = self.kwdb.get_epoch()
+        # read the version first, like changes_since does
+        version = self.kwdb.get_version()
+        if epoch != self._epoch:
+            changed = None
+        elif version == self._version:
+            return False
+        else:
+            changed = set(change[1] for change in self.kwdb.get_changes(self._version))
+
+        if changed is None:
+            self._entries = {}
+            collection_ids = [c["collection_id"] for c in self.kwdb.get_collections()]
+        else:
+            collection_ids = changed
+        for collection_id in collection_ids:
+            collection = self.kwdb.get_collection(collection_id)
+            if collection is None:
+                self._entries.pop(collection_id, None)
+            else:
+                self._entries[collection_id] = self._collection_entries(collection)
+        (self._epoch, self._version) = (epoch, version)
+        return True
+
+    def _collection_entries(self, collection):
+        collection_id = collection["collection_id"]
+        bodies = {}
+        path = collection["path"]
+        if path is not None and is_usage_file(path):
+            for (owner, lineno, name) in self.kwdb.get_calls(path):
+                bodies.setdefault(owner, []).append(call_name(name))
+
+        entries = []
+        for (keyword_id, name, args, doc) in self.kwdb.get_keyword_data(collection_id):
+            words = re.findall(r"\w+", doc.lower())
+            body = bodies.get(name, [])
+            exact = None
+            if words or body:
+                exact = hashlib.sha1(json.dumps([words, args, body]).encode("utf-8")).digest()
+            features = set(zip(words, words[1:], words[2:])) if len(words) >= 3 else set(words)
+            features.update(("call",) + pair for pair in zip([""] + body, body))
+            entries.append((collection_id, collection["name"], name, normalize_name(name),
+                            exact, signature(features)))
+        return entries
+
+    def _group(self):
+        entries = [entry for collection_entries in self._entries.values() for entry in collection_entries]
+
+        by_name = {}
+        by_exact = {}
+        by_signature = {}
+        for entry in entries:
+            by_name.setdefault(entry[3], []).append(entry)
+            if entry[4] is not None:
+                by_exact.setdefault(entry[4], []).append(entry)
+            if entry[5] is not None:
+                by_signature.setdefault(entry[5], []).append(entry)
+
+        names = [group for group in by_name.values()
+                 if len(set(entry[0] for entry in group)) > 1]
+        exact = [group for group in by_exact.values() if len(group) > 1]
+
+        # union-find over distinct signatures, comparing each one to
+        # the first in every band bucket it shares with others
+        signatures = list(by_signature)
+        parent = list(range(len(signatures)))
+
+        def root(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for band in range(BANDS):
+            buckets = {}
+            for (i, sig) in enumerate(signatures):
+                buckets.setdefault(sig[band * ROWS:(band + 1) * ROWS], []).append(i)
+            for bucket in buckets.values():
+                first = bucket[0]
+                for i in bucket[1:]:
+                    if similarity(signatures[first], signatures[i]) >= THRESHOLD:
+                        parent[root(i)] = root(first)
+
+        clusters = {}
+        for i in range(len(signatures)):
+            clusters.setdefault(root(i), []).append(i)
+        similar = []
+        for (r, members) in clusters.items():
+            group = [entry for i in members for entry in by_signature[signatures[i]]]
+            # groups of exact duplicates are already reported
+            if len(group) > 1 and len(set(entry[4] for entry in group)) > 1:
+                similar.append({"similarity": round(min(similarity(signatures[r], signatures[i])
+                                                        for i in members), 2),
+                                "keywords": _keywords(group)})
+
+        return {"names": [{"name": group[0][2], "keywords": _keywords(group)} for group in _largest(names)],
+                "exact": [{"keywords": _keywords(group)} for group in _largest(exact)],
+                "similar": sorted(similar, key=lambda group: (-len(group["keywords"]), group["keywords"]))}
+
+
+def signature(features):
+    """Return the MinHash signature of a set of features, or None if there are too few"""
+    if len(features) < MIN_FEATURES:
+        return None
+    hashes = [hash(feature) & _MASK for feature in features]
+    return tuple(min(map(mask.__xor__, hashes)) for mask in _PERMUTATION_MASKS)
+
+
+def similarity(first, second):
+    """Return the fraction of two signatures that agree"""
+    return sum(1 for (a, b) in zip(first, second) if a == b) / float(PERMUTATIONS)
+
+
+def _keywords(group):
+    return sorted((entry[0], entry[1], entry[2]) for entry in group)
+
+
+def _largest(groups):
+    return sorted(groups, key=lambda group: (-len(group), _keywords(group)))
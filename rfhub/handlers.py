@@ -0,0 +1,396 @@
+"""Tornado handlers for the busiest JSON endpoints
+
+Everything else the hub serves goes through flask, which tornado can
+only run inside a WSGIContainer: one request at a time, blocking the
+IOLoop while it runs. Editors hit /api/keywords, /api/libraries and
+/api/completions constantly, so those are served natively here. The
+database work (and the json encoding) runs on a thread pool, so the
+IOLoop stays free to accept and answer other requests; the pool runs
+the work of editors before that of bulk exports (see rfhub.scheduler).
+
+The handlers produce the same data as the flask views, by calling the
+same functions in rfhub.blueprints.api.
+
+/api/events is a server-sent events stream of changes to collections,
+so that clients don't have to poll the api to notice them.
+"""
+
+import datetime
+import json
+import math
+import re
+import time
+
+import tornado.ioloop
+import tornado.iostream
+import tornado.locks
+import tornado.util
+import tornado.web
+from tornado.wsgi import WSGIContainer
+
+from rfhub import metrics
+from rfhub import scheduler
+from rfhub.blueprints.api.keywords import completions, keyword_chunks, library_keyword, lookup_keywords
+from rfhub.blueprints.api.libraries import library_list
+from rfhub.streaming import encode_list
+
+
+class ApiHandler(tornado.web.RequestHandler):
+    """Base class for handlers that run their work on the scheduler
+
+    Each handler's work runs with its priority (see rfhub.scheduler),
+    and costs its client some tokens; clients that have run out are
+    answered with a 429 until they have enough again.
+    """
+
+    endpoint = None
+    priority = scheduler.INTERACTIVE
+    cost = 1
+
+    def initialize(self, kwdb, scheduler, url_for, buckets=None):
+        self.kwdb = kwdb
+        self.executor = scheduler.executor(self.priority)
+        self.url_for = url_for
+        self.buckets = buckets
+
+    def prepare(self):
+        if self.buckets is not None:
+            wait = self.buckets.take(self.request.remote_ip, self.cost)
+            if wait:
+                self.refuse("too many requests; try again later", wait)
+
+    def refuse(self, message, retry_after=1):
+        """Answer with a 429, telling the client when to try again"""
+        self.set_status(429)
+        self.set_header("Retry-After", str(int(math.ceil(retry_after))))
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps({"error": message}))
+
+    async def respond(self, func, *args):
+        """Run func on the executor, and send what it returns as json"""
+        body = await tornado.ioloop.IOLoop.current().run_in_executor(
+            self.executor, self._encode, func, args)
+        self.set_header("Content-Type", "application/json")
+        self.finish(body)
+
+    def on_finish(self):
+        metrics.registry.observe("rfhub_request_seconds", self.request.request_time(),
+                                 endpoint=self.endpoint, method=self.request.method)
+
+    @staticmethod
+    def _encode(func, args):
+        return json.dumps(func(*args), sort_keys=True)
+
+
+class StreamLimiter(object):
+    """Limits how many large responses are being sent at once
+
+    Up to 'streams' responses are sent at a time, and up to 'queue'
+    more wait their turn, for at most 'timeout' seconds; requests
+    beyond that are turned away (see KeywordsHandler). Only used
+    from the IOLoop thread, so it needs no locking.
+    """
+
+    def __init__(self, streams=4, queue=32, timeout=30):
+        self.streams = streams
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = tornado.locks.Semaphore(streams)
+
+    async def acquire(self):
+        """Wait for a turn to send a response, returning False if there is none"""
+        if self.active >= self.streams and self.waiting >= self.queue:
+            return False
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire(timeout=datetime.timedelta(seconds=self.timeout))
+        except tornado.util.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+
+class KeywordsHandler(ApiHandler):
+    """/api/keywords/ and /api/keywords/<collection_id>
+
+    A list of every keyword can be very large, so it is read, encoded
+    and sent a chunk at a time, and only as fast as the client reads
+    it. How many lists are sent at once is limited by a StreamLimiter;
+    when too many are waiting, the client is told to retry later
+    with a 429.
+    """
+
+    endpoint = "api.get_library_keywords"
+    priority = scheduler.BULK
+    cost = 10
+
+    def initialize(self, kwdb, scheduler, url_for, buckets=None, limiter=None):
+        super().initialize(kwdb, scheduler, url_for, buckets)
+        self.limiter = limiter
+
+    async def get(self, collection_id):
+        if not collection_id:
+            collection_id = self.get_argument("collection_id", "")
+        chunks = keyword_chunks(self.kwdb, collection_id,
+                                self.get_argument("pattern", "*"),
+                                self.get_argument("fields", "*"),
+                                self.url_for)
+        if not await self.limiter.acquire():
+            self.refuse("too many requests for keyword lists; try again later")
+            return
+        try:
+            await self.stream(encode_list("keywords", chunks))
+        finally:
+            self.limiter.release()
+
+    async def stream(self, pieces):
+        """Send the pieces of a response, encoding each one on the executor"""
+        self.set_header("Content-Type", "application/json")
+        loop = tornado.ioloop.IOLoop.current()
+        try:
+            while True:
+                piece = await loop.run_in_executor(self.executor, next, pieces, None)
+                if piece is None:
+                    break
+                self.write(piece)
+                # waits until the client has taken the piece, so a slow
+                # client can't make us buffer the whole list for it
+                await self.flush()
+        except tornado.iostream.StreamClosedError:
+            # the client went away
+            return
+        finally:
+            pieces.close()
+        self.finish()
+
+
+class KeywordHandler(ApiHandler):
+    """/api/keywords/<collection_id>/<keyword>"""
+
+    endpoint = "api.get_library_keyword"
+
+    async def get(self, collection_id, name):
+        keyword = await tornado.ioloop.IOLoop.current().run_in_executor(
+            self.executor, library_keyword, self.kwdb, collection_id, name, self.url_for)
+        if not keyword:
+            raise tornado.web.HTTPError(404)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(keyword, sort_keys=True))
+
+
+class BatchHandler(ApiHandler):
+    """POST /api/keywords/batch"""
+
+    endpoint = "api.lookup_keywords"
+
+    async def post(self):
+        try:
+            body = json.loads(self.request.body.decode("utf-8"))
+        except ValueError:
+            body = None
+        await self.respond(self._lookup, body)
+
+    async def respond(self, func, *args):
+        try:
+            await super().respond(func, *args)
+        except ValueError as e:
+            self.set_status(400)
+            self.set_header("Content-Type", "application/json")
+            self.finish(json.dumps({"error": str(e)}))
+
+    def _lookup(self, body):
+        return {"keywords": lookup_keywords(self.kwdb, body)}
+
+
+class LibrariesHandler(ApiHandler):
+    """/api/libraries/"""
+
+    endpoint = "api.get_libraries"
+
+    async def get(self):
+        await self.respond(self._libraries, self.get_argument("pattern", "*"))
+
+    def _libraries(self, pattern):
+        return {"libraries": library_list(self.kwdb, pattern)}
+
+
+class CompletionsHandler(ApiHandler):
+    """/api/completions/?prefix=<prefix>&limit=<n>"""
+
+    endpoint = "api.get_completions"
+
+    async def get(self):
+        await self.respond(self._completions, self.get_argument("prefix", ""),
+                           self.get_argument("limit", "20"))
+
+    def _completions(self, prefix, limit):
+        return {"completions": completions(self.kwdb, prefix, limit)}
+
+
+class ChangeFeed(object):
+    """Publishes the change log of a KeywordTable to EventsHandlers
+
+    The feed polls the change log rather than being told about
+    changes, so it also sees changes made by other processes
+    sharing the database (eg: a --worker loading keywords for
+    hubs running with --web).
+    """
+
+    def __init__(self, kwdb, executor, interval=0.5, keepalive=15):
+        self.kwdb = kwdb
+        self.executor = executor
+        self.keepalive = keepalive
+        self.epoch = kwdb.get_epoch()
+        self.subscribers = set()
+        self._polling = False
+        self._callback = tornado.ioloop.PeriodicCallback(self._poll, interval * 1000)
+
+    def start(self):
+        self._callback.start()
+
+    def stop(self):
+        self._callback.stop()
+
+    async def subscribe(self, handler, last_event_id=None):
+        """Start sending changes to handler
+
+        If last_event_id (from the Last-Event-ID header that browsers
+        send when they reconnect) is from this epoch, the changes
+        the client missed are sent first. If it isn't, the client
+        is sent a "reset" event and should fetch everything again.
+        """
+        version = await tornado.ioloop.IOLoop.current().run_in_executor(
+            self.executor, self.kwdb.get_version)
+        epoch, _, last_version = (last_event_id or "").partition(":")
+        if epoch == self.epoch and last_version.isdigit():
+            handler.version = min(int(last_version), version)
+            handler.send({"event": "connected", "version": handler.version})
+        else:
+            handler.version = version
+            handler.send({"event": "reset" if last_event_id else "connected", "version": version})
+        self.subscribers.add(handler)
+
+    def unsubscribe(self, handler):
+        self.subscribers.discard(handler)
+
+    def _poll(self):
+        if self.subscribers and not self._polling:
+            self._polling = True
+            tornado.ioloop.IOLoop.current().spawn_callback(self._publish)
+
+    async def _publish(self):
+        try:
+            since = min(handler.version for handler in self.subscribers)
+            changes = await tornado.ioloop.IOLoop.current().run_in_executor(
+                self.executor, self.kwdb.get_changes, since)
+            now = time.monotonic()
+            for handler in list(self.subscribers):
+                for (version, collection_id, name, keyword, event) in changes:
+                    if version > handler.version:
+                        handler.version = version
+                        if keyword is None:
+                            handler.send({"event": event, "version": version,
+                                          "collection_id": collection_id, "name": name})
+                if now - handler.last_sent > self.keepalive:
+                    handler.send(None)
+        finally:
+            self._polling = False
+
+
+class EventsHandler(tornado.web.RequestHandler):
+    """/api/events - a server-sent events stream of collection changes
+
+    Each event's data is a json object with the "event" ("added",
+    "updated", "removed", or "connected" and "reset", see
+    ChangeFeed.subscribe), the data "version", and the changed
+    collection's "collection_id" and "name".
+    """
+
+    def initialize(self, feed):
+        self.feed = feed
+        self.version = 0
+        self.last_sent = time.monotonic()
+        self._closed = tornado.locks.Event()
+
+    async def get(self):
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        # keep nginx from buffering the stream
+        self.set_header("X-Accel-Buffering", "no")
+        await self.feed.subscribe(self, self.request.headers.get("Last-Event-ID"))
+        await self._closed.wait()
+
+    def send(self, data):
+        """Send an event, or a keepalive comment if data is None"""
+        if self._closed.is_set():
+            return
+        if data is None:
+            self.write(": keepalive\n\n")
+        else:
+            self.write("id: %s:%d\ndata: %s\n\n" % (self.feed.epoch, data["version"],
+                                                    json.dumps(data, sort_keys=True)))
+        self.last_sent = time.monotonic()
+        # errors mean the client went away; on_connection_close cleans up
+        self.flush().add_done_callback(lambda future: future.exception())
+
+    def on_connection_close(self):
+        self.feed.unsubscribe(self)
+        self._closed.set()
+
+
+def make_application(app, kwdb, threads=8, mounts=(), streams=4, stream_queue=32,
+                     tasks=None, rate_limit=0):
+    """Return a tornado application serving the flask app
+
+    The native handlers take the api endpoints above; every other
+    request is passed on to the flask app. mounts is a list of
+    (prefix, app, kwdb) for other flask apps that app dispatches
+    to (see rfhub.catalogs); their api endpoints are served natively
+    too, under the prefix. streams and stream_queue are for the
+    StreamLimiter shared by all keyword lists.
+
+    The handlers' work runs on tasks, a Scheduler (one with 'threads'
+    threads is made if it isn't given). If rate_limit is given,
+    each client may spend that many tokens a second (see
+    TokenBuckets), in bursts of up to five times as many.
+    """
+    if tasks is None:
+        tasks = scheduler.Scheduler(threads)
+    limiter = StreamLimiter(streams, stream_queue)
+    buckets = scheduler.TokenBuckets(rate_limit) if rate_limit else None
+    routes = []
+    for (prefix, mounted_app, mounted_kwdb) in [("", app, kwdb)] + list(mounts):
+        routes.extend(_api_routes(re.escape(prefix), mounted_app, mounted_kwdb, tasks, prefix,
+                                  limiter, buckets))
+    routes.append((r".*", tornado.web.FallbackHandler, dict(fallback=WSGIContainer(app))))
+    return tornado.web.Application(routes)
+
+
+def _api_routes(pattern, app, kwdb, tasks, script_name, limiter, buckets):
+    """Return the routes of the native handlers for one flask app"""
+    urls = app.url_map.bind("localhost", script_name=script_name or None)
+
+    def url_for(endpoint, **values):
+        return urls.build(endpoint, values)
+    # so that UrlTemplate quotes values the way this map does
+    url_for.url_map = app.url_map
+
+    options = dict(kwdb=kwdb, scheduler=tasks, url_for=url_for, buckets=buckets)
+    feed = ChangeFeed(kwdb, tasks.executor(scheduler.INTERACTIVE))
+    feed.start()
+    return [
+        (pattern + r"/api/events", EventsHandler, dict(feed=feed)),
+        (pattern + r"/api/keywords/batch", BatchHandler, options),
+        (pattern + r"/api/keywords/([^/]*)", KeywordsHandler, dict(options, limiter=limiter)),
+        (pattern + r"/api/keywords/([^/]+)/([^/]+)", KeywordHandler, options),
+        (pattern + r"/api/libraries/", LibrariesHandler, options),
+        (pattern + r"/api/completions/", CompletionsHandler, options),
+    ]
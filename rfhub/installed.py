@@ -0,0 +1,150 @@
+"""installed - find installed keyword libraries, and cache their documentation
+
+Robot's standard libraries (BuiltIn, Collections, String, ...) only
+change when robot itself is upgraded, and third-party libraries only
+change when they are upgraded, yet importing and documenting all of
+them is the slowest part of starting the hub. The documentation of
+every installed library is therefore cached in a json file, with a
+separate file for every robot version and python interpreter, and a
+library is only imported again if the version of the distribution
+it comes from has changed.
+
+Besides the standard libraries, this finds:
+
+  - libraries registered under the "rfhub.libraries" entry point group
+  - top-level modules named *Library from installed distributions
+    whose name starts with "robotframework-" (eg: SeleniumLibrary
+    from robotframework-seleniumlibrary)
+
+"""
+
+import json
+import logging
+import os
+import sys
+
+import robot.libraries
+from robot.version import VERSION as ROBOT_VERSION
+
+from rfhub.sandbox import ImportSandbox, document_many
+
+ENTRY_POINT_GROUP = "rfhub.libraries"
+
+log = logging.getLogger(__name__)
+
+
+def cache_dir():
+    """Return the folder the cache files are kept in"""
+    if os.environ.get("RFHUB_CACHE_DIR"):
+        return os.environ["RFHUB_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "rfhub")
+
+
+def cache_file():
+    """Return the path of the cache file for this robot version and interpreter"""
+    filename = "libraries-robot-%s-%s.json" % (ROBOT_VERSION, sys.implementation.cache_tag)
+    return os.path.join(cache_dir(), filename)
+
+
+def find_installed_libraries(ignore=None):
+    """Return a dictionary mapping library names to a version key
+
+    The version key identifies the exact release the library comes
+    from (eg: "robotframework==3.1.2"), and is used to decide whether
+    a cached copy of its documentation is still valid.
+
+    ignore is an optional function which returns True for library
+    names that should be skipped.
+    """
+    libraries = {}
+
+    robot_key = "robotframework==%s" % ROBOT_VERSION
+    libdir = os.path.dirname(robot.libraries.__file__)
+    for filename in os.listdir(libdir):
+        libname, ext = os.path.splitext(filename)
+        if ext in (".py", ".pyc"):
+            libraries[libname] = robot_key
+
+    # pkg_resources scans every installed package when it is imported,
+    # so it's only imported when libraries are actually being looked for
+    import pkg_resources
+
+    for entry_point in pkg_resources.iter_entry_points(ENTRY_POINT_GROUP):
+        libname = ".".join([entry_point.module_name] + list(entry_point.attrs))
+        libraries[libname] = _version_key(entry_point.dist)
+
+    for dist in pkg_resources.working_set:
+        if (dist.project_name.lower().startswith("robotframework-") and
+                dist.has_metadata("top_level.txt")):
+            for libname in dist.get_metadata_lines("top_level.txt"):
+                if libname.endswith("Library"):
+                    libraries.setdefault(libname, _version_key(dist))
+
+    if ignore is not None:
+        libraries = dict((name, key) for (name, key) in libraries.items() if not ignore(name))
+    return libraries
+
+
+def load_installed_libraries(ignore=None, use_cache=True, sandbox=None, use_sandbox=True):
+    """Return a list of collection records for every installed library
+
+    See rfhub.sandbox for the format of a collection record.
+
+    Libraries without a valid cache entry are documented in
+    parallel by an ImportSandbox (a temporary one if none is
+    given), or one at a time in this process without use_sandbox,
+    and the cache is updated with the result. Libraries
+    that fail to import (or time out) aren't cached, so they are
+    tried again next time.
+    """
+    libraries = find_installed_libraries(ignore)
+    cache = _read_cache() if use_cache else {}
+
+    stale = sorted(name for (name, key) in libraries.items()
+                   if cache.get(name, {}).get("key") != key)
+    if stale:
+        own_sandbox = use_sandbox and sandbox is None
+        if own_sandbox:
+            sandbox = ImportSandbox()
+        documented = sandbox.document_many(stale) if use_sandbox else document_many(stale)
+        try:
+            for (name, record, error) in documented:
+                if error is not None:
+                    # failures may be temporary (eg: an environment
+                    # variable that isn't set), so they aren't cached
+                    log.debug("unable to add library %s: %s" % (name, error))
+                    continue
+                if record is not None and len(record["keywords"]) == 0:
+                    record = None
+                cache[name] = {"key": libraries[name], "collection": record}
+        finally:
+            if own_sandbox:
+                sandbox.close()
+        _write_cache(dict((name, cache[name]) for name in libraries if name in cache))
+
+    return [cache[name]["collection"] for name in sorted(libraries, key=str.lower)
+            if name in cache and cache[name]["collection"] is not None]
+
+
+def _version_key(dist):
+    return "%s==%s" % (dist.project_name, dist.version)
+
+
+def _read_cache():
+    try:
+        with open(cache_file(), "r") as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _write_cache(cache):
+    filename = cache_file()
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename + ".tmp", "w") as f:
+            json.dump(cache, f)
+        os.replace(filename + ".tmp", filename)
+    except (IOError, OSError) as e:
+        log.debug("unable to write library cache %s: %s" % (filename, e))
@@ -7,21 +7,28 @@ are referred to as "collections".
 """
 
 import ast
-import json
 import logging
 import os
 import re
-import sys
 
-import robot.libraries
-from robot.libdocpkg import LibraryDocumentation
+from robot.libdocpkg.htmlwriter import DocToHtml
 from robot.errors import DataError
-from sqlalchemy import and_, or_, create_engine, Column, ForeignKey, Integer, MetaData, Sequence, Table, Text
-from sqlalchemy.sql import select
+from rfhub import installed
+from rfhub import libspec
+from rfhub import metrics
+from rfhub.duplicates import DuplicateIndex
+from rfhub import usages
+from rfhub.progress import LoadProgress
+from rfhub.sandbox import document
+from rfhub.storage import create_storage
+from rfhub.storage.base import normalize_name
 from watchdog.events import PatternMatchingEventHandler
 from watchdog.observers import Observer
 from watchdog.observers.polling import PollingObserver
 
+# the files add_folder looks at
+FOLDER_SUFFIXES = (".xml", ".libspec", ".robot", ".txt", ".py", ".tsv", ".resource")
+
 """
 Note: It seems to be possible for watchdog to fire an event
 when a file is modified, but before the file is _finished_
@@ -37,7 +44,7 @@ I haven't done extensive testing.
 
 
 class WatchdogHandler(PatternMatchingEventHandler):
-    patterns = ["*.robot", "*.txt", "*.py", "*.tsv"]
+    patterns = ["*.robot", "*.txt", "*.py", "*.tsv", "*.resource"]
 
     def __init__(self, kwdb, path):
         PatternMatchingEventHandler.__init__(self)
@@ -47,30 +54,70 @@ class WatchdogHandler(PatternMatchingEventHandler):
     def on_created(self, event):
         # monitor=False because we're already monitoring
         # ancestor of the file that was created. Duh.
-        self.kwdb.add(event.src_path, monitor=False)
+        self._reload(event, self.kwdb.add, event.src_path, monitor=False)
 
     def on_deleted(self, event):
-        # FIXME: need to implement this
-        pass
+        self._reload(event, self.kwdb.remove, event.src_path)
 
     def on_modified(self, event):
-        self.kwdb.on_change(event.src_path, event.event_type)
+        self._reload(event, self.kwdb.on_change, event.src_path, event.event_type)
+
+    def _reload(self, event, method, *args, **kwargs):
+        """Call method, on the kwdb's reload_executor if it has one
+
+        Events are still handled one at a time, in order: this
+        waits for the reload to be done.
+        """
+        def reload():
+            with metrics.timer("rfhub_reload_seconds", event=event.event_type):
+                method(*args, **kwargs)
+
+        if self.kwdb.reload_executor is None:
+            reload()
+        else:
+            self.kwdb.reload_executor.submit(reload).result()
 
 
 class KeywordTable(object):
-    """Abstraction over database of keywords"""
+    """Abstraction over database of keywords
 
-    def __init__(self, conn_string, poll=False):
-        self._engine = create_engine(conn_string)
-        self.db = self._engine.connect()
+    This class finds and parses keyword files and libraries; the
+    data itself is kept by a storage backend (see rfhub.storage)
+    chosen by the connection string.
+    """
+
+    def __init__(self, conn_string, poll=False, sandbox=None, read_urls=(), watch=True,
+                 index_usages=False):
+        self.storage = create_storage(conn_string, read_urls)
         self.log = logging.getLogger(__name__)
-        self._create_db()
+
+        # if true, the keyword calls made by test suites and
+        # resource files are recorded (see rfhub.usages)
+        self.index_usages = index_usages
+
+        # if given, an ImportSandbox used to document libraries
+        # so that their imports happen in worker processes
+        self.sandbox = sandbox
+
+        # how far loading has got, for /ping
+        self.progress = LoadProgress()
+
+        # copy-pasted keywords, found when asked for
+        self.duplicates = DuplicateIndex(self)
+
+        # if set, the executor files that have changed are reloaded
+        # on, so that reloads wait for more urgent work (see
+        # rfhub.scheduler); otherwise they run on the watcher's thread
+        self.reload_executor = None
 
         # set up watchdog observer to monitor changes to
         # keyword files (or more correctly, to directories
-        # of keyword files)
-        self.observer = PollingObserver() if poll else Observer()
-        self.observer.start()
+        # of keyword files). Hubs that never load anything
+        # (eg: --web) have nothing to watch.
+        self.observer = None
+        if watch:
+            self.observer = PollingObserver() if poll else Observer()
+            self.observer.start()
 
     def add(self, name, monitor=True):
         """Add a folder, library (.py) or resource file (.robot, .tsv, .txt) to the database
@@ -79,36 +126,72 @@ class KeywordTable(object):
         if os.path.isdir(name):
             if not os.path.basename(name).startswith("."):
                 self.add_folder(name)
+            return
 
-        elif os.path.isfile(name):
-            if ((self._looks_like_resource_file(name)) or
-                    (self._looks_like_libdoc_file(name)) or
-                    (self._looks_like_library_file(name))):
-                self.add_file(name)
-                if self._looks_like_library_file(name):
-                    class_names = self._get_classnames_from_file(name)
-                    if class_names:
-                        self.add_keywords_from_classes(name, class_names)
-        else:
-            # let's hope it's a library name!
-            self.add_library(name)
+        try:
+            if os.path.isfile(name):
+                if self.index_usages and usages.is_usage_file(name):
+                    self.add_usages(name)
+                if self._looks_like_libdoc_file(name):
+                    self.add_spec(name)
+                elif ((self._looks_like_resource_file(name)) or
+                        (self._looks_like_library_file(name))):
+                    self.add_file(name)
+                    if self._looks_like_library_file(name):
+                        class_names = self._get_classnames_from_file(name)
+                        if class_names:
+                            self.add_keywords_from_classes(name, class_names)
+            else:
+                # let's hope it's a library name!
+                self.add_library(name)
+        finally:
+            self.progress.step(name)
+
+    def count_files(self, name):
+        """Return how many files (or libraries) add(name) will look at
+
+        This is for reporting progress; not every file turns
+        out to have keywords.
+        """
+        if not os.path.isdir(name):
+            return 1
+        if os.path.basename(name).startswith("."):
+            return 0
+        count = 0
+        for filename in os.listdir(name):
+            path = os.path.join(name, filename)
+            if not os.access(path, os.R_OK):
+                continue
+            if os.path.isdir(path):
+                count += self.count_files(path)
+            elif os.path.splitext(filename.lower())[1] in FOLDER_SUFFIXES:
+                count += 1
+        return count
 
     def add_keywords_from_classes(self, path, class_names):
-        sys.path.append(os.path.dirname(path))
+        # the directory is added to the sys.path of whichever process
+        # imports the classes (see rfhub.sandbox.document); with a
+        # sandbox, that isn't the hub
+        dirname = os.path.dirname(path)
         file_name = os.path.splitext(os.path.basename(path))[0]
         for class_name in class_names:
             try:
                 lib_mane = '{}.{}'.format(file_name, class_name)
-                self.add_library(lib_mane)
+                self.add_library(lib_mane, pythonpath=[dirname])
             except (KeyError, AttributeError, DataError):
                 pass
 
     def _get_classnames_from_file(self, path):
+        """Return the names of the classes defined at the top level of a file
+
+        Nested classes can't be imported as libraries, so there's
+        no point in trying.
+        """
         with open(path) as file_to_read:
             source = file_to_read.read()
 
         p = ast.parse(source)
-        class_names = [node.name for node in ast.walk(p) if isinstance(node, ast.ClassDef)]
+        class_names = [node.name for node in p.body if isinstance(node, ast.ClassDef)]
         return class_names
 
     def on_change(self, path, event_type):
@@ -118,70 +201,133 @@ class KeywordTable(object):
         has changed on disk. We need to reload the keywords
         from that file
         """
-        # I can do all this work in a sql statement, but
-        # for debugging it's easier to do it in stages.
-        sql = """SELECT collection_id
-                 FROM collection_table
-                 WHERE path == ?
-        """
-        cursor = self.db.execute(select([self.collections.c.collection_id]).where(self.collections.c.path == path))
-        results = cursor.fetchall()
         # there should always be exactly one result, but
         # there's no harm in using a loop to process the
         # single result
-        for result in results:
-            collection_id = result[0]
+        if self.index_usages and usages.is_usage_file(path):
+            self.add_usages(path)
+        storage = self.storage.primary
+        for collection_id in storage.get_collection_ids(path):
+            old = self._get_keyword_signatures(collection_id)
             # remove all keywords in this collection
-            sql = """DELETE from keyword_table
-                     WHERE collection_id == ?
-            """
-            self.db.execute(self.keywords.delete().where(self.keywords.c.collection_id == collection_id))
+            self.storage.delete_keywords(collection_id)
             self._load_keywords(collection_id, path=path)
-
-    def _load_keywords(self, collection_id, path=None, libdoc=None):
-        """Load a collection of keywords
-
-           One of path or libdoc needs to be passed in...
-        """
-        if libdoc is None and path is None:
-            raise (Exception("You must provide either a path or libdoc argument"))
-
-        if libdoc is None:
-            libdoc = LibraryDocumentation(path)
-
-        if len(libdoc.keywords) > 0:
-            for keyword in libdoc.keywords:
-                self._add_keyword(collection_id, keyword.name, keyword.doc, keyword.args)
+            new = self._get_keyword_signatures(collection_id)
+
+            name = storage.get_collection(collection_id)["name"]
+            for keyword in sorted(set(old) | set(new)):
+                if keyword not in new:
+                    self.storage.log_change(collection_id, name, "removed", keyword)
+                elif keyword not in old:
+                    self.storage.log_change(collection_id, name, "added", keyword)
+                elif old[keyword] != new[keyword]:
+                    self.storage.log_change(collection_id, name, "updated", keyword)
+            self.storage.log_change(collection_id, name, "updated")
+
+    def remove(self, path):
+        """Remove all collections that were loaded from the given file"""
+        path = os.path.abspath(path)
+        storage = self.storage.primary
+        names = dict((collection_id, storage.get_collection(collection_id)["name"])
+                     for collection_id in storage.get_collection_ids(path))
+        collection_ids = self.storage.delete_collections(path)
+        for collection_id in collection_ids:
+            self.storage.log_change(collection_id, names.get(collection_id), "removed")
+        self.storage.set_usages(path, [])
+        return collection_ids
+
+    def _get_keyword_signatures(self, collection_id):
+        """Return a dictionary of keyword name: (args, doc) for a collection"""
+        return dict((name, (args, doc))
+                    for (keyword_id, name, args, doc) in self.storage.primary.get_keyword_data(collection_id))
+
+    def _load_keywords(self, collection_id, path):
+        """Load the keywords of a file into an existing collection"""
+        if self._looks_like_libdoc_file(path):
+            with open(path, "rb") as f:
+                records = libspec.read_spec(f, path)
+                # the first record describes the collection,
+                # which is already in the database
+                next(records)
+                self.storage.add_keywords(collection_id, records)
+        else:
+            self.storage.add_keywords(collection_id, self._document(path)["keywords"])
 
     def add_file(self, path):
         """Add a resource file or library file to the database"""
-        libdoc = LibraryDocumentation(path)
-        if len(libdoc.keywords) > 0:
-            if libdoc.doc.startswith("Documentation for resource file"):
-                # bah! The file doesn't have an file-level documentation
-                # and libdoc substitutes some placeholder text.
-                libdoc.doc = ""
-
-            collection_id = self.add_collection(path, libdoc.name, libdoc.type,
-                                                libdoc.doc, libdoc.version,
-                                                libdoc.scope, libdoc.named_args,
-                                                libdoc.doc_format)
-            self._load_keywords(collection_id, libdoc=libdoc)
-
-    def add_library(self, name):
+        record = self._document(path)
+        if record["doc"].startswith("Documentation for resource file"):
+            # bah! The file doesn't have an file-level documentation
+            # and libdoc substitutes some placeholder text.
+            record["doc"] = ""
+        self._add_record(path, record)
+
+    def add_spec(self, path):
+        """Add the keywords from libdoc spec files (xml or json)
+
+        path can be a single spec file, a folder of spec files,
+        or a .zip or .tar archive of them. Specs are read directly
+        rather than through robot's LibraryDocumentation, which makes
+        this much faster than adding the same files with add_file.
+        Every collection from an archive gets the archive's path.
+
+        Returns the ids of the collections that were added.
+        """
+        archive = libspec.is_archive(path)
+        collection_ids = []
+        for (filename, fileobj) in libspec.iter_spec_files(path):
+            with metrics.registry.parse_timer(filename, "spec"):
+                # folders and archives often hold other xml and json
+                # files (eg: output.xml, package.json); skip them, and
+                # broken specs, rather than giving up on the rest. The
+                # whole spec is read before anything is stored, so a
+                # broken one never leaves a partial collection behind.
+                try:
+                    records = libspec.read_spec(fileobj, filename)
+                    info = next(records)
+                    keywords = list(records)
+                except (ValueError, SyntaxError) as e:
+                    self.log.warning("skipping %s: %s", filename, e)
+                    continue
+                if not keywords:
+                    continue
+                if info["doc"].startswith("Documentation for resource file"):
+                    # same placeholder text as in add_file
+                    info["doc"] = ""
+                collection_id = self.add_collection(path if archive else filename,
+                                                    info["name"], info["type"],
+                                                    info["doc"], info["version"],
+                                                    info["scope"], info["namedargs"],
+                                                    info["doc_format"])
+                self.storage.add_keywords(collection_id, keywords)
+                self.storage.log_change(collection_id, info["name"], "added")
+                collection_ids.append(collection_id)
+        return collection_ids
+
+    def add_usages(self, path):
+        """Record the keyword calls made by a test suite or resource file
+
+        This replaces whatever was recorded for the file before.
+        """
+        path = os.path.abspath(path)
+        try:
+            with metrics.timer("rfhub_parse_seconds", kind="usages"):
+                calls = usages.find_calls(path)
+        except Exception as e:
+            self.log.warning("unable to find keyword calls in %s: %s", path, e)
+            calls = []
+        self.storage.set_usages(path, [(usages.call_name(name), name, owner, lineno)
+                                       for (name, owner, lineno) in calls])
+
+    def add_library(self, name, pythonpath=()):
         """Add a library to the database
 
         This method is for adding a library by name (eg: "BuiltIn")
-        rather than by a file.
+        rather than by a file. Folders in pythonpath are added to
+        sys.path of the process that imports the library.
         """
-        libdoc = LibraryDocumentation(name)
-        if len(libdoc.keywords) > 0:
-            # FIXME: figure out the path to the library file
-            collection_id = self.add_collection(None, libdoc.name, libdoc.type,
-                                                libdoc.doc, libdoc.version,
-                                                libdoc.scope, libdoc.named_args,
-                                                libdoc.doc_format)
-            self._load_keywords(collection_id, libdoc=libdoc)
+        # FIXME: figure out the path to the library file
+        self._add_record(None, self._document(name, pythonpath))
 
     def add_folder(self, dirname, watch=True):
         """Recursively add all files in a folder to the database
@@ -218,7 +364,7 @@ class KeywordTable(object):
                         if os.access(path, os.R_OK):
                             self.add_folder(path, watch=False)
                 else:
-                    if ext in (".xml", ".robot", ".txt", ".py", ".tsv"):
+                    if ext in FOLDER_SUFFIXES:
                         if os.access(path, os.R_OK):
                             self.add(path)
             except Exception as e:
@@ -231,7 +377,7 @@ class KeywordTable(object):
         # any subfolders. That will work better in the case where
         # the user accidentally starts up the hub giving the same
         # folder, or a folder and it's children, on the command line...
-        if watch:
+        if watch and self.observer is not None:
             # add watcher on normalized path
             dirname = os.path.abspath(dirname)
             event_handler = WatchdogHandler(self, dirname)
@@ -244,138 +390,59 @@ class KeywordTable(object):
             # We want to store the normalized form of the path in the
             # database
             path = os.path.abspath(path)
-        insert = self.collections.insert()\
-            .values(name=c_name, type=c_type, version=c_version, scope=c_scope, namedargs=c_namedargs,
-                    path=path, doc=c_doc, doc_format=c_doc_format)
-        result = self.db.execute(insert)
-        return result.inserted_primary_key[0]
+        return self.storage.add_collection(path, c_name, c_type, c_doc, c_version,
+                                           c_scope, c_namedargs, c_doc_format)
 
-    def add_installed_libraries(self):
+    def add_installed_libraries(self, use_cache=True):
         """Add any installed libraries that we can find
 
-        We do this by looking in the `libraries` folder where
-        robot is installed. If you have libraries installed
-        in a non-standard place, this won't pick them up.
+        This finds robot's standard libraries plus third-party
+        libraries that can be discovered from installed packages
+        (see rfhub.installed). The documentation of those libraries
+        is cached between runs, so they only get imported again
+        when their version changes.
         """
+        with metrics.registry.parse_timer("(installed libraries)", "installed"):
+            for record in installed.load_installed_libraries(self._should_ignore, use_cache, self.sandbox,
+                                                              use_sandbox=self.sandbox is not None):
+                self._add_record(None, record)
 
-        libdir = os.path.dirname(robot.libraries.__file__)
-        loaded = []
-        for filename in os.listdir(libdir):
-            if filename.endswith(".py") or filename.endswith(".pyc"):
-                libname, ext = os.path.splitext(filename)
-                if (libname.lower() not in loaded and
-                        not self._should_ignore(libname)):
-
-                    try:
-                        self.add(libname)
-                        loaded.append(libname.lower())
-                    except Exception as e:
-                        # need a better way to log this...
-                        self.log.debug("unable to add library: " + str(e))
-
+    @metrics.timed("rfhub_query_seconds", method="get_collection")
     def get_collection(self, collection_id):
         """Get a specific collection"""
-        sql = """SELECT collection.collection_id, collection.type,
-                        collection.name, collection.path,
-                        collection.doc,
-                        collection.version, collection.scope,
-                        collection.namedargs,
-                        collection.doc_format
-                 FROM collection_table as collection
-                 WHERE collection_id == ? OR collection.name like ?
-        """
-        query = select([self.collections]) \
-            .where(self.collections.c.collection_id == collection_id)
-        # need to handle the case where we get more than one result...
-        sql_result = self.db.execute(query).fetchone()
-        if sql_result is not None:
-            return {
-                "collection_id": sql_result[0],
-                "name": sql_result[1],
-                "type": sql_result[2],
-                "version": sql_result[3],
-                "scope": sql_result[4],
-                "namedargs": sql_result[5],
-                "path": sql_result[6],
-                "doc": sql_result[7],
-                "doc_format": sql_result[8]
-            }
+        return self.storage.get_collection(collection_id)
 
+    @metrics.timed("rfhub_query_seconds", method="get_collections")
     def get_collections(self, pattern="*", libtype="*"):
         """Returns a list of collection name/summary tuples"""
+        return self.storage.get_collections(pattern, libtype)
 
-        sql = """SELECT collection.collection_id, collection.name, collection.doc,
-                        collection.type, collection.path
-                 FROM collection_table as collection
-                 WHERE name like ?
-                 AND type like ?
-                 ORDER BY collection.name
-              """
-        query = select([
-            self.collections.c.collection_id,
-            self.collections.c.name,
-            self.collections.c.doc,
-            self.collections.c.type,
-            self.collections.c.path]
-        ).where(
-            and_(
-                self.collections.c.name.ilike(self._glob_to_sql(pattern)),
-                self.collections.c.type.ilike(self._glob_to_sql(libtype))
-            )
-        ).order_by(self.collections.c.name)
-
-        result = self.db.execute(query)
-        return [{"collection_id": result[0],
-                 "name": result[1],
-                 "synopsis": result[2].split("\n")[0],
-                 "type": result[3],
-                 "path": result[4]
-                 } for result in result]
-
+    @metrics.timed("rfhub_query_seconds", method="get_keyword_data")
     def get_keyword_data(self, collection_id):
-        sql = """SELECT keyword.keyword_id, keyword.name, keyword.args, keyword.doc
-                 FROM keyword_table as keyword
-                 WHERE keyword.collection_id == ?
-                 ORDER BY keyword.name
-              """
-        query = select([
-            self.keywords.c.keyword_id, self.keywords.c.name, self.keywords.c.args, self.keywords.c.doc
-        ]).where(
-            self.keywords.c.collection_id == collection_id
-        ).order_by(self.keywords.c.name)
-
-        result = self.db.execute(query)
-        return result.fetchall()
+        """Return (keyword_id, name, args, doc) tuples for a collection
+
+        Unlike get_keywords, args is returned as a list rather than
+        as a json string.
+        """
+        return self.storage.get_keyword_data(collection_id)
 
+    @metrics.timed("rfhub_query_seconds", method="get_keyword")
     def get_keyword(self, collection_id, name):
         """Get a specific keyword from a library"""
-        sql = """SELECT keyword.name, keyword.args, keyword.doc
-                 FROM keyword_table as keyword
-                 WHERE keyword.collection_id == ?
-                 AND keyword.name like ?
-              """
-        query = select([
-            self.keywords.c.name, self.keywords.c.args, self.keywords.c.doc
-        ]).where(
-            and_(
-                self.keywords.c.collection_id == collection_id,
-                self.keywords.c.name.ilike(name)
-            )
-        )
-
-        result = self.db.execute(query)
-        # We're going to assume no library has duplicate keywords
-        # While that in theory _could_ happen, it never _should_,
-        # and you get what you deserve if it does.
-        row = result.fetchone()
-        if row is not None:
-            return {"name": row[0],
-                    "args": json.loads(row[1]),
-                    "doc": row[2],
-                    "collection_id": collection_id
-                    }
-        return {}
+        return self.storage.get_keyword(collection_id, name)
 
+    @metrics.timed("rfhub_query_seconds", method="find_keywords")
+    def find_keywords(self, names):
+        """Return all keywords with any of the given names
+
+        Names are matched the way robot matches keyword names: case,
+        spaces and underscores are ignored. The result is a list of
+        (collection_id, collection_name, keyword_name, doc, args)
+        tuples, where args is a list.
+        """
+        return self.storage.find_keywords(set(normalize_name(name) for name in names))
+
+    @metrics.timed("rfhub_query_seconds", method="get_keyword_hierarchy")
     def get_keyword_hierarchy(self, pattern="*"):
         """Returns all keywords that match a glob-style pattern
 
@@ -387,38 +454,9 @@ class KeywordTable(object):
         keyword_synopsis tuples) sorted by keyword name
 
         """
-        query = select([
-            self.collections.c.collection_id,
-            self.collections.c.name,
-            self.collections.c.path,
-            self.keywords.c.name,
-            self.keywords.c.doc
-        ]).select_from(
-            self.collections.join(self.keywords)
-        ).where(
-            self.collections.c.name.ilike(self._glob_to_sql(pattern))
-        ).order_by(
-            self.collections.c.name, self.collections.c.collection_id, self.keywords.c.name
-        )
-        sql = """SELECT collection.collection_id, collection.name, collection.path,
-                 keyword.name, keyword.doc
-                 FROM collection_table as collection
-                 JOIN keyword_table as keyword
-                 WHERE collection.collection_id == keyword.collection_id
-                 AND keyword.name like ?
-                 ORDER by collection.name, collection.collection_id, keyword.name
-             """
-        result = self.db.execute(query)
-        libraries = []
-        current_library = None
-        for row in result.fetchall():
-            (c_id, c_name, c_path, k_name, k_doc) = row
-            if c_id != current_library:
-                current_library = c_id
-                libraries.append({"name": c_name, "collection_id": c_id, "keywords": [], "path": c_path})
-            libraries[-1]["keywords"].append({"name": k_name, "doc": k_doc})
-        return libraries
+        return self.storage.get_keyword_hierarchy(pattern)
 
+    @metrics.timed("rfhub_query_seconds", method="search")
     def search(self, pattern="*", mode="both"):
         """Perform a pattern-based search on keyword names and documentation
 
@@ -437,40 +475,9 @@ class KeywordTable(object):
         search for the word 'screenshot' in the Selenium2Library.
 
         """
-        pattern = self._glob_to_sql(pattern)
-
-        sql = """SELECT collection.collection_id, collection.name, keyword.name, keyword.doc
-                 FROM collection_table as collection
-                 JOIN keyword_table as keyword
-                 WHERE collection.collection_id == keyword.collection_id
-                 AND %s
-                 ORDER by collection.collection_id, collection.name, keyword.name
-             """
-        where_clause = or_(
-                self.keywords.c.name.ilike(pattern),
-                self.keywords.c.doc.ilike(pattern)
-            )
-        if mode == "name":
-            where_clause = self.keywords.c.name.ilike(pattern)
-
-        query = select([
-            self.collections.c.collection_id,
-            self.collections.c.name,
-            self.keywords.c.name,
-            self.keywords.c.doc
-        ]).select_from(
-            self.collections.join(self.keywords)
-        ).where(
-            where_clause
-        ).order_by(
-            self.collections.c.collection_id, self.collections.c.name, self.keywords.c.name
-        )
-
-        cursor = self.db.execute(query)
-        result = [(row[0], row[1], row[2], row[3].strip().split("\n")[0])
-                  for row in cursor]
-        return list(set(result))
+        return self.storage.search(pattern, mode)
 
+    @metrics.timed("rfhub_query_seconds", method="get_keywords")
     def get_keywords(self, pattern="*"):
         """Returns all keywords that match a glob-style pattern
 
@@ -479,36 +486,120 @@ class KeywordTable(object):
         keyword_synopsis tuples) sorted by keyword name
 
         """
-        query = select([
-            self.collections.c.collection_id,
-            self.collections.c.name,
-            self.keywords.c.name,
-            self.keywords.c.doc,
-            self.keywords.c.args
-        ]).select_from(
-            self.collections.join(self.keywords)
-        ).where(
-            self.keywords.c.name.ilike(self._glob_to_sql(pattern))
-        ).order_by(
-            self.collections.c.name, self.keywords.c.name
-        )
-        sql = """SELECT collection.collection_id, collection.name,
-                        keyword.name, keyword.doc, keyword.args
-                 FROM collection_table as collection
-                 JOIN keyword_table as keyword
-                 WHERE collection.collection_id == keyword.collection_id
-                 AND keyword.name like ?
-                 ORDER by collection.name, keyword.name
-             """
-        cursor = self.db.execute(query)
-        result = [(row[0], row[1], row[2], row[3], row[4])
-                  for row in cursor]
-        return list(set(result))
+        return self.storage.get_keywords(pattern)
+
+    @metrics.timed("rfhub_query_seconds", method="get_keyword_fields")
+    def get_keyword_fields(self, columns, pattern="*", collection_id=None, limit=None, by_name=False):
+        """Returns only some columns of the keywords that match a pattern
+
+        This is what the api uses to list keywords, so that only
+        the data a client asked for is read from the database. See
+        Storage.get_keyword_fields.
+        """
+        return self.storage.get_keyword_fields(columns, pattern, collection_id, limit=limit, by_name=by_name)
+
+    def iter_keyword_fields(self, columns, pattern="*", collection_id=None, chunk_size=1000):
+        """Like get_keyword_fields, but yields the rows a chunk at a time
+
+        This is for lists that may be too large to read all at once;
+        see Storage.iter_keyword_fields.
+        """
+        return self.storage.iter_keyword_fields(columns, pattern, collection_id, chunk_size)
+
+    def docs_to_html(self, docs):
+        """Convert a list of keyword docs to HTML
+
+        Docs that have prerendered HTML in the storage (eg: when
+        serving from a snapshot) aren't rendered again.
+        """
+        rendered = self.storage.get_doc_html(set(docs))
+        to_html = DocToHtml("ROBOT")
+        for doc in docs:
+            if doc not in rendered:
+                try:
+                    rendered[doc] = to_html(doc)
+                except Exception as e:
+                    self.log.debug("unable to convert doc to html: " + str(e))
+                    rendered[doc] = ""
+        return [rendered[doc] for doc in docs]
+
+    @metrics.timed("rfhub_query_seconds", method="get_usages")
+    def get_usages(self, library, name, offset=0, limit=None):
+        """Return the calls to a keyword, as (total, [(path, owner, line number, name)])
+
+        Calls are matched to keywords by name (see rfhub.usages), so
+        library and name needn't be of a keyword in the database.
+        At most limit calls are returned, starting at offset.
+        """
+        names = usages.usage_names(library, name)
+        total = sum(self.storage.get_usage_counts(names).values())
+        return (total, self.storage.get_usages(names, offset, limit))
+
+    @metrics.timed("rfhub_query_seconds", method="get_calls")
+    def get_calls(self, path):
+        """Return the (owner, line number, name) of every call made in a file"""
+        return [(owner, lineno, name)
+                for (c_path, owner, lineno, name) in self.storage.get_usages(path=os.path.abspath(path))]
+
+    @metrics.timed("rfhub_query_seconds", method="get_usage_counts")
+    def get_usage_counts(self):
+        """Return a dictionary of normalized name: number of calls
+
+        See usages.usage_names for the names calls to a keyword
+        are recorded under.
+        """
+        return self.storage.get_usage_counts()
 
     def reset(self):
         """Remove all data from the database, but leave the tables intact"""
-        self.db.execute(self.keywords.delete())
-        self.db.execute(self.collections.delete())
+        for collection in self.storage.primary.get_collections():
+            self.storage.log_change(collection["collection_id"], collection["name"], "removed")
+        self.storage.reset()
+
+    def get_version(self):
+        """Return the data version, which goes up with every change"""
+        return self.storage.get_version()
+
+    def get_epoch(self):
+        """Return the epoch of the data version (see Storage.get_epoch)"""
+        return self.storage.get_epoch()
+
+    @metrics.timed("rfhub_query_seconds", method="get_changes")
+    def get_changes(self, since=0):
+        """Return the collections added, updated or removed after version 'since'
+
+        The result is a list of (version, collection_id, name, keyword,
+        event) tuples, oldest first, where event is one of "added",
+        "updated" or "removed". keyword is None for changes to a
+        collection as a whole; when a file is reloaded, the keywords
+        that changed are listed before the collection.
+        """
+        return self.storage.get_changes(since)
+
+    def _document(self, source, pythonpath=()):
+        """Return the collection record (see rfhub.sandbox) for a library or file
+
+        Libraries are documented in the sandbox if there is one;
+        resource files don't run any code, so they are always
+        parsed in this process.
+        """
+        ext = os.path.splitext(source)[1].lower()
+        is_resource = ext in (".robot", ".txt", ".tsv", ".resource")
+        with metrics.registry.parse_timer(source, "resource" if is_resource else "library"):
+            if self.sandbox is None or is_resource:
+                return document(source, pythonpath)
+            return self.sandbox.document(source, pythonpath)
+
+    def _add_record(self, path, record):
+        """Add a collection record with at least one keyword to the database"""
+        if len(record["keywords"]) > 0:
+            collection_id = self.add_collection(path, record["name"], record["type"],
+                                                record["doc"], record["version"],
+                                                record["scope"], record["namedargs"],
+                                                record["doc_format"])
+            self.storage.add_keywords(collection_id, record["keywords"])
+            self.storage.log_change(collection_id, record["name"], "added")
+            return collection_id
 
     def _looks_like_library_file(self, name):
         return name.endswith(".py")
@@ -519,7 +610,7 @@ class KeywordTable(object):
         # but it's fast enough for our purposes, and prevents
         # us from doing a full parse of files that are obviously
         # not libdoc files
-        if name.lower().endswith(".xml"):
+        if name.lower().endswith((".xml", ".libspec")):
             with open(name, "r") as f:
                 # read the first few lines; if we don't see
                 # what looks like libdoc data, return false
@@ -570,68 +661,3 @@ class KeywordTable(object):
                 _name.startswith("_") or
                 _name in ("remote", "reserved", "easter", 
                           "dialogs_py", "dialogs_ipy", "dialogs_jy"))
-
-    def _add_keyword(self, collection_id, name, doc, args):
-        """Insert data into the keyword table
-
-        'args' should be a list, but since we can't store a list in an
-        sqlite database we'll make it json we can can convert it back
-        to a list later.
-        """
-        argstring = json.dumps(args)
-        insert = self.keywords.insert() \
-            .values(collection_id=collection_id, name=name, doc=doc, args=argstring)
-        self.db.execute(insert)
-
-    def _create_db(self):
-        self._metadata = MetaData()
-        self.collections = Table("collections", self._metadata,
-                                 Column("collection_id", Integer, Sequence('collection_id_seq'), primary_key=True),
-                                 Column('name', Text, index=True),
-                                 Column('type', Text),
-                                 Column('version', Text),
-                                 Column('scope', Text),
-                                 Column('namedargs', Text),
-                                 Column('path', Text),
-                                 Column('doc', Text),
-                                 Column('doc_format', Text)
-                                 )
-        self.keywords = Table("keywords", self._metadata,
-                              Column("keyword_id", Integer, Sequence('keyword_id_seq'), primary_key=True),
-                              Column('name', Text, index=True),
-                              Column('collection_id', Integer, ForeignKey('collections.collection_id')),
-                              Column('doc', Text),
-                              Column('args', Text)
-                              )
-        self._metadata.create_all(bind=self._engine)
-
-    def _glob_to_sql(self, string):
-        """Convert glob-like wildcards to SQL wildcards
-
-        * becomes %
-        ? becomes _
-        % becomes \%
-        \\ remains \\
-        \* remains \*
-        \? remains \?
-
-        This also adds a leading and trailing %, unless the pattern begins with
-        ^ or ends with $
-        """
-
-        # What's with the chr(1) and chr(2) nonsense? It's a trick to
-        # hide \* and \? from the * and ? substitutions. This trick
-        # depends on the substitutions being done in order.  chr(1)
-        # and chr(2) were picked because I know those characters
-        # almost certainly won't be in the input string
-        table = ((r'\\', chr(1)), (r'\*', chr(2)), (r'\?', chr(3)),
-                 (r'%', r'\%'), (r'?', '_'), (r'*', '%'),
-                 (chr(1), r'\\'), (chr(2), r'\*'), (chr(3), r'\?'))
-
-        for (a, b) in table:
-            string = string.replace(a, b)
-
-        string = string[1:] if string.startswith("^") else "%" + string
-        string = string[:-1] if string.endswith("$") else string + "%"
-
-        return string
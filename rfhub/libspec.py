@@ -0,0 +1,136 @@
+"""libspec - fast import of libdoc spec files
+
+Libdoc can write the documentation of a library as an XML spec
+file (and, with newer versions of robot, as a JSON spec file).
+Going through robot's LibraryDocumentation to load such a file
+builds a complete model of the library just so we can copy it
+field by field; this module reads the spec directly and produces
+records that can go straight to the storage's bulk insert.
+
+XML specs are read incrementally with iterparse, so even very large
+specs don't have to be held in memory all at once.
+"""
+
+import json
+import os
+import tarfile
+import xml.etree.ElementTree as ET
+import zipfile
+
+SPEC_EXTENSIONS = (".xml", ".json", ".libspec")
+
+
+def read_spec(fileobj, filename):
+    """Generate the records of a libdoc spec file opened in binary mode
+
+    The first item is a dictionary describing the collection (with
+    the keys name, type, doc, version, scope, namedargs and
+    doc_format); every item after that is a (name, doc, args)
+    keyword tuple.
+    """
+    if filename.lower().endswith(".json"):
+        return _read_json_spec(fileobj)
+    return _read_xml_spec(fileobj)
+
+
+def is_archive(path):
+    """Return True if path is an archive iter_spec_files can read"""
+    return os.path.isfile(path) and (zipfile.is_zipfile(path) or tarfile.is_tarfile(path))
+
+
+def iter_spec_files(path):
+    """Generate (filename, fileobj) pairs for every spec in path
+
+    path may be a single spec file, a folder (which is searched
+    recursively), or a .zip, .tar, .tar.gz or .tgz archive.
+    """
+    if os.path.isdir(path):
+        for (dirpath, dirnames, filenames) in os.walk(path):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for filename in sorted(filenames):
+                if filename.lower().endswith(SPEC_EXTENSIONS):
+                    filename = os.path.join(dirpath, filename)
+                    with open(filename, "rb") as f:
+                        yield (filename, f)
+
+    elif not is_archive(path):
+        with open(path, "rb") as f:
+            yield (path, f)
+
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if member.lower().endswith(SPEC_EXTENSIONS):
+                    with archive.open(member) as f:
+                        yield (member, f)
+
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(SPEC_EXTENSIONS):
+                    yield (member.name, archive.extractfile(member))
+
+
+def _read_xml_spec(fileobj):
+    collection = {"name": None, "type": None, "doc": "", "version": "",
+                  "scope": "", "namedargs": False, "doc_format": "ROBOT"}
+    collection_done = False
+    # the stack of open elements, so finished keywords can be
+    # removed from their parent and don't pile up in memory
+    stack = []
+
+    for (event, elem) in ET.iterparse(fileobj, events=("start", "end")):
+        if event == "start":
+            if not stack:
+                if elem.tag != "keywordspec":
+                    raise ValueError("not a libdoc spec file")
+                collection["name"] = elem.get("name")
+                collection["type"] = (elem.get("type") or "").lower()
+                collection["doc_format"] = elem.get("format", "ROBOT")
+                # newer versions of robot write the scope as an attribute
+                collection["scope"] = elem.get("scope", "")
+            elif elem.tag in ("kw", "init", "inits", "keywords") and not collection_done:
+                collection_done = True
+                yield collection
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        parent = stack[-1] if stack else None
+        if parent is not None and parent.tag == "keywordspec":
+            if elem.tag in ("version", "scope", "doc"):
+                collection[elem.tag] = elem.text or ""
+            elif elem.tag == "namedargs":
+                collection["namedargs"] = elem.text == "yes"
+
+        if elem.tag == "kw":
+            # newer versions of robot put the full argument (with
+            # default values, types, etc) in the repr attribute
+            args = [arg.get("repr", arg.text) for arg in elem.findall("arguments/arg")]
+            yield (elem.get("name", ""), elem.findtext("doc") or "", args)
+            parent.remove(elem)
+        elif elem.tag == "init":
+            parent.remove(elem)
+
+    if not collection_done:
+        yield collection
+
+
+def _read_json_spec(fileobj):
+    # the json module has no incremental parser, but loading
+    # the raw data is still much cheaper than building libdoc
+    # model objects from it
+    spec = json.loads(fileobj.read().decode("utf-8"))
+    if "keywords" not in spec or "name" not in spec:
+        raise ValueError("not a libdoc spec file")
+
+    yield {"name": spec["name"],
+           "type": (spec.get("type") or "").lower(),
+           "doc": spec.get("doc", ""),
+           "version": spec.get("version", ""),
+           "scope": spec.get("scope", ""),
+           "namedargs": spec.get("namedargs", True),
+           "doc_format": spec.get("docFormat", "ROBOT")}
+    for kw in spec["keywords"]:
+        args = [arg["repr"] if isinstance(arg, dict) else arg for arg in kw.get("args", [])]
+        yield (kw.get("name", ""), kw.get("doc", ""), args)
@@ -0,0 +1,102 @@
+"""metrics - timing of the hub's hot paths
+
+Timings are collected in a single registry and can be read in the
+Prometheus text format (see the /metrics url). Every timing is kept
+as a summary, ie: a count and a sum per combination of labels.
+
+The time it took to parse each individual file or library is also
+kept, for the --profile-startup report. Those aren't exported to
+Prometheus since there is one per file.
+
+    with metrics.timer("rfhub_query_seconds", method="search"):
+        ...
+
+"""
+
+import contextlib
+import functools
+import threading
+import time
+
+
+class Metrics(object):
+    """A thread-safe registry of timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # name -> {labels: [count, sum]}
+            self._summaries = {}
+            # source -> (kind, seconds)
+            self.parse_times = {}
+
+    def observe(self, name, seconds, **labels):
+        """Record one timing of 'seconds' for the metric 'name'"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            summary = self._summaries.setdefault(name, {}).setdefault(key, [0, 0.0])
+            summary[0] += 1
+            summary[1] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Context manager which records how long its body took"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        """Decorator which records how long each call of a function took"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextlib.contextmanager
+    def parse_timer(self, source, kind):
+        """Time the parsing of a single file or library"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe("rfhub_parse_seconds", seconds, kind=kind)
+            with self._lock:
+                self.parse_times[source] = (kind, seconds)
+
+    def slowest(self, n=10):
+        """Return the n slowest (source, kind, seconds) parse times"""
+        with self._lock:
+            times = [(source, kind, seconds) for (source, (kind, seconds)) in self.parse_times.items()]
+        return sorted(times, key=lambda t: t[2], reverse=True)[:n]
+
+    def render(self):
+        """Return all timings in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            for name in sorted(self._summaries):
+                lines.append("# TYPE %s summary" % name)
+                for (labels, (count, total)) in sorted(self._summaries[name].items()):
+                    label_text = ",".join('%s="%s"' % (k, _escape(v)) for (k, v) in labels)
+                    label_text = "{%s}" % label_text if label_text else ""
+                    lines.append("%s_count%s %d" % (name, label_text, count))
+                    lines.append("%s_sum%s %.6f" % (name, label_text, total))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+# the registry used throughout the hub
+registry = Metrics()
+timer = registry.timer
+timed = registry.timed
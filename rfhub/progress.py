@@ -0,0 +1,61 @@
+"""progress - how far the hub has got loading keywords
+
+Loading every library and file can take minutes. With --progressive
+the hub starts serving right away and loads in the background, and
+/ping reports how far it has got.
+"""
+
+import threading
+import time
+
+
+class LoadProgress(object):
+    """Counts the files and libraries loaded so far
+
+    The total is only an estimate: it counts every file that might
+    have keywords, and installed libraries count as one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.done = 0
+        self.started = None
+        self.finished = None
+
+    @property
+    def loading(self):
+        return self.started is not None and self.finished is None
+
+    def start(self):
+        with self._lock:
+            self.total = 0
+            self.done = 0
+            self.started = time.perf_counter()
+            self.finished = None
+
+    def expect(self, count):
+        """Add count to the number of files and libraries to load"""
+        with self._lock:
+            self.total += count
+
+    def step(self, source):
+        """Record that a file or library has been loaded (or failed to)"""
+        with self._lock:
+            # files added later on, by the file watcher, don't count
+            if self.loading:
+                self.done += 1
+
+    def finish(self):
+        with self._lock:
+            self.finished = time.perf_counter()
+
+    def as_dict(self):
+        with self._lock:
+            if self.started is None:
+                return {"status": "ready"}
+            elapsed = (self.finished if self.finished is not None else time.perf_counter()) - self.started
+            return {"status": "loading" if self.finished is None else "ready",
+                    "done": self.done,
+                    "total": max(self.total, self.done),
+                    "seconds": round(elapsed, 3)}
@@ -0,0 +1,200 @@
+"""sandbox - document libraries in worker processes
+
+Documenting a library means importing it, which runs arbitrary
+module-level code: a page object that connects to a database at
+import time can hang startup forever, and whatever the library
+imports stays in memory for as long as the hub runs. ImportSandbox
+does the importing in a pool of worker processes instead. Each
+library gets a time limit, workers can get a memory limit, and
+workers are replaced after a number of libraries so their memory is
+given back. Only plain collection records come back to the hub.
+
+The workers are started with forkserver (or spawn, where there is
+no forkserver) rather than forked from the hub, which by then is
+running threads of its own (the file watcher, the web server).
+
+A collection record is a dictionary with the keys name, type, doc,
+version, scope, namedargs, doc_format and keywords, where keywords
+is a list of (name, doc, args) tuples.
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+
+from robot.errors import DataError
+from robot.libdocpkg import LibraryDocumentation
+
+try:
+    import resource
+except ImportError:
+    # not available on windows; memory limits are ignored there
+    resource = None
+
+
+class ImportTimeout(DataError):
+    """Raised when a library takes too long to import"""
+
+
+def document(source, pythonpath=()):
+    """Return the collection record for a library name, or a library or resource file
+
+    This runs in the current process. Folders in pythonpath are
+    added to sys.path first, unless they are already there.
+    """
+    for path in pythonpath:
+        if path not in sys.path:
+            sys.path.append(path)
+    libdoc = LibraryDocumentation(source)
+    return {"name": libdoc.name,
+            "type": libdoc.type,
+            "doc": libdoc.doc,
+            "version": libdoc.version,
+            "scope": libdoc.scope,
+            "namedargs": libdoc.named_args,
+            "doc_format": libdoc.doc_format,
+            "keywords": [(kw.name, kw.doc, list(kw.args)) for kw in libdoc.keywords]}
+
+
+def document_many(sources, pythonpath=()):
+    """Generate (source, record, error) for every source, like ImportSandbox.document_many
+
+    This runs in the current process, one source at a time.
+    """
+    for source in sources:
+        try:
+            yield (source, document(source, pythonpath), None)
+        except DataError as e:
+            yield (source, None, e)
+
+
+class ImportSandbox(object):
+    """A recycled pool of processes for documenting libraries
+
+    timeout is the number of seconds a single library may take,
+    memory_limit the number of megabytes a worker may use (None
+    for no limit), and tasks_per_worker how many libraries a
+    worker documents before it is replaced by a fresh one.
+
+    A sandbox can be shared by several threads (eg: the progressive
+    loader and the file watcher). A pool that is closed while
+    another thread is still waiting on it keeps running until that
+    thread is done with it.
+    """
+
+    def __init__(self, processes=None, timeout=60, memory_limit=None, tasks_per_worker=20):
+        self.processes = processes or min(4, os.cpu_count() or 1)
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.tasks_per_worker = tasks_per_worker
+        self._pool = None
+        # pool: how many document_many calls are using it
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def document(self, source, pythonpath=()):
+        """Return the collection record for a library, raising DataError on failure"""
+        for (source, record, error) in self.document_many([source], pythonpath):
+            if error is not None:
+                raise error
+            return record
+
+    def document_many(self, sources, pythonpath=()):
+        """Generate (source, record, error) for every source, in order
+
+        Libraries are documented in parallel. Either record or error
+        is None; error is a DataError (an ImportTimeout if the
+        library didn't finish in time).
+        """
+        pending = list(sources)
+        while pending:
+            pool = self._acquire()
+            stuck = False
+            try:
+                tasks = [(source, pool.apply_async(_document_in_worker, (source, list(pythonpath))))
+                         for source in pending]
+                pending = []
+                for (index, (source, task)) in enumerate(tasks):
+                    try:
+                        yield (source,) + task.get(self.timeout)
+                    except multiprocessing.TimeoutError:
+                        yield (source, None, ImportTimeout("importing '%s' took more than %s seconds"
+                                                           % (source, self.timeout)))
+                        # the worker is stuck and there's no way to kill
+                        # just that one, so keep what has already finished
+                        # and start over with fresh workers for the rest
+                        for (source, task) in tasks[index + 1:]:
+                            if task.ready():
+                                yield (source,) + task.get()
+                            else:
+                                pending.append(source)
+                        stuck = True
+                        break
+            finally:
+                self._release(pool, retire=stuck)
+
+    def close(self):
+        """Stop all workers; new ones are started when needed
+
+        Workers still in use by another thread are stopped when
+        that thread is done with them.
+        """
+        with self._lock:
+            pool = self._pool
+            self._pool = None
+            idle = pool is not None and not self._users.get(pool)
+            if idle:
+                self._users.pop(pool, None)
+        if idle:
+            _terminate(pool)
+
+    def _acquire(self):
+        """Return the current pool, starting one if need be, and count it as used"""
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(_START_METHOD)
+                self._pool = context.Pool(self.processes, _init_worker, (self.memory_limit,),
+                                          maxtasksperchild=self.tasks_per_worker)
+            self._users[self._pool] = self._users.get(self._pool, 0) + 1
+            return self._pool
+
+    def _release(self, pool, retire=False):
+        """Stop using pool, terminating it if it was closed and this was its last user
+
+        With retire, pool is closed first, so that no one else
+        starts using it.
+        """
+        with self._lock:
+            if retire and pool is self._pool:
+                self._pool = None
+            self._users[pool] -= 1
+            done = not self._users[pool] and pool is not self._pool
+            if done:
+                del self._users[pool]
+        if done:
+            _terminate(pool)
+
+
+_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _terminate(pool):
+    pool.terminate()
+    pool.join()
+
+
+def _init_worker(memory_limit):
+    if memory_limit and resource is not None:
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _document_in_worker(source, pythonpath):
+    """Return (record, error), with any failure turned into a DataError"""
+    try:
+        return (document(source, pythonpath), None)
+    except DataError as e:
+        return (None, DataError(str(e)))
+    except BaseException as e:
+        return (None, DataError("unable to document '%s': %s: %s" % (source, type(e).__name__, e)))
@@ -0,0 +1,178 @@
+"""scheduler - decide whose database work runs first
+
+Editors ask for completions and single keywords as the user types,
+and expect answers right away. Other clients ask for every keyword
+at once (eg: a CI job scraping the catalog), and the file watcher
+reloads files in batches. All of them share the hub's database
+connection, so the work is put in a Scheduler, which runs it on a
+pool of threads in order of priority:
+
+    INTERACTIVE    completions, single keywords, library lists
+    BULK           keyword lists
+    BACKGROUND     reloading files that have changed
+
+Work that has waited more than max_wait seconds runs before anything
+else, so that a busy hub still gets round to its reloads.
+
+TokenBuckets limits how much each client may ask for, so that one
+client can't keep the queues full for everyone else.
+"""
+
+import collections
+import concurrent.futures
+import threading
+import time
+
+from rfhub import metrics
+
+INTERACTIVE = 0
+BULK = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = ("interactive", "bulk", "background")
+
+_Task = collections.namedtuple("_Task", "future fn args kwargs queued")
+
+
+class Scheduler(object):
+    """A thread pool that runs the most important work first
+
+    The time each task waited for a thread is recorded as the
+    rfhub_queue_seconds metric, by priority.
+    """
+
+    def __init__(self, threads=8, max_wait=10, thread_name_prefix="rfhub-api"):
+        self.max_wait = max_wait
+        self._queues = [collections.deque() for name in PRIORITY_NAMES]
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._threads = []
+        for i in range(threads):
+            thread = threading.Thread(target=self._work, name="%s_%d" % (thread_name_prefix, i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, priority, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) when a thread is free, returning a Future"""
+        future = concurrent.futures.Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule work after shutdown")
+            self._queues[priority].append(_Task(future, fn, args, kwargs, time.monotonic()))
+            self._condition.notify()
+        return future
+
+    def executor(self, priority):
+        """Return an executor that submits work with the given priority
+
+        This is what IOLoop.run_in_executor expects.
+        """
+        return PriorityExecutor(self, priority)
+
+    def queued(self):
+        """Return the number of tasks waiting at each priority"""
+        with self._condition:
+            return dict((name, len(queue)) for (name, queue) in zip(PRIORITY_NAMES, self._queues))
+
+    def shutdown(self, wait=True):
+        """Stop the threads once the work already scheduled is done"""
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _next(self):
+        """Take the next task to run, or return None when shut down"""
+        with self._condition:
+            while not any(self._queues):
+                if self._shutdown:
+                    return None
+                self._condition.wait()
+            now = time.monotonic()
+            for queue in self._queues:
+                if queue and now - queue[0].queued > self.max_wait:
+                    return self._take(queue, now)
+            for queue in self._queues:
+                if queue:
+                    return self._take(queue, now)
+
+    def _take(self, queue, now):
+        task = queue.popleft()
+        metrics.registry.observe("rfhub_queue_seconds", now - task.queued,
+                                 priority=PRIORITY_NAMES[self._queues.index(queue)])
+        return task
+
+    def _work(self):
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            if not task.future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = task.fn(*task.args, **task.kwargs)
+            except BaseException as e:
+                task.future.set_exception(e)
+            else:
+                task.future.set_result(result)
+
+
+class PriorityExecutor(concurrent.futures.Executor):
+    """Submits work to a Scheduler with one priority"""
+
+    def __init__(self, scheduler, priority):
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def submit(self, fn, *args, **kwargs):
+        return self.scheduler.submit(self.priority, fn, *args, **kwargs)
+
+
+class TokenBuckets(object):
+    """Per-client rate limits
+
+    Every client has a bucket of up to 'burst' tokens, which refills
+    at 'rate' tokens a second. A request costs some tokens (larger
+    requests cost more); when the bucket doesn't have enough, the
+    client has to wait.
+    """
+
+    # buckets of clients that haven't been seen in a while are
+    # forgotten once there are this many
+    MAX_CLIENTS = 10000
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate * 5)
+        # client: (tokens, when they were counted)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, client, cost=1):
+        """Take cost tokens from client's bucket
+
+        Returns 0 if there were enough, otherwise the number of
+        seconds until there will be (and takes nothing).
+        """
+        now = time.monotonic()
+        with self._lock:
+            (tokens, then) = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - then) * self.rate)
+            cost = min(cost, self.burst)
+            if tokens < cost:
+                self._buckets[client] = (tokens, now)
+                return (cost - tokens) / self.rate
+            if len(self._buckets) >= self.MAX_CLIENTS and client not in self._buckets:
+                self._forget(now)
+            self._buckets[client] = (tokens - cost, now)
+            return 0
+
+    def _forget(self, now):
+        """Forget the clients whose buckets have refilled"""
+        full = [client for (client, (tokens, then)) in self._buckets.items()
+                if tokens + (now - then) * self.rate >= self.burst]
+        for client in full:
+            del self._buckets[client]
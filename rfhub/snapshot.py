@@ -0,0 +1,110 @@
+"""snapshot - save a loaded keyword catalog to a file, and serve from it
+
+A snapshot is an SQLite database with the same schema SqlStorage
+uses, plus prerendered HTML for every keyword doc and a small table
+describing the snapshot itself. Serving from a snapshot needs no
+parsing at all: the file is opened read-only and memory-mapped.
+
+    rfhub --worker --export-snapshot catalog.db /path/to/keywords
+    rfhub --snapshot catalog.db
+
+"""
+
+import os
+import sqlite3
+import time
+from urllib.request import pathname2url
+
+from sqlalchemy import Column, MetaData, Table, Text
+
+from rfhub import usages
+from rfhub.kwdb import KeywordTable
+from rfhub.storage import SqlStorage
+from rfhub.version import __version__
+
+# bump this whenever the storage schema changes in a way
+# that makes older snapshots unreadable
+FORMAT_VERSION = "5"
+
+# how much of the snapshot sqlite may map into memory
+MMAP_SIZE = 1024 * 1024 * 1024
+
+_info = Table("snapshot_info", MetaData(),
+              Column("name", Text, primary_key=True),
+              Column("value", Text))
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def export_snapshot(kwdb, filename):
+    """Write everything in kwdb to a snapshot file"""
+    tmp_filename = filename + ".tmp"
+    if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+
+    source = kwdb.storage
+    target = SqlStorage("sqlite:///" + os.path.abspath(tmp_filename))
+    docs = set()
+    for summary in sorted(source.get_collections(), key=lambda c: c["collection_id"]):
+        c = source.get_collection(summary["collection_id"])
+        collection_id = target.add_collection(c["path"], c["name"], c["type"], c["doc"], c["version"],
+                                              c["scope"], c["namedargs"], c["doc_format"])
+        keywords = [(name, doc, args)
+                    for (keyword_id, name, args, doc) in source.get_keyword_data(c["collection_id"])]
+        target.add_keywords(collection_id, keywords)
+        docs.update(doc for (name, doc, args) in keywords)
+
+    docs = list(docs)
+    target.set_doc_html(zip(docs, kwdb.docs_to_html(docs)))
+
+    by_path = {}
+    for (path, owner, lineno, name) in source.get_usages():
+        by_path.setdefault(path, []).append((usages.call_name(name), name, owner, lineno))
+    for (path, calls) in by_path.items():
+        target.set_usages(path, calls)
+
+    _info.create(bind=target.db)
+    target.db.execute(_info.insert(), [
+        {"name": "format_version", "value": FORMAT_VERSION},
+        {"name": "rfhub_version", "value": __version__},
+        {"name": "created", "value": time.strftime("%Y-%m-%dT%H:%M:%S")},
+    ])
+    target.db.execute("ANALYZE")
+    target.db.close()
+    target._engine.dispose()
+
+    os.replace(tmp_filename, filename)
+
+
+def open_snapshot(filename, poll=False):
+    """Return a KeywordTable that serves data from a snapshot file"""
+    kwdb = KeywordTable(snapshot_url(filename), poll=poll, watch=False)
+    kwdb.storage.db.execute("PRAGMA mmap_size=%d" % MMAP_SIZE)
+    return kwdb
+
+
+def snapshot_url(filename):
+    """Return a read-only database url for a snapshot file
+
+    Raises SnapshotError if the file isn't a snapshot this
+    version of the hub can read.
+    """
+    if not os.path.isfile(filename):
+        raise SnapshotError("snapshot file doesn't exist: %s" % filename)
+
+    uri = "file:%s?mode=ro" % pathname2url(os.path.abspath(filename))
+    try:
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            row = conn.execute("SELECT value FROM snapshot_info WHERE name = 'format_version'").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError:
+        raise SnapshotError("not an rfhub snapshot: %s" % filename)
+
+    if row is None or row[0] != FORMAT_VERSION:
+        raise SnapshotError("snapshot %s has format version %s, expected %s"
+                            % (filename, row[0] if row else "unknown", FORMAT_VERSION))
+    return "sqlite:///" + uri + "&uri=true"
@@ -0,0 +1,124 @@
+"""staticsite - write the documentation as a static web site
+
+Everything a reader needs is written to a folder, which any web
+server (or a CDN) can serve without running the hub:
+
+    rfhub --worker --export-static site/ /path/to/keywords
+
+The folder has the same layout as the hub's urls: the doc pages,
+the static assets they use, a mirror of /api/libraries and
+/api/keywords as json files, and api/search-index.json (see
+rfhub.blueprints.api.search). The pages are the ones the hub
+itself serves, fetched through the flask app.
+
+Urls ending in a slash are written as index.html (or index.json).
+Json urls that don't are written with .json added, so that
+/api/keywords/1 and /api/keywords/1/Sleep can both be files; the
+only other one, /doc/index, is written as it is. With nginx:
+
+    index index.html index.json;
+    default_type text/html;
+    try_files $uri $uri.json $uri/ =404;
+"""
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+import flask
+from markupsafe import escape
+
+REDIRECT = """<!DOCTYPE html>
+<html>
+  <head>
+    <meta charset="utf-8">
+    <meta http-equiv="refresh" content="0; url=%(url)s">
+  </head>
+  <body><a href="%(url)s">%(url)s</a></body>
+</html>
+"""
+
+
+class StaticExportError(Exception):
+    pass
+
+
+def export_static(app, dirname, threads=8):
+    """Write the doc pages and api data of app to the folder dirname
+
+    Pages are fetched on a pool of threads. Returns the number of
+    files written.
+
+    There is no hub to search a static site, so this turns on
+    client-side search (see --client-search) for app.
+    """
+    kwdb = app.kwdb
+    app.config["RFHUB_CLIENT_SEARCH"] = True
+    collection_ids = [c["collection_id"] for c in kwdb.get_collections()]
+    keywords = kwdb.get_keyword_fields(("collection_id", "name"))
+
+    with app.test_request_context():
+        url_for = flask.url_for
+        pages = [url_for("doc.doc"), url_for("doc.index"),
+                 url_for("api.get_libraries"), url_for("api.get_keywords")]
+        for collection_id in collection_ids:
+            pages.append(url_for("doc.doc_for_library", collection_id=collection_id))
+            pages.append(url_for("api.get_library", collection_id=collection_id))
+            pages.append(url_for("api.get_library_keywords", collection_id=collection_id))
+        doc_root = url_for("doc.index")[:-len("index")]
+        redirects = [(url_for("doc.doc"), "/"), ("keywords/", doc_root)]
+        for (collection_id, name) in keywords:
+            if "/" in name:
+                # there is no url for these
+                continue
+            pages.append(url_for("api.get_library_keyword", collection_id=collection_id, keyword=name))
+            # the library page shows every keyword; see doc.js
+            redirects.append(("../#kw-" + name.replace(" ", "-").lower(),
+                              url_for("doc.doc_for_library", collection_id=collection_id, keyword=name)))
+        assets = [(app.static_folder, url_for("static", filename=""))]
+        for (name, blueprint) in app.blueprints.items():
+            if blueprint.has_static_folder:
+                assets.append((blueprint.static_folder, url_for(name + ".static", filename="")))
+        pages.append(url_for("api.get_search_index"))
+
+    def fetch(url):
+        response = app.test_client().get(url)
+        if response.status_code != 200:
+            raise StaticExportError("%s returned status %d" % (url, response.status_code))
+        _write(dirname, url, response.get_data(), response.mimetype)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        # list() so that errors are raised here
+        list(executor.map(fetch, pages))
+
+    for (folder, url) in assets:
+        _copy_folder(folder, _path(dirname, url))
+    for (target, url) in redirects:
+        _write(dirname, url, (REDIRECT % {"url": escape(target)}).encode("utf-8"), "text/html")
+    return len(pages) + len(redirects)
+
+
+def _path(dirname, url):
+    """Return the path of the file for url in the folder dirname"""
+    return os.path.join(dirname, *unquote(url).strip("/").split("/"))
+
+
+def _copy_folder(source, target):
+    """Copy the files in source to target, replacing any already there"""
+    for (root, dirs, files) in os.walk(source):
+        folder = os.path.join(target, os.path.relpath(root, source))
+        os.makedirs(folder, exist_ok=True)
+        for name in files:
+            shutil.copy2(os.path.join(root, name), os.path.join(folder, name))
+
+
+def _write(dirname, url, data, mimetype):
+    path = _path(dirname, url)
+    if url.endswith("/"):
+        path = os.path.join(path, "index.json" if mimetype == "application/json" else "index.html")
+    elif mimetype == "application/json" and not path.endswith(".json"):
+        path += ".json"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
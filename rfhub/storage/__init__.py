@@ -0,0 +1,34 @@
+"""storage - backends that hold the keyword catalog
+
+KeywordTable knows how to find and parse keyword files; a storage
+backend knows how to keep the resulting collections and keywords
+and answer queries about them. Backends are selected by the
+connection string given to --db:
+
+    memory://          a pure in-memory catalog, tuned for lookups
+    anything else      an SQLAlchemy database URL (sqlite, postgresql, ...)
+
+SQL databases may also have read replicas (--db-read), which answer
+the queries while writes go to the primary (see ReplicatedStorage).
+"""
+
+from .base import Storage
+from .memory import MemoryStorage
+from .replicated import ReplicatedStorage
+from .sql import SqlStorage
+
+
+def create_storage(conn_string, read_urls=()):
+    """Return a storage backend for the given connection string
+
+    If read_urls are given, queries are answered by the databases
+    they point to, which should be read replicas of conn_string.
+    """
+    if conn_string.startswith(MemoryStorage.scheme):
+        if read_urls:
+            raise ValueError("%s storage can't have read replicas" % MemoryStorage.scheme)
+        return MemoryStorage()
+    if read_urls:
+        return ReplicatedStorage(SqlStorage(conn_string),
+                                 [SqlStorage(url, read_only=True) for url in read_urls])
+    return SqlStorage(conn_string)
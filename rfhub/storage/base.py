@@ -0,0 +1,263 @@
+"""The interface every storage backend must implement"""
+
+import re
+
+from robot.utils import getshortdoc, normalize
+
+
+# the columns get_keyword_fields can return; args is a json string
+KEYWORD_COLUMNS = ("collection_id", "library", "name", "synopsis", "doc", "args")
+
+
+class Storage(object):
+    """Abstract storage for collections and their keywords
+
+    Patterns passed to the query methods are glob-style (* and ?
+    are wildcards, a backslash escapes them), are matched without
+    regard to case, and may match anywhere in the string unless they
+    begin with ^ or end with $.
+
+    Keywords are added as (name, doc, args) tuples, where args is a
+    list of strings.
+    """
+
+    @property
+    def primary(self):
+        """The storage that writes go to
+
+        Queries made in order to change the data (eg: to compare a
+        file's keywords before and after reloading it) should be made
+        here, rather than to a read replica that may lag behind.
+        """
+        return self
+
+    def add_collection(self, path, c_name, c_type, c_doc, c_version="unknown",
+                       c_scope="", c_namedargs="yes", c_doc_format="ROBOT"):
+        """Add a collection, returning its collection_id"""
+        raise NotImplementedError
+
+    def add_keywords(self, collection_id, keywords):
+        """Add an iterable of (name, doc, args) tuples to a collection"""
+        raise NotImplementedError
+
+    def delete_keywords(self, collection_id):
+        """Remove all keywords from a collection, but keep the collection"""
+        raise NotImplementedError
+
+    def delete_collections(self, path):
+        """Remove all collections (and their keywords) loaded from path
+
+        Returns the list of collection ids that were removed.
+        """
+        raise NotImplementedError
+
+    def get_collection_ids(self, path):
+        """Return the ids of all collections loaded from path"""
+        raise NotImplementedError
+
+    def get_collection(self, collection_id):
+        """Return a dictionary describing a collection, or None"""
+        raise NotImplementedError
+
+    def get_collections(self, pattern="*", libtype="*"):
+        """Return a list of collection dictionaries, sorted by name"""
+        raise NotImplementedError
+
+    def get_keyword_data(self, collection_id):
+        """Return (keyword_id, name, args, doc) tuples, sorted by name
+
+        args is a list rather than a json string.
+        """
+        raise NotImplementedError
+
+    def get_keyword(self, collection_id, name):
+        """Return a dictionary describing a keyword, or an empty dictionary"""
+        raise NotImplementedError
+
+    def find_keywords(self, names):
+        """Return the keywords with any of the given normalized names
+
+        names are normalized with normalize_name. The result is a
+        list of (collection_id, collection_name, keyword_name, doc,
+        args) tuples, where args is a list.
+        """
+        raise NotImplementedError
+
+    def get_keyword_hierarchy(self, pattern="*"):
+        """Return collections matching pattern, each with its keywords
+
+        Keywords have only their name and synopsis.
+        """
+        raise NotImplementedError
+
+    def search(self, pattern="*", mode="both"):
+        """Return (collection_id, collection_name, keyword_name, synopsis) tuples"""
+        raise NotImplementedError
+
+    def get_keywords(self, pattern="*"):
+        """Return (collection_id, collection_name, keyword_name, doc, args) tuples
+
+        args is the json-encoded argument list.
+        """
+        raise NotImplementedError
+
+    def get_keyword_fields(self, columns, pattern="*", collection_id=None, after=None, limit=None,
+                           by_name=False):
+        """Return only the given columns of the keywords matching pattern
+
+        columns is a sequence of names from KEYWORD_COLUMNS; each
+        row is a tuple with their values in the same order. Only
+        the keywords of collection_id are returned, if it is given.
+        Rows are sorted by collection id, then keyword name; with
+        by_name, by keyword name and then library name, ignoring
+        case (and after can't be used).
+
+        after and limit are for reading the rows a page at a time:
+        only the rows that sort after the (collection id, keyword
+        name) in after are returned, and at most limit of them.
+        """
+        raise NotImplementedError
+
+    def iter_keyword_fields(self, columns, pattern="*", collection_id=None, chunk_size=1000):
+        """Like get_keyword_fields, but yield the rows in lists of at most chunk_size
+
+        Each list is read with a query of its own, starting after
+        the last row of the one before, so a large result is never
+        all in memory at once and nothing is held between chunks.
+        """
+        columns = tuple(columns)
+        # the columns needed to know where the next chunk starts
+        extra = tuple(column for column in ("collection_id", "name") if column not in columns)
+        query_columns = columns + extra
+        (id_index, name_index) = (query_columns.index("collection_id"), query_columns.index("name"))
+        after = None
+        while True:
+            rows = self.get_keyword_fields(query_columns, pattern, collection_id, after, chunk_size)
+            if rows:
+                yield [row[:len(columns)] for row in rows] if extra else rows
+            if len(rows) < chunk_size:
+                return
+            after = (rows[-1][id_index], rows[-1][name_index])
+
+    def get_doc_html(self, docs):
+        """Return a dictionary mapping docs to their prerendered HTML
+
+        Docs that have no prerendered HTML are left out.
+        """
+        raise NotImplementedError
+
+    def set_doc_html(self, rendered):
+        """Store prerendered HTML from an iterable of (doc, html) pairs"""
+        raise NotImplementedError
+
+    def set_usages(self, path, usages):
+        """Replace the keyword calls recorded for a file
+
+        usages is an iterable of (normalized name, name, owner,
+        line number) tuples, where owner is the test or keyword
+        making the call; see rfhub.usages.
+        """
+        raise NotImplementedError
+
+    def get_usages(self, names=None, offset=0, limit=None, path=None):
+        """Return (path, owner, line number, name) tuples of calls to any of the given names
+
+        names are normalized names; None means every call. If path
+        is given, only the calls made in that file are returned.
+        Calls are sorted by path, then by their order in the file.
+        """
+        raise NotImplementedError
+
+    def get_usage_counts(self, names=None):
+        """Return a dictionary of normalized name: number of calls"""
+        raise NotImplementedError
+
+    def reset(self):
+        """Remove all data, but leave the storage usable
+
+        The change log is kept, so versions keep going up.
+        """
+        raise NotImplementedError
+
+    def log_change(self, collection_id, name, event, keyword=None):
+        """Record that a collection (or one of its keywords) changed
+
+        event is "added", "updated" or "removed". Changes to single
+        keywords give the keyword name; they are logged before the
+        change to their collection.
+
+        Returns the new data version. Versions only ever go up.
+        """
+        raise NotImplementedError
+
+    def get_version(self):
+        """Return the current data version (0 if nothing has changed)"""
+        raise NotImplementedError
+
+    def get_changes(self, since):
+        """Return (version, collection_id, name, keyword, event) tuples newer than since
+
+        The changes are sorted by version.
+        """
+        raise NotImplementedError
+
+    def get_epoch(self):
+        """Return a string identifying this storage's change log
+
+        Versions from storages with different epochs can't be
+        compared (eg: after the hub restarts with an in-memory
+        database).
+        """
+        raise NotImplementedError
+
+
+def normalize_name(name):
+    """Normalize a keyword name the way robot does when matching keywords
+
+    Case, spaces and underscores are ignored.
+    """
+    return normalize(name, ignore="_")
+
+
+def synopsis(doc):
+    """Return the short version of a doc, which is stored with it
+
+    This is robot's short doc (the first paragraph), on one line.
+    """
+    return getshortdoc(doc.strip(), linesep=" ")
+
+
+def glob_to_regex(string):
+    """Convert a glob-style pattern to a compiled, case-insensitive regex
+
+    This follows the same rules as the SQL backend: \\* and \\?
+    are literal, and the pattern may match anywhere in the
+    string unless it begins with ^ or ends with $.
+    """
+    anchor_start = string.startswith("^")
+    anchor_end = string.endswith("$") and not string.endswith("\\$")
+    if anchor_start:
+        string = string[1:]
+    if anchor_end:
+        string = string[:-1]
+
+    parts = []
+    for token in re.findall(r'\\.|.', string, re.DOTALL):
+        if token == "*":
+            parts.append(".*")
+        elif token == "?":
+            parts.append(".")
+        elif token.startswith("\\") and len(token) == 2:
+            parts.append(re.escape(token[1]))
+        else:
+            parts.append(re.escape(token))
+
+    regex = "".join(parts)
+    regex = regex if anchor_start else ".*" + regex
+    regex = regex if anchor_end else regex + ".*"
+    return re.compile(regex, re.IGNORECASE | re.DOTALL)
+
+
+def glob_escape(string):
+    """Escape the wildcards in string, so that a pattern matches it literally"""
+    return re.sub(r"([\\*?])", r"\\\1", string)
@@ -0,0 +1,346 @@
+"""In-memory storage backend
+
+Everything lives in python dictionaries and lists, with indexes
+built for the lookups the hub does most: keywords by collection,
+keywords by name, and collections by path. Nothing is persisted,
+so this is only useful when a single process both loads and
+serves the data (ie: not with --web/--worker).
+"""
+
+import collections
+import itertools
+import json
+import operator
+import threading
+import uuid
+
+from .base import Storage, glob_to_regex, normalize_name, synopsis
+
+
+class MemoryStorage(Storage):
+    """Storage backed by python data structures"""
+
+    scheme = "memory://"
+
+    def __init__(self):
+        # watchdog events arrive on another thread, so every
+        # public method holds this lock
+        self._lock = threading.RLock()
+        self._changes = []
+        self._epoch = uuid.uuid4().hex
+        self.reset()
+
+    def add_collection(self, path, c_name, c_type, c_doc, c_version="unknown",
+                       c_scope="", c_namedargs="yes", c_doc_format="ROBOT"):
+        with self._lock:
+            collection_id = next(self._collection_ids)
+            self._collections[collection_id] = {
+                "collection_id": collection_id,
+                "name": c_name,
+                "type": c_type,
+                "version": _as_text(c_version),
+                "scope": _as_text(c_scope),
+                "namedargs": _as_text(c_namedargs),
+                "path": path,
+                "doc": c_doc,
+                "synopsis": synopsis(c_doc),
+                "doc_format": c_doc_format
+            }
+            self._keywords[collection_id] = {}
+            self._by_path.setdefault(path, []).append(collection_id)
+            self._sorted_collections = None
+            return collection_id
+
+    def add_keywords(self, collection_id, keywords):
+        """Add keywords to a collection
+
+        Identical docs and argument lists are shared between
+        keywords rather than being stored once per keyword, and
+        counted, so they can be dropped with the last keyword using
+        them.
+        """
+        with self._lock:
+            by_name = self._keywords[collection_id]
+            for (name, doc, args) in keywords:
+                # robot can't tell these apart either; keep the first
+                normalized = normalize_name(name)
+                if normalized in by_name:
+                    continue
+                argstring = json.dumps(args)
+                if argstring not in self._arglists:
+                    self._arglists[argstring] = list(args)
+                if doc not in self._docs:
+                    self._docs[doc] = doc
+                    self._synopses[doc] = synopsis(doc)
+                doc = self._docs[doc]
+                by_name[normalized] = (next(self._keyword_ids), name, doc, argstring)
+                self._doc_refs[doc] += 1
+                self._arglist_refs[argstring] += 1
+            self._sorted_keywords.pop(collection_id, None)
+            self._by_normalized_name = None
+
+    def delete_keywords(self, collection_id):
+        with self._lock:
+            collection_id = self._collection_key(collection_id)
+            if collection_id in self._keywords:
+                self._release(self._keywords[collection_id].values())
+                self._keywords[collection_id] = {}
+                self._sorted_keywords.pop(collection_id, None)
+                self._by_normalized_name = None
+
+    def delete_collections(self, path):
+        with self._lock:
+            collection_ids = self._by_path.pop(path, [])
+            for collection_id in collection_ids:
+                del self._collections[collection_id]
+                self._release(self._keywords.pop(collection_id).values())
+                self._sorted_keywords.pop(collection_id, None)
+            self._sorted_collections = None
+            self._by_normalized_name = None
+            return collection_ids
+
+    def _release(self, keywords):
+        """Forget the docs and argument lists no keyword uses any more"""
+        for (keyword_id, name, doc, argstring) in keywords:
+            self._doc_refs[doc] -= 1
+            if not self._doc_refs[doc]:
+                del self._doc_refs[doc]
+                del self._docs[doc]
+                del self._synopses[doc]
+                self._html.pop(doc, None)
+            self._arglist_refs[argstring] -= 1
+            if not self._arglist_refs[argstring]:
+                del self._arglist_refs[argstring]
+                del self._arglists[argstring]
+
+    def get_collection_ids(self, path):
+        with self._lock:
+            return list(self._by_path.get(path, []))
+
+    def get_collection(self, collection_id):
+        with self._lock:
+            collection = self._collections.get(self._collection_key(collection_id))
+            return dict(collection) if collection is not None else None
+
+    def get_collections(self, pattern="*", libtype="*"):
+        name_regex = glob_to_regex(pattern)
+        type_regex = glob_to_regex(libtype)
+        with self._lock:
+            return [{"collection_id": c["collection_id"],
+                     "name": c["name"],
+                     "synopsis": c["synopsis"],
+                     "type": c["type"],
+                     "path": c["path"]
+                     } for c in self._get_sorted_collections()
+                    if name_regex.match(c["name"]) and type_regex.match(c["type"])]
+
+    def get_keyword_data(self, collection_id):
+        with self._lock:
+            collection_id = self._collection_key(collection_id)
+            if collection_id not in self._keywords:
+                return []
+            return [(keyword_id, name, list(self._arglists[argstring]), doc)
+                    for (keyword_id, name, doc, argstring) in self._get_sorted_keywords(collection_id)]
+
+    def get_keyword(self, collection_id, name):
+        with self._lock:
+            by_name = self._keywords.get(self._collection_key(collection_id), {})
+            keyword = by_name.get(normalize_name(name))
+            if keyword is not None:
+                (keyword_id, k_name, doc, argstring) = keyword
+                return {"name": k_name,
+                        "args": list(self._arglists[argstring]),
+                        "doc": doc,
+                        "collection_id": collection_id
+                        }
+            return {}
+
+    def find_keywords(self, names):
+        with self._lock:
+            if self._by_normalized_name is None:
+                self._by_normalized_name = {}
+                for (c, keyword) in self._iter_keywords():
+                    self._by_normalized_name.setdefault(normalize_name(keyword[1]), []).append((c, keyword))
+            result = []
+            for name in set(names):
+                for (c, (keyword_id, k_name, doc, argstring)) in self._by_normalized_name.get(name, ()):
+                    result.append((c["collection_id"], c["name"], k_name, doc,
+                                   list(self._arglists[argstring])))
+            return result
+
+    def get_keyword_hierarchy(self, pattern="*"):
+        regex = glob_to_regex(pattern)
+        with self._lock:
+            libraries = []
+            for c in self._get_sorted_collections():
+                keywords = self._get_sorted_keywords(c["collection_id"])
+                if keywords and regex.match(c["name"]):
+                    libraries.append({"name": c["name"], "collection_id": c["collection_id"],
+                                      "path": c["path"],
+                                      "keywords": [{"name": name, "synopsis": self._synopses[doc]}
+                                                   for (keyword_id, name, doc, argstring) in keywords]})
+            return libraries
+
+    def search(self, pattern="*", mode="both"):
+        regex = glob_to_regex(pattern)
+        with self._lock:
+            result = set()
+            for (c, keyword) in self._iter_keywords():
+                (keyword_id, name, doc, argstring) = keyword
+                if regex.match(name) or (mode != "name" and regex.match(doc)):
+                    result.add((c["collection_id"], c["name"], name, self._synopses[doc]))
+            return list(result)
+
+    def get_keywords(self, pattern="*"):
+        regex = glob_to_regex(pattern)
+        with self._lock:
+            return list(set((c["collection_id"], c["name"], name, doc, argstring)
+                            for (c, (keyword_id, name, doc, argstring)) in self._iter_keywords()
+                            if regex.match(name)))
+
+    def get_keyword_fields(self, columns, pattern="*", collection_id=None, after=None, limit=None,
+                           by_name=False):
+        with self._lock:
+            if collection_id is not None:
+                collection_ids = [self._collection_key(collection_id)]
+            else:
+                collection_ids = sorted(self._collections)
+            regex = glob_to_regex(pattern)
+            rows = []
+            for c_id in collection_ids:
+                if c_id not in self._collections or (after is not None and c_id < after[0]):
+                    continue
+                c_name = self._collections[c_id]["name"]
+                for (keyword_id, name, doc, argstring) in self._get_sorted_keywords(c_id):
+                    if after is not None and c_id == after[0] and name <= after[1]:
+                        continue
+                    if regex.match(name):
+                        if limit is not None and len(rows) >= limit and not by_name:
+                            return rows
+                        values = {"collection_id": c_id, "library": c_name, "name": name,
+                                  "synopsis": self._synopses[doc], "doc": doc, "args": argstring}
+                        row = tuple(values[column] for column in columns)
+                        rows.append(((name.lower(), c_name.lower()), row) if by_name else row)
+            if by_name:
+                rows = [row for (key, row) in sorted(rows, key=operator.itemgetter(0))[:limit]]
+            return rows
+
+    def get_doc_html(self, docs):
+        with self._lock:
+            return dict((doc, self._html[doc]) for doc in docs if doc in self._html)
+
+    def set_doc_html(self, rendered):
+        with self._lock:
+            self._html.update(rendered)
+
+    def set_usages(self, path, usages):
+        with self._lock:
+            for normalized in set(usage[0] for usage in self._usages.pop(path, ())):
+                calls = [call for call in self._usages_by_name[normalized] if call[0] != path]
+                if calls:
+                    self._usages_by_name[normalized] = calls
+                else:
+                    del self._usages_by_name[normalized]
+            usages = [tuple(usage) for usage in usages]
+            if usages:
+                self._usages[path] = usages
+            for (position, (normalized, name, owner, lineno)) in enumerate(usages):
+                self._usages_by_name.setdefault(normalized, []).append((path, position, owner, lineno, name))
+
+    def get_usages(self, names=None, offset=0, limit=None, path=None):
+        with self._lock:
+            if path is not None:
+                calls = [(path, position, owner, lineno, name)
+                         for (position, (normalized, name, owner, lineno)) in enumerate(self._usages.get(path, ()))
+                         if names is None or normalized in names]
+            else:
+                if names is None:
+                    names = list(self._usages_by_name)
+                calls = sorted(call for name in set(names) for call in self._usages_by_name.get(name, ()))
+        calls = calls[offset:None if limit is None else offset + limit]
+        return [(path, owner, lineno, name) for (path, position, owner, lineno, name) in calls]
+
+    def get_usage_counts(self, names=None):
+        with self._lock:
+            if names is None:
+                names = list(self._usages_by_name)
+            return dict((name, len(self._usages_by_name[name])) for name in names
+                        if name in self._usages_by_name)
+
+    def reset(self):
+        with self._lock:
+            # path: [(normalized name, name, owner, line number)]
+            self._usages = {}
+            # normalized name: [(path, position in file, owner, line number, name)]
+            self._usages_by_name = {}
+            self._collections = {}
+            self._keywords = {}
+            self._by_path = {}
+            self._docs = {}
+            # doc: synopsis, for every doc in _docs
+            self._synopses = {}
+            self._arglists = {}
+            self._html = {}
+            # how many keywords use each doc and argument list
+            self._doc_refs = collections.Counter()
+            self._arglist_refs = collections.Counter()
+            self._collection_ids = itertools.count(1)
+            self._keyword_ids = itertools.count(1)
+            self._sorted_collections = None
+            self._sorted_keywords = {}
+            # normalized keyword name: [(collection, keyword)], built when needed
+            self._by_normalized_name = None
+
+    def log_change(self, collection_id, name, event, keyword=None):
+        with self._lock:
+            version = len(self._changes) + 1
+            self._changes.append((version, collection_id, name, keyword, event))
+            return version
+
+    def get_version(self):
+        with self._lock:
+            return len(self._changes)
+
+    def get_changes(self, since):
+        with self._lock:
+            # versions are list positions, so no need to search
+            return self._changes[max(0, int(since)):]
+
+    def get_epoch(self):
+        return self._epoch
+
+    def _iter_keywords(self):
+        """Generate (collection, keyword) pairs for every keyword"""
+        for c in self._get_sorted_collections():
+            for keyword in self._keywords[c["collection_id"]].values():
+                yield (c, keyword)
+
+    def _get_sorted_collections(self):
+        """Return all collections sorted by name, computed only after changes"""
+        if self._sorted_collections is None:
+            self._sorted_collections = sorted(self._collections.values(),
+                                              key=lambda c: (c["name"], c["collection_id"]))
+        return self._sorted_collections
+
+    def _get_sorted_keywords(self, collection_id):
+        """Return the keywords of a collection sorted by name"""
+        if collection_id not in self._sorted_keywords:
+            self._sorted_keywords[collection_id] = sorted(self._keywords[collection_id].values(),
+                                                          key=lambda keyword: keyword[1])
+        return self._sorted_keywords[collection_id]
+
+    def _collection_key(self, collection_id):
+        """Collection ids often arrive as strings from urls"""
+        try:
+            return int(collection_id)
+        except (TypeError, ValueError):
+            return None
+
+
+def _as_text(value):
+    """Convert a value the way a Text column in SQLite would"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return str(int(value))
+    return str(value)
@@ -0,0 +1,182 @@
+"""Replicated storage: writes go to a primary, queries to replicas
+
+This is for deployments where a --worker loads keywords into a
+primary database, and many --web hubs answer queries from read
+replicas of it (see --db-read).
+
+Each thread reads from one replica, so that the queries made for one
+request see the same data: replicas may lag the primary by different
+amounts, and a data version read from one replica says nothing about
+another. A list read a chunk at a time (see iter_keyword_fields) is
+read from one replica, whichever threads read the chunks. Threads are spread over the replicas in turn. A replica that
+can't be reached is skipped for a while; if none can, queries go to
+the primary. Other errors are the query's fault, and are raised.
+"""
+
+import itertools
+import logging
+import random
+import threading
+import time
+
+from sqlalchemy.exc import DBAPIError, DisconnectionError, OperationalError
+
+from .base import Storage
+
+
+class ReplicatedStorage(Storage):
+    """Storage that writes to one backend and reads from others"""
+
+    def __init__(self, primary, replicas, retry_seconds=30):
+        self._primary = primary
+        self.replicas = list(replicas)
+        self.retry_seconds = retry_seconds
+        self.log = logging.getLogger(__name__)
+        # so that hubs started together don't all pick the same replica
+        self._turn = itertools.count(random.randrange(len(self.replicas)))
+        # replica index: when it may be tried again
+        self._down = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self._primary
+
+    def add_collection(self, *args, **kwargs):
+        return self._primary.add_collection(*args, **kwargs)
+
+    def add_keywords(self, collection_id, keywords):
+        return self._primary.add_keywords(collection_id, keywords)
+
+    def delete_keywords(self, collection_id):
+        return self._primary.delete_keywords(collection_id)
+
+    def delete_collections(self, path):
+        return self._primary.delete_collections(path)
+
+    def set_doc_html(self, rendered):
+        return self._primary.set_doc_html(rendered)
+
+    def set_usages(self, path, usages):
+        return self._primary.set_usages(path, usages)
+
+    def reset(self):
+        return self._primary.reset()
+
+    def log_change(self, collection_id, name, event, keyword=None):
+        return self._primary.log_change(collection_id, name, event, keyword)
+
+    def get_epoch(self):
+        return self._primary.get_epoch()
+
+    def get_collection_ids(self, path):
+        # only asked when reloading or removing files, before writing
+        return self._primary.get_collection_ids(path)
+
+    def get_collection(self, collection_id):
+        return self._read("get_collection", collection_id)
+
+    def get_collections(self, pattern="*", libtype="*"):
+        return self._read("get_collections", pattern, libtype)
+
+    def get_keyword_data(self, collection_id):
+        return self._read("get_keyword_data", collection_id)
+
+    def get_keyword(self, collection_id, name):
+        return self._read("get_keyword", collection_id, name)
+
+    def find_keywords(self, names):
+        return self._read("find_keywords", names)
+
+    def get_keyword_hierarchy(self, pattern="*"):
+        return self._read("get_keyword_hierarchy", pattern)
+
+    def search(self, pattern="*", mode="both"):
+        return self._read("search", pattern, mode)
+
+    def get_keywords(self, pattern="*"):
+        return self._read("get_keywords", pattern)
+
+    def get_keyword_fields(self, columns, pattern="*", collection_id=None, after=None, limit=None,
+                           by_name=False):
+        return self._read("get_keyword_fields", columns, pattern, collection_id, after, limit, by_name)
+
+    def iter_keyword_fields(self, columns, pattern="*", collection_id=None, chunk_size=1000):
+        """Read every chunk of the list from the same replica
+
+        The chunks may be read on different threads (see
+        rfhub.handlers.KeywordsHandler), and pages read from replicas
+        that lag by different amounts could repeat or miss keywords.
+        A replica that fails part way through can't be replaced by
+        another, so the error is raised.
+        """
+        index = self._replica()
+        storage = self._primary if index is None else self.replicas[index]
+        try:
+            for rows in storage.iter_keyword_fields(columns, pattern, collection_id, chunk_size):
+                yield rows
+        except (DBAPIError, DisconnectionError) as e:
+            if index is not None and _is_connection_error(e):
+                self._skip(index, e)
+            raise
+
+    def get_doc_html(self, docs):
+        return self._read("get_doc_html", docs)
+
+    def get_usages(self, names=None, offset=0, limit=None, path=None):
+        return self._read("get_usages", names, offset, limit, path)
+
+    def get_usage_counts(self, names=None):
+        return self._read("get_usage_counts", names)
+
+    def get_version(self):
+        return self._read("get_version")
+
+    def get_changes(self, since):
+        return self._read("get_changes", since)
+
+    def _read(self, method, *args):
+        """Call a query method on this thread's replica, or the primary"""
+        for attempt in range(len(self.replicas)):
+            index = self._replica()
+            if index is None:
+                break
+            try:
+                return getattr(self.replicas[index], method)(*args)
+            except (DBAPIError, DisconnectionError) as e:
+                # errors in the query itself (eg: DataError) would
+                # fail on the primary just the same
+                if not _is_connection_error(e):
+                    raise
+                self._skip(index, e)
+        return getattr(self._primary, method)(*args)
+
+    def _skip(self, index, error):
+        """Stop reading from a replica that can't be reached for a while"""
+        self.log.warning("read replica %d failed, skipping it for %ds: %s",
+                         index, self.retry_seconds, error)
+        with self._lock:
+            self._down[index] = time.monotonic() + self.retry_seconds
+        self._local.replica = None
+
+    def _replica(self):
+        """Return the index of the replica this thread reads from, or None"""
+        now = time.monotonic()
+        index = getattr(self._local, "replica", None)
+        with self._lock:
+            if index is None or self._down.get(index, 0) > now:
+                index = None
+                for attempt in range(len(self.replicas)):
+                    candidate = next(self._turn) % len(self.replicas)
+                    if self._down.get(candidate, 0) <= now:
+                        index = candidate
+                        break
+        self._local.replica = index
+        return index
+
+
+def _is_connection_error(error):
+    """Return True if a database error means the database couldn't be reached"""
+    return (isinstance(error, (DisconnectionError, OperationalError)) or
+            getattr(error, "connection_invalidated", False))
@@ -0,0 +1,637 @@
+"""SQLAlchemy storage backend
+
+This works with any database SQLAlchemy supports; the hub is
+tested against SQLite and PostgreSQL.
+"""
+
+import functools
+import hashlib
+import json
+import re
+import threading
+import uuid
+
+from sqlalchemy import (and_, or_, func, inspect, create_engine, Column, ForeignKey, Index, Integer, MetaData,
+                        Sequence, Table, Text)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import bindparam, select
+
+from .base import Storage, normalize_name, synopsis
+
+
+def serialized(method):
+    """Run a storage method while holding the storage lock
+
+    The watchdog observer updates the database from its own thread
+    while requests read it, and they all share one connection.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class SqlStorage(Storage):
+    """Storage backed by a relational database"""
+
+    def __init__(self, conn_string, read_only=False):
+        # read-only storages (eg: read replicas) never create or
+        # drop tables, or anything else; it's up to the primary
+        self.read_only = read_only
+        connect_args = {}
+        if conn_string.startswith("sqlite"):
+            # the connection is shared by all threads, guarded by _lock
+            connect_args["check_same_thread"] = False
+        self._engine = create_engine(conn_string, connect_args=connect_args)
+        self.db = self._engine.connect()
+        self._lock = threading.RLock()
+        self._create_db()
+        # read replicas may not have caught up with the primary yet,
+        # so their epoch is only read when asked for
+        self._epoch = None if read_only else self._load_epoch()
+
+        # docs and argument lists are stored once per unique value
+        # (keyed by a hash of the value). These remember which hashes
+        # we know are already in the database, and the parsed form
+        # of each argument list, so we don't have to ask the database
+        # or call json.loads over and over.
+        self._interned = {"docs": set(), "args": set()}
+        self._args_cache = {}
+
+    @serialized
+    def add_collection(self, path, c_name, c_type, c_doc, c_version="unknown",
+                       c_scope="", c_namedargs="yes", c_doc_format="ROBOT"):
+        insert = self.collections.insert()\
+            .values(name=c_name, type=c_type, version=c_version, scope=c_scope, namedargs=c_namedargs,
+                    path=path, doc=c_doc, synopsis=synopsis(c_doc), doc_format=c_doc_format)
+        result = self.db.execute(insert)
+        return result.inserted_primary_key[0]
+
+    @serialized
+    def add_keywords(self, collection_id, keywords):
+        """Insert keywords with a single multi-row statement
+
+        'args' should be a list, but since we can't store a list in an
+        sqlite database we'll make it json we can can convert it back
+        to a list later.
+
+        The doc and the json args are stored in their own tables,
+        keyed by a hash of their contents, so that keywords with
+        identical documentation or signatures share a single row.
+
+        Robot can't tell apart keywords whose names only differ in
+        case, spaces or underscores, so only the first of those is kept.
+        """
+        seen = set()
+        unique = []
+        for (name, doc, args) in keywords:
+            normalized = normalize_name(name)
+            if normalized not in seen:
+                seen.add(normalized)
+                unique.append((name, normalized, doc, json.dumps(args)))
+        keywords = [(name, doc, argstring) for (name, normalized, doc, argstring) in unique]
+        doc_ids = self._intern("docs", self.docs, [doc for (name, doc, argstring) in keywords])
+        args_ids = self._intern("args", self.arglists, [argstring for (name, doc, argstring) in keywords])
+        rows = [{"collection_id": collection_id, "name": name, "name_normalized": normalized,
+                 "synopsis": synopsis(doc), "doc_id": doc_id, "args_id": args_id}
+                for ((name, normalized, doc, argstring), doc_id, args_id) in zip(unique, doc_ids, args_ids)]
+        if rows:
+            try:
+                self.db.execute(self.keywords.insert(), rows)
+            except IntegrityError:
+                # the collection already has some of these keywords
+                dropped = []
+                for row in rows:
+                    try:
+                        self.db.execute(self.keywords.insert().values(row))
+                    except IntegrityError:
+                        dropped.append(row)
+                self._prune("docs", self.docs, self.keywords.c.doc_id, set(row["doc_id"] for row in dropped))
+                self._prune("args", self.arglists, self.keywords.c.args_id, set(row["args_id"] for row in dropped))
+
+    @serialized
+    def delete_keywords(self, collection_id):
+        self._delete_keywords(self.keywords.c.collection_id == collection_id)
+
+    @serialized
+    def delete_collections(self, path):
+        collection_ids = self.get_collection_ids(path)
+        if collection_ids:
+            self._delete_keywords(self.keywords.c.collection_id.in_(collection_ids))
+            self.db.execute(self.collections.delete().where(self.collections.c.collection_id.in_(collection_ids)))
+        return collection_ids
+
+    def _delete_keywords(self, where):
+        """Delete the keywords matching where, and the docs and args only they used"""
+        query = select([self.keywords.c.doc_id, self.keywords.c.args_id]).where(where)
+        rows = self.db.execute(query).fetchall()
+        self.db.execute(self.keywords.delete().where(where))
+        self._prune("docs", self.docs, self.keywords.c.doc_id, set(row[0] for row in rows))
+        self._prune("args", self.arglists, self.keywords.c.args_id, set(row[1] for row in rows))
+
+    @serialized
+    def get_collection_ids(self, path):
+        query = select([self.collections.c.collection_id]).where(self.collections.c.path == path)
+        return [row[0] for row in self.db.execute(query)]
+
+    @serialized
+    def get_collection(self, collection_id):
+        query = select([self.collections]) \
+            .where(self.collections.c.collection_id == collection_id)
+        # need to handle the case where we get more than one result...
+        sql_result = self.db.execute(query).fetchone()
+        if sql_result is not None:
+            return dict((column.name, sql_result[column]) for column in self.collections.columns)
+
+    @serialized
+    def get_collections(self, pattern="*", libtype="*"):
+        query = select([
+            self.collections.c.collection_id,
+            self.collections.c.name,
+            self.collections.c.synopsis,
+            self.collections.c.type,
+            self.collections.c.path]
+        ).where(
+            and_(
+                self._like(self.collections.c.name, pattern),
+                self._like(self.collections.c.type, libtype)
+            )
+        ).order_by(self.collections.c.name)
+
+        result = self.db.execute(query)
+        return [{"collection_id": result[0],
+                 "name": result[1],
+                 "synopsis": result[2],
+                 "type": result[3],
+                 "path": result[4]
+                 } for result in result]
+
+    @serialized
+    def get_keyword_data(self, collection_id):
+        query = select([
+            self.keywords.c.keyword_id, self.keywords.c.name,
+            self.arglists.c.args_id, self.arglists.c.args, self.docs.c.doc
+        ]).select_from(
+            self.keywords.join(self.docs).join(self.arglists)
+        ).where(
+            self.keywords.c.collection_id == collection_id
+        ).order_by(self.keywords.c.name)
+
+        result = self.db.execute(query)
+        return [(row[0], row[1], self._parse_args(row[2], row[3]), row[4])
+                for row in result.fetchall()]
+
+    @serialized
+    def get_keyword(self, collection_id, name):
+        query = select([
+            self.keywords.c.name, self.arglists.c.args_id, self.arglists.c.args, self.docs.c.doc
+        ]).select_from(
+            self.keywords.join(self.docs).join(self.arglists)
+        ).where(
+            and_(
+                self.keywords.c.collection_id == collection_id,
+                self.keywords.c.name_normalized == normalize_name(name)
+            )
+        )
+
+        # (collection_id, name_normalized) is unique, so there is at most one
+        row = self.db.execute(query).fetchone()
+        if row is not None:
+            return {"name": row[0],
+                    "args": self._parse_args(row[1], row[2]),
+                    "doc": row[3],
+                    "collection_id": collection_id
+                    }
+        return {}
+
+    @serialized
+    def find_keywords(self, names):
+        names = list(set(names))
+        result = []
+        for i in range(0, len(names), 500):
+            query = select([
+                self.collections.c.collection_id,
+                self.collections.c.name,
+                self.keywords.c.name,
+                self.docs.c.doc,
+                self.arglists.c.args_id,
+                self.arglists.c.args
+            ]).select_from(
+                self.collections.join(self.keywords).join(self.docs).join(self.arglists)
+            ).where(
+                self.keywords.c.name_normalized.in_(names[i:i + 500])
+            )
+            result.extend((row[0], row[1], row[2], row[3], self._parse_args(row[4], row[5]))
+                          for row in self.db.execute(query))
+        return result
+
+    @serialized
+    def get_keyword_hierarchy(self, pattern="*"):
+        query = select([
+            self.collections.c.collection_id,
+            self.collections.c.name,
+            self.collections.c.path,
+            self.keywords.c.name,
+            self.keywords.c.synopsis
+        ]).select_from(
+            self.collections.join(self.keywords)
+        ).where(
+            self._like(self.collections.c.name, pattern)
+        ).order_by(
+            self.collections.c.name, self.collections.c.collection_id, self.keywords.c.name
+        )
+        result = self.db.execute(query)
+        libraries = []
+        current_library = None
+        for row in result.fetchall():
+            (c_id, c_name, c_path, k_name, k_synopsis) = row
+            if c_id != current_library:
+                current_library = c_id
+                libraries.append({"name": c_name, "collection_id": c_id, "keywords": [], "path": c_path})
+            libraries[-1]["keywords"].append({"name": k_name, "synopsis": k_synopsis})
+        return libraries
+
+    @serialized
+    def search(self, pattern="*", mode="both"):
+        where_clause = or_(
+                self._like(self.keywords.c.name, pattern),
+                self._like(self.docs.c.doc, pattern)
+            )
+        if mode == "name":
+            where_clause = self._like(self.keywords.c.name, pattern)
+
+        query = select([
+            self.collections.c.collection_id,
+            self.collections.c.name,
+            self.keywords.c.name,
+            self.keywords.c.synopsis
+        ]).select_from(
+            self.collections.join(self.keywords).join(self.docs)
+        ).where(
+            where_clause
+        ).order_by(
+            self.collections.c.collection_id, self.collections.c.name, self.keywords.c.name
+        )
+
+        cursor = self.db.execute(query)
+        result = [(row[0], row[1], row[2], row[3]) for row in cursor]
+        return list(set(result))
+
+    @serialized
+    def get_keywords(self, pattern="*"):
+        query = select([
+            self.collections.c.collection_id,
+            self.collections.c.name,
+            self.keywords.c.name,
+            self.docs.c.doc,
+            self.arglists.c.args
+        ]).select_from(
+            self.collections.join(self.keywords).join(self.docs).join(self.arglists)
+        ).where(
+            self._like(self.keywords.c.name, pattern)
+        ).order_by(
+            self.collections.c.name, self.keywords.c.name
+        )
+        cursor = self.db.execute(query)
+        result = [(row[0], row[1], row[2], row[3], row[4])
+                  for row in cursor]
+        return list(set(result))
+
+    @serialized
+    def get_keyword_fields(self, columns, pattern="*", collection_id=None, after=None, limit=None,
+                           by_name=False):
+        available = {
+            "collection_id": self.keywords.c.collection_id,
+            "library": self.collections.c.name,
+            "name": self.keywords.c.name,
+            "synopsis": self.keywords.c.synopsis,
+            "doc": self.docs.c.doc,
+            "args": self.arglists.c.args
+        }
+        # only join the tables the columns come from
+        source = self.keywords
+        if "library" in columns or by_name:
+            source = source.join(self.collections)
+        if "doc" in columns:
+            source = source.join(self.docs)
+        if "args" in columns:
+            source = source.join(self.arglists)
+
+        query = select([available[column] for column in columns]).select_from(source)
+        if pattern not in ("*", ""):
+            query = query.where(self._like(self.keywords.c.name, pattern))
+        if collection_id is not None:
+            try:
+                query = query.where(self.keywords.c.collection_id == int(collection_id))
+            except ValueError:
+                return []
+        if after is not None:
+            (after_id, after_name) = after
+            query = query.where(or_(self.keywords.c.collection_id > after_id,
+                                    and_(self.keywords.c.collection_id == after_id,
+                                         self.keywords.c.name > after_name)))
+        if by_name:
+            query = query.order_by(func.lower(self.keywords.c.name), func.lower(self.collections.c.name))
+        else:
+            query = query.order_by(self.keywords.c.collection_id, self.keywords.c.name)
+        if limit is not None:
+            query = query.limit(limit)
+        # these are all plain text and integer columns, which need none of
+        # SQLAlchemy's result processing; the rows of the DBAPI cursor
+        # are several times faster to read for large catalogs
+        result = self.db.execute(query)
+        try:
+            return [tuple(row) for row in result.cursor.fetchall()]
+        finally:
+            result.close()
+
+    @serialized
+    def get_doc_html(self, docs):
+        keys = dict((self._hash(doc), doc) for doc in docs)
+        rendered = {}
+        # chunked, since some databases limit the number of
+        # parameters in a single statement
+        key_list = list(keys)
+        for i in range(0, len(key_list), 500):
+            query = select([self.docs.c.doc_id, self.docs.c.html]).where(
+                and_(
+                    self.docs.c.doc_id.in_(key_list[i:i + 500]),
+                    self.docs.c.html.isnot(None)
+                )
+            )
+            for (doc_id, html) in self.db.execute(query):
+                rendered[keys[doc_id]] = html
+        return rendered
+
+    @serialized
+    def set_doc_html(self, rendered):
+        rows = [{"key": self._hash(doc), "html": html} for (doc, html) in rendered]
+        if rows:
+            update = self.docs.update()\
+                .where(self.docs.c.doc_id == bindparam("key"))\
+                .values(html=bindparam("html"))
+            self.db.execute(update, rows)
+
+    @serialized
+    def set_usages(self, path, usages):
+        self.db.execute(self.usages.delete().where(self.usages.c.path == path))
+        rows = [{"path": path, "name_normalized": normalized, "name": name, "owner": owner, "lineno": lineno}
+                for (normalized, name, owner, lineno) in usages]
+        if rows:
+            self.db.execute(self.usages.insert(), rows)
+
+    @serialized
+    def get_usages(self, names=None, offset=0, limit=None, path=None):
+        query = select([self.usages.c.path, self.usages.c.owner, self.usages.c.lineno, self.usages.c.name])
+        if names is not None:
+            query = query.where(self.usages.c.name_normalized.in_(list(names)))
+        if path is not None:
+            query = query.where(self.usages.c.path == path)
+        query = query.order_by(self.usages.c.path, self.usages.c.usage_id).offset(offset).limit(limit)
+        return [tuple(row) for row in self.db.execute(query)]
+
+    @serialized
+    def get_usage_counts(self, names=None):
+        query = select([self.usages.c.name_normalized, func.count()])
+        if names is not None:
+            query = query.where(self.usages.c.name_normalized.in_(list(names)))
+        query = query.group_by(self.usages.c.name_normalized)
+        return dict(tuple(row) for row in self.db.execute(query))
+
+    @serialized
+    def reset(self):
+        self.db.execute(self.usages.delete())
+        self.db.execute(self.keywords.delete())
+        self.db.execute(self.docs.delete())
+        self.db.execute(self.arglists.delete())
+        self.db.execute(self.collections.delete())
+        self._interned = {"docs": set(), "args": set()}
+        self._args_cache = {}
+
+    @serialized
+    def log_change(self, collection_id, name, event, keyword=None):
+        insert = self.changes.insert().values(collection_id=collection_id, name=name,
+                                              keyword=keyword, event=event)
+        return self.db.execute(insert).inserted_primary_key[0]
+
+    @serialized
+    def get_version(self):
+        return self.db.execute(select([func.max(self.changes.c.version)])).scalar() or 0
+
+    @serialized
+    def get_changes(self, since):
+        query = select([
+            self.changes.c.version,
+            self.changes.c.collection_id,
+            self.changes.c.name,
+            self.changes.c.keyword,
+            self.changes.c.event
+        ]).where(
+            self.changes.c.version > since
+        ).order_by(
+            self.changes.c.version
+        )
+        return [tuple(row) for row in self.db.execute(query)]
+
+    def get_epoch(self):
+        if self._epoch is None:
+            with self._lock:
+                self._epoch = self._load_epoch()
+        return self._epoch
+
+    def _load_epoch(self):
+        """Return the epoch stored in the database, creating it if need be
+
+        Every process sharing the database (eg: --web and --worker)
+        sees the same epoch.
+        """
+        query = select([self.info.c.value]).where(self.info.c.name == "epoch")
+        epoch = self.db.execute(query).scalar()
+        if epoch is None and not self.read_only:
+            try:
+                self.db.execute(self.info.insert().values(name="epoch", value=uuid.uuid4().hex))
+            except IntegrityError:
+                # another process got there first
+                pass
+            epoch = self.db.execute(query).scalar()
+        return epoch
+
+    def _intern(self, kind, table, values):
+        """Store values in a content-addressed table, returning their hashes
+
+        Values are only inserted if we haven't seen their hash before.
+        """
+        keys = [self._hash(value) for value in values]
+        new = dict((key, value) for (key, value) in zip(keys, values)
+                   if key not in self._interned[kind])
+        if new:
+            id_column, value_column = list(table.c)[:2]
+            new_keys = list(new)
+            for i in range(0, len(new_keys), 500):
+                query = select([id_column]).where(id_column.in_(new_keys[i:i + 500]))
+                for row in self.db.execute(query):
+                    del new[row[0]]
+            if new:
+                try:
+                    self.db.execute(table.insert(), [{id_column.name: key, value_column.name: value}
+                                                     for (key, value) in new.items()])
+                except IntegrityError:
+                    # another process (eg: a worker sharing this
+                    # database) inserted some of the same values
+                    # first, so fall back to one row at a time
+                    for (key, value) in new.items():
+                        try:
+                            self.db.execute(table.insert().values({id_column.name: key,
+                                                                   value_column.name: value}))
+                        except IntegrityError:
+                            pass
+            self._interned[kind].update(new_keys)
+        return keys
+
+    def _prune(self, kind, table, reference, keys):
+        """Delete the rows of a content-addressed table that no keyword refers to any more
+
+        Only the given keys are checked; they are the ones used by
+        the keywords that were just deleted.
+        """
+        id_column = list(table.c)[0]
+        keys = list(keys)
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            query = select([reference]).where(reference.in_(chunk)).distinct()
+            unused = set(chunk).difference(row[0] for row in self.db.execute(query))
+            if unused:
+                self.db.execute(table.delete().where(id_column.in_(list(unused))))
+                self._interned[kind].difference_update(unused)
+                if kind == "args":
+                    for key in unused:
+                        self._args_cache.pop(key, None)
+
+    def _hash(self, value):
+        return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+    def _parse_args(self, args_id, argstring):
+        """Return the list form of a json args string, parsing it only once"""
+        if args_id not in self._args_cache:
+            self._args_cache[args_id] = json.loads(argstring)
+        return list(self._args_cache[args_id])
+
+    def _create_db(self):
+        self._metadata = MetaData()
+        self.collections = Table("collections", self._metadata,
+                                 Column("collection_id", Integer, Sequence('collection_id_seq'), primary_key=True),
+                                 Column('name', Text, index=True),
+                                 Column('type', Text),
+                                 Column('version', Text),
+                                 Column('scope', Text),
+                                 Column('namedargs', Text),
+                                 Column('path', Text),
+                                 Column('doc', Text),
+                                 # the short version of doc; see synopsis()
+                                 Column('synopsis', Text),
+                                 Column('doc_format', Text)
+                                 )
+        self.docs = Table("keyword_docs", self._metadata,
+                          Column("doc_id", Text, primary_key=True),
+                          Column('doc', Text),
+                          # prerendered HTML; only filled in for snapshots
+                          Column('html', Text)
+                          )
+        self.arglists = Table("keyword_args", self._metadata,
+                              Column("args_id", Text, primary_key=True),
+                              Column('args', Text)
+                              )
+        self.keywords = Table("keywords", self._metadata,
+                              Column("keyword_id", Integer, Sequence('keyword_id_seq'), primary_key=True),
+                              Column('name', Text, index=True),
+                              # the name as robot matches it; see normalize_name
+                              Column('name_normalized', Text, index=True),
+                              # the short version of the doc; see synopsis()
+                              Column('synopsis', Text),
+                              Column('collection_id', Integer, ForeignKey('collections.collection_id')),
+                              Column('doc_id', Text, ForeignKey('keyword_docs.doc_id')),
+                              Column('args_id', Text, ForeignKey('keyword_args.args_id')),
+                              Index('keyword_collection_name_normalized',
+                                    'collection_id', 'name_normalized', unique=True)
+                              )
+        # every change to a collection, for clients that want to
+        # know what changed (see KeywordTable.get_changes)
+        self.changes = Table("changes", self._metadata,
+                             Column("version", Integer, Sequence('change_version_seq'), primary_key=True),
+                             Column('collection_id', Integer),
+                             Column('name', Text),
+                             Column('keyword', Text),
+                             Column('event', Text),
+                             sqlite_autoincrement=True
+                             )
+        # keyword calls made by test suites and resource files;
+        # see rfhub.usages
+        self.usages = Table("keyword_usages", self._metadata,
+                            Column("usage_id", Integer, Sequence('usage_id_seq'), primary_key=True),
+                            Column('path', Text, index=True),
+                            Column('name_normalized', Text, index=True),
+                            Column('name', Text),
+                            Column('owner', Text),
+                            Column('lineno', Integer)
+                            )
+        self.info = Table("storage_info", self._metadata,
+                          Column("name", Text, primary_key=True),
+                          Column('value', Text)
+                          )
+        if not self.read_only:
+            self._drop_outdated_tables()
+            self._metadata.create_all(bind=self._engine)
+
+    def _drop_outdated_tables(self):
+        """Drop the tables if they were created by an older version of the hub
+
+        Everything in the database can be loaded again from the files
+        and libraries it came from, so rather than migrating the old
+        tables, they are dropped and created again.
+        """
+        inspector = inspect(self.db)
+        existing = set(inspector.get_table_names())
+        for table in self._metadata.sorted_tables:
+            if table.name in existing:
+                columns = set(column["name"] for column in inspector.get_columns(table.name))
+                if not set(table.c.keys()) <= columns:
+                    self._metadata.drop_all(bind=self.db, tables=[t for t in self._metadata.sorted_tables
+                                                                  if t.name in existing])
+                    return
+
+    def _glob_to_sql(self, string):
+        """Convert a glob-like pattern to a LIKE pattern, escaped with \\
+
+        * becomes % and ? becomes _; every other character matches
+        itself, including % and _, and \\*, \\? and \\\\ (see
+        glob_to_regex).
+
+        This also adds a leading and trailing %, unless the pattern begins with
+        ^ or ends with $
+        """
+        anchor_start = string.startswith("^")
+        anchor_end = string.endswith("$") and not string.endswith("\\$")
+        if anchor_start:
+            string = string[1:]
+        if anchor_end:
+            string = string[:-1]
+
+        parts = []
+        for token in re.findall(r'\\.|.', string, re.DOTALL):
+            if token == "*":
+                parts.append("%")
+            elif token == "?":
+                parts.append("_")
+            else:
+                char = token[1] if len(token) == 2 else token
+                parts.append("\\" + char if char in "%_\\" else char)
+
+        string = "".join(parts)
+        string = string if anchor_start else "%" + string
+        string = string if anchor_end else string + "%"
+        return string
+
+    def _like(self, column, pattern):
+        """Match column against a glob-like pattern, ignoring case"""
+        return column.ilike(self._glob_to_sql(pattern), escape="\\")
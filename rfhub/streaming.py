@@ -0,0 +1,25 @@
+"""streaming - send large json lists a piece at a time
+
+A list of every keyword in a big catalog is tens of megabytes of
+json. Rather than building the whole list, and then the whole json
+string, list endpoints read and encode it a chunk at a time (see
+Storage.iter_keyword_fields), and send each piece as it is ready.
+"""
+
+import json
+
+
+def encode_list(name, chunks):
+    """Yield the json of {name: [items]}, one piece per chunk of items
+
+    chunks is an iterable of lists of items. The pieces joined
+    together are the same as json.dumps({name: items}, sort_keys=True).
+    """
+    yield '{%s: [' % json.dumps(name)
+    first = True
+    for chunk in chunks:
+        if chunk:
+            items = ", ".join(json.dumps(item, sort_keys=True) for item in chunk)
+            yield items if first else ", " + items
+            first = False
+    yield "]}"
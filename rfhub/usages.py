@@ -0,0 +1,170 @@
+"""usages - find where keywords are called
+
+With --index-usages, the hub parses every test suite and resource
+file it loads (test suites too, which otherwise have no keywords to
+offer) and stores the keyword calls each one makes: steps, setups
+and teardowns, and templates.
+
+Calls are stored by name, the way robot matches them (see
+normalize_name), and are matched to keywords when asked for: a call
+to "Login" is a usage of every keyword named Login, and a call to
+"common.Login" only of the one in the collection named common. This
+means the index never has to change when libraries are loaded or
+reloaded. Calls made by other keywords (eg: Run Keyword) and to
+keywords with embedded arguments aren't found.
+"""
+
+import os
+import re
+
+from robot.errors import DataError
+
+from rfhub.storage.base import normalize_name
+
+try:
+    # robot >= 3.2
+    from robot.parsing import ModelVisitor, get_model
+except ImportError:
+    ModelVisitor = object
+    get_model = None
+
+# the files calls are looked for in
+USAGE_SUFFIXES = (".robot", ".txt", ".tsv", ".resource")
+
+# robot ignores these prefixes when looking for a keyword
+BDD_PREFIX = re.compile(r"^(given|when|then|and|but)\s+", re.IGNORECASE)
+
+
+def is_usage_file(path):
+    return os.path.splitext(path)[1].lower() in USAGE_SUFFIXES
+
+
+def call_name(name):
+    """Return the normalized name a call is stored under"""
+    return normalize_name(BDD_PREFIX.sub("", name))
+
+
+def usage_names(library, name):
+    """Return the normalized names calls to a keyword are made with"""
+    return set([normalize_name(name), normalize_name("%s.%s" % (library, name))])
+
+
+def find_calls(path):
+    """Return the (keyword, test or keyword, line number) of every call in a file
+
+    The test or keyword is None for suite setups and teardowns, and
+    the line number is None with versions of robot older than 3.2.
+    Raises DataError if the file can't be parsed.
+    """
+    if get_model is not None:
+        finder = _CallFinder()
+        finder.visit(get_model(path, data_only=True))
+        return finder.calls
+    return _find_calls_in_old_model(path)
+
+
+def _is_set(value):
+    return bool(value) and value.upper() != "NONE"
+
+
+class _CallFinder(ModelVisitor):
+    """Collects the calls in a file parsed by robot.parsing.get_model"""
+
+    def __init__(self):
+        self.calls = []
+        self.owner = None
+        self.suite_template = False
+        self.templated = False
+
+    def visit_TestTemplate(self, node):
+        self._add(node.value, node.lineno)
+        self.suite_template = _is_set(node.value)
+
+    def visit_Template(self, node):
+        self._add(node.value, node.lineno)
+
+    def visit_TestCase(self, node):
+        # the rows of templated tests are arguments, not calls
+        templates = [statement.value for statement in node.body
+                     if type(statement).__name__ == "Template"]
+        self.templated = _is_set(templates[-1]) if templates else self.suite_template
+        self._visit_owner(node)
+        self.templated = False
+
+    def visit_Keyword(self, node):
+        self._visit_owner(node)
+
+    def visit_KeywordCall(self, node):
+        if not self.templated:
+            self._add(node.keyword, node.lineno)
+
+    def visit_Fixture(self, node):
+        self._add(node.name, node.lineno)
+
+    visit_SuiteSetup = visit_SuiteTeardown = visit_Fixture
+    visit_TestSetup = visit_TestTeardown = visit_Fixture
+    visit_Setup = visit_Teardown = visit_Fixture
+
+    def _visit_owner(self, node):
+        self.owner = node.name
+        self.generic_visit(node)
+        self.owner = None
+
+    def _add(self, name, lineno=None):
+        if _is_set(name):
+            self.calls.append((name, self.owner, lineno))
+
+
+def _find_calls_in_old_model(path):
+    """find_calls for robot < 3.2, whose model has no line numbers"""
+    from robot.parsing.model import ResourceFile, TestData, TestDataDirectory
+    from robot.parsing.populators import FromFilePopulator
+
+    if os.path.splitext(os.path.basename(path))[0].lower() == "__init__":
+        # init files hold the settings of a directory; read as test
+        # case files, their suite setups and teardowns are rejected
+        data = TestDataDirectory(source=os.path.dirname(path))
+        data.initfile = path
+        FromFilePopulator(data).populate(path)
+    else:
+        try:
+            data = TestData(source=path)
+        except DataError:
+            # resource files have no tests
+            data = ResourceFile(source=path).populate()
+
+    calls = []
+
+    def add(name, owner):
+        if _is_set(name):
+            calls.append((name, owner, None))
+
+    def add_steps(steps, owner):
+        for step in steps:
+            if hasattr(step, "steps"):
+                # a for loop
+                add_steps(step.steps, owner)
+            elif not step.is_comment():
+                add(step.name, owner)
+
+    settings = data.setting_table
+    for fixture in ("suite_setup", "suite_teardown", "test_setup", "test_teardown"):
+        if hasattr(settings, fixture):
+            add(getattr(settings, fixture).name, None)
+    suite_template = getattr(settings, "test_template", None)
+    if suite_template is not None:
+        add(suite_template.value, None)
+
+    for test in getattr(data, "testcase_table", []):
+        add(test.setup.name, test.name)
+        template = test.template.value if test.template.is_set() else getattr(suite_template, "value", None)
+        if test.template.is_set():
+            add(template, test.name)
+        if not _is_set(template):
+            add_steps(test.steps, test.name)
+        add(test.teardown.name, test.name)
+
+    for keyword in data.keyword_table:
+        add_steps(keyword.steps, keyword.name)
+        add(keyword.teardown.name, keyword.name)
+    return calls
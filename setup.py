@@ -37,6 +37,7 @@ setup(
         'rfhub.blueprints.api',
         'rfhub.blueprints.doc',
         'rfhub.blueprints.dashboard',
+        'rfhub.storage',
         ],
     scripts          =[], 
     entry_points={
@@ -0,0 +1,53 @@
+from rfhub.catalogs import Catalog, parse_catalogs
+from rfhub.kwdb import KeywordTable
+import os
+import unittest
+
+
+class CatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.kwdb = KeywordTable('sqlite:///:memory:')
+        self.root_a = os.path.abspath('/src/a')
+        self.root_b = os.path.abspath('/src/b')
+        self.shared_id = self.add(None, 'BuiltIn', 'Log')
+        self.a_id = self.add(os.path.join(self.root_a, 'a.robot'), 'a', 'Alpha')
+        self.b_id = self.add(os.path.join(self.root_b, 'b.robot'), 'b', 'Beta')
+        roots = [self.root_a, self.root_b]
+        self.catalog = Catalog(self.kwdb, 'a', [self.root_a], roots)
+
+    def add(self, path, name, keyword):
+        collection_id = self.kwdb.add_collection(path, name, 'resource', '')
+        self.kwdb.storage.add_keywords(collection_id, [(keyword, '', [])])
+        self.kwdb.storage.log_change(collection_id, name, 'added')
+        return collection_id
+
+    def test_should_show_its_own_and_shared_collections(self):
+        self.assertEqual([c['name'] for c in self.catalog.get_collections()], ['BuiltIn', 'a'])
+        self.assertIsNone(self.catalog.get_collection(self.b_id))
+        self.assertEqual(self.catalog.get_keyword_data(self.b_id), [])
+        self.assertEqual(self.catalog.get_keyword(self.b_id, 'Beta'), {})
+
+    def test_should_only_find_keywords_it_shows(self):
+        self.assertEqual(sorted(row[2] for row in self.catalog.search('*')), ['Alpha', 'Log'])
+        self.assertEqual(self.catalog.get_keyword_fields(['name']), [('Log',), ('Alpha',)])
+        self.assertEqual(self.catalog.get_keyword_fields(['name'], collection_id=str(self.b_id)), [])
+        # the limit counts only the keywords it shows
+        self.assertEqual(self.catalog.get_keyword_fields(['name'], limit=2, by_name=True), [('Alpha',), ('Log',)])
+        self.assertEqual(self.catalog.find_keywords(['beta']), [])
+        self.assertEqual([c['name'] for c in self.catalog.get_keyword_hierarchy()], ['BuiltIn', 'a'])
+
+    def test_should_see_collections_added_later(self):
+        new_id = self.add(os.path.join(self.root_a, 'new.robot'), 'new', 'New')
+        self.assertIsNotNone(self.catalog.get_collection(new_id))
+        self.assertEqual([change[1] for change in self.catalog.get_changes()],
+                         [self.shared_id, self.a_id, new_id])
+
+    def test_should_have_its_own_epoch(self):
+        self.assertNotEqual(self.catalog.get_epoch(), self.kwdb.get_epoch())
+
+    def test_should_parse_catalog_options(self):
+        self.assertEqual(parse_catalogs(['a=/src/a', 'b=/src/b', 'a=/src/c']),
+                         [('a', ['/src/a', '/src/c']), ('b', ['/src/b'])])
+        with self.assertRaises(ValueError):
+            parse_catalogs(['a/b=/src'])
@@ -0,0 +1,63 @@
+from rfhub.blueprints.api.changes import changes_since
+from rfhub.kwdb import KeywordTable
+from os.path import join
+import shutil
+import tempfile
+import unittest
+
+
+class ChangesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.resource = join(self.tmpdir, 'common.robot')
+        self.other = join(self.tmpdir, 'other.robot')
+        self.write(self.resource, ('Login', 'Logout'))
+        self.write(self.other, ('Other',))
+        self.kwdb = KeywordTable('sqlite:///:memory:')
+        self.kwdb.add(self.resource)
+        self.kwdb.add(self.other)
+        self.epoch = self.kwdb.get_epoch()
+
+    def tearDown(self):
+        self.kwdb.observer.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, path, names, doc='Does something'):
+        with open(path, 'w') as f:
+            f.write('*** Keywords ***\n')
+            for name in names:
+                f.write('%s\n    [Documentation]    %s\n    No operation\n' % (name, doc))
+
+    def test_should_return_everything_without_a_version(self):
+        changes = changes_since(self.kwdb, 0, '')
+        self.assertTrue(changes['full'])
+        self.assertEqual(changes['version'], self.kwdb.get_version())
+        self.assertEqual([c['name'] for c in changes['collections']], ['common', 'other'])
+        self.assertEqual([k['name'] for k in changes['collections'][0]['keywords']], ['Login', 'Logout'])
+
+    def test_should_return_only_changed_keywords(self):
+        version = self.kwdb.get_version()
+        self.write(self.resource, ('Login', 'Register'))
+        self.kwdb.on_change(self.resource, 'modified')
+        changes = changes_since(self.kwdb, version, self.epoch)
+        self.assertFalse(changes['full'])
+        [collection] = changes['collections']
+        self.assertEqual(collection['name'], 'common')
+        self.assertEqual(collection['change_version'], changes['version'])
+        self.assertEqual(collection['keywords'],
+                         [{'name': 'Register', 'args': [], 'doc': 'Does something'}])
+        self.assertEqual(collection['removed_keywords'], ['Logout'])
+        self.assertEqual(changes['removed'], [])
+
+    def test_should_return_tombstones_for_removed_collections(self):
+        version = self.kwdb.get_version()
+        self.kwdb.remove(self.other)
+        changes = changes_since(self.kwdb, version, self.epoch)
+        self.assertEqual(changes['collections'], [])
+        self.assertEqual([c['name'] for c in changes['removed']], ['other'])
+
+    def test_should_return_everything_for_another_epoch(self):
+        changes = changes_since(self.kwdb, self.kwdb.get_version(), 'some other epoch')
+        self.assertTrue(changes['full'])
+        self.assertEqual(len(changes['collections']), 2)
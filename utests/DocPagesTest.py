@@ -0,0 +1,60 @@
+from rfhub import blueprints
+from rfhub.blueprints.doc.fragments import FragmentCache
+from rfhub.kwdb import KeywordTable
+import flask
+import unittest
+
+
+class DocPagesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.kwdb = KeywordTable('sqlite:///:memory:')
+        self.collection_id = self.kwdb.add_collection(None, 'Browser', 'library', 'A browser library')
+        self.kwdb.storage.add_keywords(self.collection_id, [
+            ('Click Element', 'Clicks an element', ['locator']),
+        ])
+        app = flask.Flask('rfhub')
+        app.kwdb = self.kwdb
+        app.register_blueprint(blueprints.doc, url_prefix='/doc')
+        self.client = app.test_client()
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(as_text=True)
+
+    def test_should_render_cached_pages_again_after_changes(self):
+        url = '/doc/keywords/%s/' % self.collection_id
+        self.assertIn('Click Element', self.get_page(url))
+        self.kwdb.storage.add_keywords(self.collection_id, [('Close Browser', 'Closes the browser', [])])
+        self.assertNotIn('Close Browser', self.get_page(url))
+        self.kwdb.storage.log_change(self.collection_id, 'Browser', 'updated')
+        page = self.get_page(url)
+        self.assertIn('Close Browser', page)
+        self.assertIn("<tr id='kw-close-browser'>", page)
+
+    def test_should_mark_the_selected_keyword_outside_the_cached_table(self):
+        page = self.get_page('/doc/keywords/%s/Click Element/' % self.collection_id)
+        self.assertIn("data-selected='kw-click-element'", page)
+        self.assertIn("<tr id='kw-click-element'>", page)
+
+    def test_should_share_one_nav_panel_between_pages(self):
+        other_id = self.kwdb.add_collection(None, 'Other', 'library', '')
+        self.kwdb.storage.add_keywords(other_id, [('Other Keyword', '', [])])
+        self.kwdb.storage.log_change(other_id, 'Other', 'added')
+        pages = [self.get_page('/doc/keywords/%s/' % collection_id)
+                 for collection_id in (self.collection_id, other_id)]
+        panels = [page[page.index('<div class="well" id="left">'):page.index('<div class="well" id="right"')]
+                  for page in pages]
+        self.assertEqual(panels[0], panels[1])
+        self.assertIn('<div class="well" id="right" data-collection-id="%s">' % other_id, pages[1])
+
+    def test_should_evict_the_least_recently_used_fragment(self):
+        cache = FragmentCache(maxsize=2)
+        cache.get('a', lambda: 'A')
+        cache.get('b', lambda: 'B')
+        cache.get('a', lambda: 'not rendered again')
+        cache.get('c', lambda: 'C')
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a', lambda: 'A again'), 'A')
+        self.assertEqual(cache.get('b', lambda: 'B again'), 'B again')
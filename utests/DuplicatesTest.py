@@ -0,0 +1,106 @@
+from rfhub import blueprints
+from rfhub.kwdb import KeywordTable
+import flask
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+LOGIN = '''\
+*** Keywords ***
+Login
+    [Documentation]    Open the login page, enter the user name and
+    ...    password and submit the form.
+    [Arguments]    ${user}    ${password}
+    Open Browser    http://localhost    chrome
+    Input Text    user    ${user}
+    Input Text    password    ${password}
+    Click Button    submit
+'''
+
+HELPERS = '''\
+*** Keywords ***
+Sign In
+    [Documentation]    Open the login page, enter the user name and
+    ...    password and submit the form.
+    [Arguments]    ${user}    ${password}
+    Open Browser    http://localhost    chrome
+    Input Text    user    ${user}
+    Input Text    password    ${password}
+    Click Button    submit
+
+Log In
+    [Documentation]    Open the login page, enter the user name and
+    ...    password and submit the form again.
+    [Arguments]    ${name}    ${password}
+    Open Browser    http://localhost    chrome
+    Input Text    user    ${name}
+    Input Text    password    ${password}
+    Click Button    submit
+
+Logout
+    [Documentation]    Click the logout button.
+    Click Button    logout
+'''
+
+
+class DuplicatesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.helpers = os.path.join(self.tmpdir, 'helpers.robot')
+        with open(os.path.join(self.tmpdir, 'login.robot'), 'w') as f:
+            f.write(LOGIN)
+        with open(self.helpers, 'w') as f:
+            f.write(HELPERS)
+        self.kwdb = KeywordTable('sqlite:///:memory:', watch=False, index_usages=True)
+        self.kwdb.add(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def names(self, group):
+        return [name for (collection_id, library, name) in group['keywords']]
+
+    def test_should_find_keywords_with_the_same_name(self):
+        names = self.kwdb.duplicates.find()['names']
+        self.assertEqual([self.names(group) for group in names], [['Log In', 'Login']])
+        self.assertEqual([library for (cid, library, name) in names[0]['keywords']], ['helpers', 'login'])
+
+    def test_should_find_exact_and_similar_keywords(self):
+        found = self.kwdb.duplicates.find()
+        self.assertEqual([self.names(group) for group in found['exact']], [['Sign In', 'Login']])
+        self.assertEqual([sorted(self.names(group)) for group in found['similar']],
+                         [['Log In', 'Login', 'Sign In']])
+        self.assertGreaterEqual(found['similar'][0]['similarity'], 0.8)
+
+    def test_should_update_when_files_change(self):
+        found = self.kwdb.duplicates.find()
+        self.assertIs(self.kwdb.duplicates.find(), found)
+        with open(self.helpers, 'w') as f:
+            f.write(HELPERS.replace(HELPERS[HELPERS.index('Sign In'):HELPERS.index('Log In')], ''))
+        self.kwdb.on_change(self.helpers, 'modified')
+        found = self.kwdb.duplicates.find()
+        self.assertEqual(found['exact'], [])
+        self.assertEqual([sorted(self.names(group)) for group in found['similar']], [['Log In', 'Login']])
+        self.kwdb.remove(self.helpers)
+        self.assertEqual(self.kwdb.duplicates.find(), {'names': [], 'exact': [], 'similar': []})
+
+    def test_should_list_duplicates_in_the_api(self):
+        app = flask.Flask('rfhub')
+        app.register_blueprint(blueprints.api, url_prefix='/api')
+        app.register_blueprint(blueprints.doc, url_prefix='/doc')
+        app.register_blueprint(blueprints.dashboard, url_prefix='/dashboard')
+        app.kwdb = self.kwdb
+        client = app.test_client()
+        found = json.loads(client.get('/api/duplicates/?limit=0').get_data(as_text=True))
+        self.assertEqual([(found[kind]['total'], found[kind]['groups']) for kind in ('names', 'exact', 'similar')],
+                         [(1, []), (1, []), (1, [])])
+        found = json.loads(client.get('/api/duplicates/').get_data(as_text=True))
+        keyword = found['exact']['groups'][0]['keywords'][0]
+        self.assertEqual(keyword['library'], 'helpers')
+        self.assertTrue(keyword['doc_keyword_url'].startswith('/doc/keywords/'))
+        self.assertEqual(client.get('/api/duplicates/?limit=lots').status_code, 400)
+        page = client.get('/dashboard/duplicates').get_data(as_text=True)
+        self.assertIn(keyword['doc_keyword_url'], page)
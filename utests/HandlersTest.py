@@ -0,0 +1,167 @@
+from rfhub import blueprints, handlers
+from rfhub.catalogs import Catalog
+from rfhub.kwdb import KeywordTable
+from tornado.testing import AsyncHTTPTestCase, gen_test
+import flask
+import json
+import os
+import tornado.gen
+
+
+class HandlersTest(AsyncHTTPTestCase):
+
+    def get_app(self):
+        self.kwdb = KeywordTable('sqlite:///:memory:')
+        self.collection_id = self.kwdb.add_collection(None, 'Browser', 'library', 'A browser library')
+        self.kwdb.storage.add_keywords(self.collection_id, [
+            ('Click Element', 'Clicks an element\nMore', ['locator']),
+            ('Click Button', 'Clicks a button', ['locator']),
+            ('Close Browser', 'Closes the browser', []),
+        ])
+        app = flask.Flask('rfhub')
+        app.kwdb = self.kwdb
+        app.add_url_rule('/ping', 'ping', lambda: 'pong')
+        app.register_blueprint(blueprints.api, url_prefix='/api')
+        app.register_blueprint(blueprints.doc, url_prefix='/doc')
+        self.flask_client = app.test_client()
+        catalog_app = flask.Flask('rfhub')
+        catalog_app.kwdb = Catalog(self.kwdb, 'team', [], [])
+        catalog_app.register_blueprint(blueprints.api, url_prefix='/api')
+        catalog_app.register_blueprint(blueprints.doc, url_prefix='/doc')
+        return handlers.make_application(app, self.kwdb, threads=2,
+                                         mounts=[('/t/team', catalog_app, catalog_app.kwdb)])
+
+    def get_json(self, url):
+        response = self.fetch(url)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        return json.loads(response.body.decode('utf-8'))
+
+    def test_should_serve_the_same_keywords_as_flask(self):
+        for url in ('/api/keywords/', '/api/keywords/?fields=name,doc_keyword_url&pattern=click*'):
+            expected = json.loads(self.flask_client.get(url).get_data(as_text=True))
+            actual = self.get_json(url)
+            self.assertEqual(sorted(actual['keywords'], key=lambda kw: kw['name']),
+                             sorted(expected['keywords'], key=lambda kw: kw['name']))
+
+    def test_should_stream_keyword_lists(self):
+        chunks = []
+        response = self.fetch('/api/keywords/?fields=name', streaming_callback=chunks.append)
+        self.assertEqual(response.code, 200)
+        self.assertGreater(len(chunks), 0)
+        self.assertEqual(json.loads(b''.join(chunks).decode('utf-8'))['keywords'],
+                         [{'name': 'Click Button'}, {'name': 'Click Element'}, {'name': 'Close Browser'}])
+
+    @gen_test
+    async def test_should_limit_how_many_lists_are_sent_at_once(self):
+        limiter = handlers.StreamLimiter(streams=1, queue=1, timeout=0.05)
+        self.assertTrue(await limiter.acquire())
+        # one may wait, and gives up after the timeout
+        self.assertFalse(await limiter.acquire())
+        waiter = tornado.gen.convert_yielded(limiter.acquire())
+        await tornado.gen.sleep(0)
+        self.assertFalse(await limiter.acquire())
+        limiter.release()
+        self.assertTrue(await waiter)
+
+    def test_should_serve_single_keywords(self):
+        keyword = self.get_json('/api/keywords/Browser/click_button')
+        self.assertEqual(keyword['name'], 'Click Button')
+        expected = json.loads(self.flask_client.get('/api/keywords/Browser/click_button').get_data(as_text=True))
+        self.assertEqual(keyword, expected)
+        self.assertEqual(self.fetch('/api/keywords/Browser/Nope').code, 404)
+        self.assertEqual(self.fetch('/api/keywords/Nope/Click%20Button').code, 404)
+
+    def test_should_serve_libraries(self):
+        libraries = self.get_json('/api/libraries/')['libraries']
+        self.assertEqual([lib['name'] for lib in libraries], ['Browser'])
+
+    def test_should_complete_keyword_names(self):
+        completions = self.get_json('/api/completions/?prefix=cli&limit=1')['completions']
+        self.assertEqual(completions, [{'collection_id': self.collection_id, 'library': 'Browser',
+                                        'name': 'Click Button', 'synopsis': 'Clicks a button',
+                                        'args': '["locator"]'}])
+
+    def test_should_look_up_keywords_in_order(self):
+        body = json.dumps({'keywords': ['click_element', 'Browser.Close Browser',
+                                        {'library': 'Other', 'name': 'Click Button'}, 'Nope']})
+        response = self.fetch('/api/keywords/batch', method='POST', body=body)
+        self.assertEqual(response.code, 200)
+        keywords = json.loads(response.body.decode('utf-8'))['keywords']
+        self.assertEqual([[m['name'] for m in k['matches']] for k in keywords],
+                         [['Click Element'], ['Close Browser'], [], []])
+        self.assertEqual(keywords[2], {'library': 'Other', 'name': 'Click Button', 'matches': []})
+        flask_response = self.flask_client.post('/api/keywords/batch', data=body)
+        self.assertEqual(json.loads(flask_response.get_data(as_text=True))['keywords'], keywords)
+
+    def test_should_reject_malformed_lookups(self):
+        response = self.fetch('/api/keywords/batch', method='POST', body='{"keywords": [42]}')
+        self.assertEqual(response.code, 400)
+        self.assertEqual(self.flask_client.post('/api/keywords/batch', data='nonsense').status_code, 400)
+
+    def test_should_serve_catalogs_under_their_prefix(self):
+        keywords = self.get_json('/t/team/api/keywords/?fields=name,doc_keyword_url&pattern=close*')['keywords']
+        self.assertEqual(keywords, [{'name': 'Close Browser',
+                                     'doc_keyword_url': '/t/team/doc/keywords/%s/Close%%20Browser/'
+                                                        % self.collection_id}])
+
+    def test_should_pass_other_requests_to_flask(self):
+        response = self.fetch('/ping')
+        self.assertEqual(response.body, b'pong')
+
+    @gen_test(timeout=10)
+    async def test_should_publish_changes_as_server_sent_events(self):
+        chunks = []
+        stream = self.http_client.fetch(self.get_url('/api/events'), request_timeout=10,
+                                        streaming_callback=lambda chunk: chunks.append(chunk.decode('utf-8')))
+        # the stream never ends; it is closed when the test finishes
+        stream.add_done_callback(lambda future: future.exception())
+        while '"connected"' not in ''.join(chunks):
+            await tornado.gen.sleep(0.05)
+
+        self.kwdb.add_spec(os.path.join(os.path.dirname(__file__), 'data', 'libspec.xml'))
+        while '"added"' not in ''.join(chunks):
+            await tornado.gen.sleep(0.05)
+
+        event = [line for line in ''.join(chunks).splitlines() if '"added"' in line][0]
+        data = json.loads(event[len('data: '):])
+        self.assertEqual(data['event'], 'added')
+        self.assertEqual(data['version'], self.kwdb.get_version())
+        self.assertIn('id: %s:%d' % (self.kwdb.get_epoch(), data['version']), ''.join(chunks))
+
+
+class BusyHandlersTest(AsyncHTTPTestCase):
+    """A hub that has no room to send another keyword list, or answer a client twice"""
+
+    def get_app(self):
+        app = flask.Flask('rfhub')
+        app.kwdb = KeywordTable('sqlite:///:memory:')
+        app.register_blueprint(blueprints.api, url_prefix='/api')
+        # enough tokens for one request
+        return handlers.make_application(app, app.kwdb, threads=1, streams=0, stream_queue=0, rate_limit=0.2)
+
+    def test_should_turn_away_keyword_lists(self):
+        response = self.fetch('/api/keywords/')
+        self.assertEqual(response.code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertIn('error', json.loads(response.body.decode('utf-8')))
+
+    def test_should_limit_how_often_a_client_asks(self):
+        self.assertEqual(self.fetch('/api/completions/?prefix=a').code, 200)
+        response = self.fetch('/api/completions/?prefix=a')
+        self.assertEqual(response.code, 429)
+        self.assertEqual(response.headers['Retry-After'], '5')
+
+
+class ProxiedHandlersTest(BusyHandlersTest):
+    """The same hub, behind a reverse proxy (--behind-proxy)"""
+
+    def get_httpserver_options(self):
+        return dict(xheaders=True)
+
+    def test_should_limit_each_client_behind_the_proxy(self):
+        for client in ('10.0.0.1', '10.0.0.2'):
+            response = self.fetch('/api/completions/?prefix=a', headers={'X-Real-Ip': client})
+            self.assertEqual(response.code, 200)
+        response = self.fetch('/api/completions/?prefix=a', headers={'X-Real-Ip': '10.0.0.1'})
+        self.assertEqual(response.code, 429)
@@ -0,0 +1,70 @@
+from rfhub import installed
+from robot.errors import DataError
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class InstalledTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.old_cache_dir = os.environ.get('RFHUB_CACHE_DIR')
+        os.environ['RFHUB_CACHE_DIR'] = self.tmpdir
+
+    def tearDown(self):
+        if self.old_cache_dir is None:
+            del os.environ['RFHUB_CACHE_DIR']
+        else:
+            os.environ['RFHUB_CACHE_DIR'] = self.old_cache_dir
+        shutil.rmtree(self.tmpdir)
+
+    def test_should_find_standard_libraries(self):
+        libraries = installed.find_installed_libraries()
+        self.assertIn('BuiltIn', libraries)
+        self.assertIn('Collections', libraries)
+
+    def test_should_use_cached_documentation(self):
+        libraries = installed.find_installed_libraries(lambda name: name != 'BuiltIn')
+        cached = {'name': 'BuiltIn', 'type': 'library', 'doc': 'cached', 'version': '',
+                  'scope': 'global', 'namedargs': True, 'doc_format': 'ROBOT', 'keywords': []}
+        with open(installed.cache_file(), 'w') as f:
+            json.dump({'BuiltIn': {'key': libraries['BuiltIn'], 'collection': cached}}, f)
+        records = installed.load_installed_libraries(lambda name: name != 'BuiltIn')
+        self.assertEqual(records, [cached])
+
+    def test_should_document_and_cache_libraries(self):
+        records = installed.load_installed_libraries(lambda name: name != 'Collections')
+        self.assertEqual([r['name'] for r in records], ['Collections'])
+        self.assertTrue(records[0]['keywords'])
+        with open(installed.cache_file()) as f:
+            self.assertIn('Collections', json.load(f))
+
+    def test_should_not_cache_libraries_that_fail_to_import(self):
+        class Sandbox(object):
+            def document_many(self, names):
+                for name in names:
+                    yield (name, None, DataError('MY_LIBRARY_HOME is not set'))
+
+        ignore = lambda name: name != 'Collections'
+        self.assertEqual(installed.load_installed_libraries(ignore, sandbox=Sandbox()), [])
+        with open(installed.cache_file()) as f:
+            self.assertEqual(json.load(f), {})
+        # so they are tried again next time
+        records = installed.load_installed_libraries(ignore)
+        self.assertEqual([r['name'] for r in records], ['Collections'])
+
+    def test_should_document_in_this_process_without_a_sandbox(self):
+        def no_sandbox(*args, **kwargs):
+            raise AssertionError('no sandbox should be started')
+
+        sandbox = installed.ImportSandbox
+        installed.ImportSandbox = no_sandbox
+        try:
+            records = installed.load_installed_libraries(lambda name: name != 'Collections',
+                                                         use_sandbox=False)
+        finally:
+            installed.ImportSandbox = sandbox
+        self.assertEqual([r['name'] for r in records], ['Collections'])
@@ -58,6 +58,56 @@ class KeywordTableTest(unittest.TestCase):
             self.assertDictEqual(keyword,
                                  {'name': name, 'args': [], 'doc': f'Documentation for {name}', 'collection_id': 1})
 
+    def test_should_store_identical_docs_and_args_once(self):
+        self.kwdb.add(self.one_keyword_resource)
+        self.kwdb.add(self.one_keyword_resource)
+        self.assertLen(self.kwdb.get_keywords(), 2)
+        storage = self.kwdb.storage
+        self.assertLen(storage.db.execute(storage.docs.select()).fetchall(), 1)
+        self.assertLen(storage.db.execute(storage.arglists.select()).fetchall(), 1)
+
+    def test_should_return_args_as_list_in_keyword_data(self):
+        self.kwdb.add(self.two_keywords_resource)
+        for (keyword_id, name, args, doc) in self.kwdb.get_keyword_data(1):
+            self.assertEqual(args, [])
+
+    def test_should_remove_collections_by_path(self):
+        self.kwdb.add(self.one_keyword_resource)
+        self.kwdb.add(self.two_keywords_resource)
+        self.kwdb.remove(self.two_keywords_resource)
+        self.assertLen(self.kwdb.get_collections(), 1)
+        self.assertLen(self.kwdb.get_keywords(), 1)
+
+    def test_should_log_changes_to_collections(self):
+        self.kwdb.add(self.one_keyword_resource)
+        self.kwdb.add(self.two_keywords_resource)
+        version = self.kwdb.get_version()
+        self.kwdb.on_change(self.one_keyword_resource, 'modified')
+        self.kwdb.remove(self.two_keywords_resource)
+        changes = self.kwdb.get_changes(version)
+        self.assertEqual([(event, name) for (v, cid, name, keyword, event) in changes if keyword is None],
+                         [('updated', 'onekeyword'), ('removed', 'twokeywords')])
+        self.assertEqual(self.kwdb.get_version(), version + 2)
+
+    def test_should_report_loading_progress(self):
+        data_dir = dirname(self.one_keyword_resource)
+        self.assertEqual(self.kwdb.progress.as_dict(), {'status': 'ready'})
+        self.kwdb.progress.start()
+        self.kwdb.progress.expect(self.kwdb.count_files(data_dir))
+        self.kwdb.add(data_dir)
+        progress = self.kwdb.progress.as_dict()
+        self.assertEqual((progress['status'], progress['done'], progress['total']), ('loading', 3, 3))
+        self.kwdb.progress.finish()
+        self.kwdb.add(self.one_keyword_resource)
+        self.assertEqual(self.kwdb.progress.as_dict()['status'], 'ready')
+        self.assertEqual(self.kwdb.progress.as_dict()['done'], 3)
+
+    def test_should_not_watch_files_unless_asked_to(self):
+        kwdb = KeywordTable('sqlite:///:memory:', watch=False)
+        kwdb.add(dirname(self.one_keyword_resource))
+        self.assertIsNone(kwdb.observer)
+        self.assertLen(kwdb.get_collections(), 3)
+
     def assertLen(self, collection, size):
         self.assertEqual(len(collection), size)
 
@@ -0,0 +1,89 @@
+from rfhub import blueprints
+from rfhub.blueprints.api.keywords import UrlTemplate, completions, keyword_chunks, keyword_list
+from rfhub.kwdb import KeywordTable
+from rfhub.streaming import encode_list
+import flask
+import json
+import unittest
+
+
+class KeywordsApiTest(unittest.TestCase):
+
+    def setUp(self):
+        self.kwdb = KeywordTable('sqlite:///:memory:')
+        self.lib_id = self.kwdb.add_collection(None, 'Browser', 'library', '')
+        self.kwdb.storage.add_keywords(self.lib_id, [
+            ('Click Element', 'Clicks an element\n\nMore', ['locator']),
+            ('Go To 50% / ?Page# ünïcode', 'Goes', ['url']),
+        ])
+        self.other_id = self.kwdb.add_collection(None, 'Other', 'library', '')
+        self.kwdb.storage.add_keywords(self.other_id, [('Other Keyword', '', [])])
+        self.app = flask.Flask('rfhub')
+        self.app.register_blueprint(blueprints.api, url_prefix='/api')
+        self.app.register_blueprint(blueprints.doc, url_prefix='/doc')
+
+    def test_should_stream_the_same_json_as_json_dumps(self):
+        with self.app.test_request_context():
+            chunks = list(keyword_chunks(self.kwdb, '', '*', 'name, htmldoc', flask.url_for, chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        keywords = [keyword for chunk in chunks for keyword in chunk]
+        self.assertEqual(''.join(encode_list('keywords', chunks + [[]])),
+                         json.dumps({'keywords': keywords}, sort_keys=True))
+        self.assertEqual(''.join(encode_list('keywords', [])), '{"keywords": []}')
+
+    def test_url_template_should_build_the_same_urls_as_url_for(self):
+        with self.app.test_request_context():
+            template = UrlTemplate(flask.url_for, 'doc.doc_for_library', 'collection_id', 'keyword')
+            for name in ('Click Element', 'Go To 50% / ?Page# ünïcode', 'a+b&c=d'):
+                self.assertEqual(template(self.lib_id, name),
+                                 flask.url_for('doc.doc_for_library', collection_id=self.lib_id, keyword=name))
+
+    def test_should_complete_prefixes_with_wildcards_literally(self):
+        self.kwdb.storage.add_keywords(self.other_id, [('Go To Page', '', [])])
+        self.assertEqual([c['name'] for c in completions(self.kwdb, 'go to ', limit=1)],
+                         ['Go To 50% / ?Page# ünïcode'])
+        self.assertEqual(completions(self.kwdb, 'go to ?'), [])
+        self.assertEqual(completions(self.kwdb, 'c*t'), [])
+        self.assertEqual([c['name'] for c in completions(self.kwdb, 'go to 50% / ?')],
+                         ['Go To 50% / ?Page# ünïcode'])
+        self.assertEqual([c['name'] for c in completions(self.kwdb, '')],
+                         ['Click Element', 'Go To 50% / ?Page# ünïcode', 'Go To Page', 'Other Keyword'])
+
+    def test_should_only_list_keywords_of_the_given_collection(self):
+        with self.app.test_request_context():
+            keywords = keyword_list(self.kwdb, str(self.other_id), '*', 'name', flask.url_for)
+        self.assertEqual(keywords, [{'name': 'Other Keyword'}])
+
+    def test_should_only_return_requested_fields(self):
+        with self.app.test_request_context():
+            keywords = keyword_list(self.kwdb, '', 'click*', 'name, synopsis, api_library_url, bogus',
+                                    flask.url_for)
+        self.assertEqual(keywords, [{'name': 'Click Element', 'synopsis': 'Clicks an element',
+                                     'api_library_url': '/api/keywords/%d' % self.lib_id}])
+
+    def test_should_serve_keywords_at_their_api_keyword_url(self):
+        self.app.kwdb = self.kwdb
+        client = self.app.test_client()
+        with self.app.test_request_context():
+            url = keyword_list(self.kwdb, str(self.lib_id), 'click*', 'api_keyword_url', flask.url_for)[0]
+        response = client.get(url['api_keyword_url'])
+        self.assertEqual(json.loads(response.get_data(as_text=True))['name'], 'Click Element')
+        self.assertEqual(client.get('/api/keywords/browser/Click Element').status_code, 200)
+
+    def test_should_not_look_up_library_names_as_ids(self):
+        get_collection = self.kwdb.get_collection
+
+        def get_collection_by_id(collection_id):
+            # like PostgreSQL, which refuses to compare a name with an integer column
+            if not str(collection_id).isdigit():
+                raise ValueError("invalid input syntax for integer: %r" % collection_id)
+            return get_collection(collection_id)
+
+        self.kwdb.get_collection = get_collection_by_id
+        self.app.kwdb = self.kwdb
+        client = self.app.test_client()
+        response = client.get('/api/keywords/browser/Click%20Element')
+        self.assertEqual(json.loads(response.get_data(as_text=True))['name'], 'Click Element')
+        response = client.get('/api/keywords/browser/Click%20Element/usages')
+        self.assertEqual(json.loads(response.get_data(as_text=True))['total'], 0)
+        self.assertEqual(client.get('/api/keywords/nope/Click%20Element').status_code, 404)
@@ -0,0 +1,65 @@
+from rfhub.kwdb import KeywordTable
+from robot.libdocpkg import LibraryDocumentation
+from os.path import dirname, join
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+
+class LibspecTest(unittest.TestCase):
+
+    def setUp(self):
+        self.kwdb = KeywordTable('sqlite:///:memory:')
+        data_dir = join(dirname(__file__), 'data')
+        self.xml_spec = join(data_dir, 'libspec.xml')
+        self.json_spec = join(data_dir, 'libspec.json')
+
+    def test_should_read_xml_spec_like_libdoc(self):
+        self.kwdb.add_spec(self.xml_spec)
+        libdoc = LibraryDocumentation(self.xml_spec)
+        keywords = self.kwdb.get_keyword_data(1)
+        self.assertEqual([(name, args, doc) for (keyword_id, name, args, doc) in keywords],
+                         [(kw.name, kw.args, kw.doc) for kw in libdoc.keywords])
+        collection = self.kwdb.get_collection(1)
+        self.assertEqual((collection['name'], collection['type'], collection['version'],
+                          collection['scope'], collection['doc']),
+                         (libdoc.name, libdoc.type, libdoc.version, libdoc.scope, libdoc.doc))
+
+    def test_should_use_spec_importer_for_xml_files(self):
+        self.kwdb.add(self.xml_spec)
+        self.assertEqual(len(self.kwdb.get_keywords()), 2)
+
+    def test_should_read_json_spec(self):
+        self.kwdb.add_spec(self.json_spec)
+        keyword = self.kwdb.get_keyword(1, 'Json Keyword')
+        self.assertEqual(keyword['args'], ['first', 'second=2'])
+        self.assertEqual(self.kwdb.get_collection(1)['type'], 'library')
+
+    def test_should_read_specs_from_archive(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            archive = join(tmpdir, 'specs.zip')
+            with zipfile.ZipFile(archive, 'w') as f:
+                f.write(self.xml_spec, 'specs/libspec.xml')
+                f.write(self.json_spec, 'specs/libspec.json')
+            self.assertEqual(len(self.kwdb.add_spec(archive)), 2)
+            self.assertEqual(len(self.kwdb.get_keywords()), 3)
+            self.assertEqual(self.kwdb.remove(archive), [1, 2])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_should_skip_files_that_are_not_specs(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            shutil.copy(self.xml_spec, tmpdir)
+            with open(join(tmpdir, 'output.xml'), 'w') as f:
+                f.write('<?xml version="1.0"?>\n<robot generator="Robot"><suite/></robot>\n')
+            with open(join(tmpdir, 'package.json'), 'w') as f:
+                f.write('{"name": "project", "version": "1.0.0"}')
+            with open(join(tmpdir, 'broken.libspec'), 'w') as f:
+                f.write('<keywordspec name="Broken"><kw name="Half"')
+            self.assertEqual(len(self.kwdb.add_spec(tmpdir)), 1)
+            self.assertEqual([c['name'] for c in self.kwdb.get_collections()], ['SpecLibrary'])
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,32 @@
+from rfhub.metrics import Metrics
+import unittest
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_should_render_summaries_in_prometheus_format(self):
+        self.metrics.observe('rfhub_query_seconds', 0.5, method='search')
+        self.metrics.observe('rfhub_query_seconds', 0.25, method='search')
+        self.assertEqual(self.metrics.render(),
+                         '# TYPE rfhub_query_seconds summary\n'
+                         'rfhub_query_seconds_count{method="search"} 2\n'
+                         'rfhub_query_seconds_sum{method="search"} 0.750000\n')
+
+    def test_should_escape_label_values(self):
+        self.metrics.observe('rfhub_render_seconds', 1, template='a "b"\\c')
+        self.assertIn('{template="a \\"b\\"\\\\c"}', self.metrics.render())
+
+    def test_should_time_decorated_functions(self):
+        @self.metrics.timed('rfhub_test_seconds', method='f')
+        def f():
+            return 42
+        self.assertEqual(f(), 42)
+        self.assertIn('rfhub_test_seconds_count{method="f"} 1', self.metrics.render())
+
+    def test_should_report_slowest_parse_times(self):
+        for (source, seconds) in (('a.robot', 0.1), ('b.robot', 0.3), ('c.robot', 0.2)):
+            self.metrics.parse_times[source] = ('resource', seconds)
+        self.assertEqual([s[0] for s in self.metrics.slowest(2)], ['b.robot', 'c.robot'])
@@ -0,0 +1,95 @@
+from rfhub.kwdb import KeywordTable
+from rfhub.sandbox import ImportSandbox, ImportTimeout
+from robot.errors import DataError
+from os.path import join
+import shutil
+import sys
+import tempfile
+import textwrap
+import threading
+import unittest
+
+
+class SandboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.sandbox = ImportSandbox(processes=2, timeout=5)
+
+    def tearDown(self):
+        self.sandbox.close()
+        shutil.rmtree(self.tmpdir)
+
+    def write_library(self, name, source):
+        path = join(self.tmpdir, name + '.py')
+        with open(path, 'w') as f:
+            f.write(textwrap.dedent(source))
+        return path
+
+    def test_should_document_library_in_worker(self):
+        record = self.sandbox.document('Collections')
+        self.assertEqual(record['name'], 'Collections')
+        self.assertIn('Append To List', [kw[0] for kw in record['keywords']])
+
+    def test_should_report_unknown_library_as_data_error(self):
+        with self.assertRaises(DataError):
+            self.sandbox.document('NoSuchLibrary')
+
+    def test_should_give_up_on_slow_imports_and_continue(self):
+        self.write_library('SlowLibrary', '''
+            import time
+            time.sleep(60)
+            def slow_keyword():
+                pass
+        ''')
+        self.write_library('FastLibrary', '''
+            def fast_keyword():
+                pass
+        ''')
+        self.sandbox.timeout = 1
+        results = list(self.sandbox.document_many(['SlowLibrary', 'FastLibrary'], [self.tmpdir]))
+        self.assertIsInstance(results[0][2], ImportTimeout)
+        self.assertEqual(results[1][1]['keywords'], [('Fast Keyword', '', [])])
+
+    def test_should_keep_workers_another_thread_is_waiting_on(self):
+        self.write_library('SlowLibrary', '''
+            import time
+            time.sleep(2)
+            def slow_keyword():
+                pass
+        ''')
+        results = []
+        loader = threading.Thread(target=lambda: results.extend(
+            self.sandbox.document_many(['SlowLibrary'], [self.tmpdir])))
+        loader.start()
+        while not self.sandbox._users:
+            loader.join(0.01)
+        # eg: the file watcher's reload finishing first
+        self.sandbox.close()
+        loader.join()
+        self.assertIsNone(results[0][2])
+        self.assertEqual(results[0][1]['keywords'], [('Slow Keyword', '', [])])
+        self.assertEqual(self.sandbox._users, {})
+
+    def test_should_only_add_top_level_classes(self):
+        path = self.write_library('PageObjects', '''
+            class FirstPage(object):
+                class Locators(object):
+                    pass
+                def first_keyword(self):
+                    pass
+        ''')
+        kwdb = KeywordTable('sqlite:///:memory:', sandbox=self.sandbox)
+        kwdb.add(path)
+        self.assertEqual([c['name'] for c in kwdb.get_collections()], ['PageObjects.FirstPage'])
+
+    def test_should_not_change_the_hubs_sys_path(self):
+        path = self.write_library('MorePageObjects', '''
+            class SecondPage(object):
+                def second_keyword(self):
+                    pass
+        ''')
+        kwdb = KeywordTable('sqlite:///:memory:', sandbox=self.sandbox)
+        kwdb.add(path)
+        self.assertEqual([c['name'] for c in kwdb.get_collections()], ['MorePageObjects.SecondPage'])
+        self.assertNotIn(self.tmpdir, sys.path)
@@ -0,0 +1,108 @@
+from rfhub import metrics, scheduler
+from rfhub.kwdb import KeywordTable, WatchdogHandler
+from rfhub.scheduler import Scheduler, TokenBuckets
+from watchdog.events import FileCreatedEvent
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler(threads=1, max_wait=10)
+        self.ran = []
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+
+    def block(self):
+        """Keep the scheduler's thread busy until the returned event is set"""
+        started = threading.Event()
+        release = threading.Event()
+        self.scheduler.submit(scheduler.INTERACTIVE, lambda: (started.set(), release.wait()))
+        started.wait()
+        return release
+
+    def test_should_run_the_most_urgent_work_first(self):
+        release = self.block()
+        futures = [self.scheduler.submit(priority, self.ran.append, name)
+                   for (priority, name) in ((scheduler.BACKGROUND, 'reload'), (scheduler.BULK, 'export'),
+                                            (scheduler.INTERACTIVE, 'completion'),
+                                            (scheduler.BULK, 'another export'))]
+        self.assertEqual(self.scheduler.queued(), {'interactive': 1, 'bulk': 2, 'background': 1})
+        release.set()
+        for future in futures:
+            future.result()
+        self.assertEqual(self.ran, ['completion', 'export', 'another export', 'reload'])
+
+    def test_should_not_keep_work_waiting_forever(self):
+        self.scheduler.max_wait = 0.05
+        release = self.block()
+        futures = [self.scheduler.submit(scheduler.BACKGROUND, self.ran.append, 'reload')]
+        time.sleep(0.1)
+        futures.append(self.scheduler.submit(scheduler.INTERACTIVE, self.ran.append, 'completion'))
+        release.set()
+        for future in futures:
+            future.result()
+        self.assertEqual(self.ran, ['reload', 'completion'])
+
+    def test_should_record_time_spent_waiting(self):
+        self.scheduler.executor(scheduler.BULK).submit(len, 'abc').result()
+        self.assertIn('rfhub_queue_seconds_count{priority="bulk"}', metrics.registry.render())
+
+    def test_should_pass_on_exceptions(self):
+        future = self.scheduler.submit(scheduler.INTERACTIVE, int, 'nonsense')
+        self.assertRaises(ValueError, future.result)
+
+    def test_should_reload_files_on_the_executor(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'new.robot')
+            with open(path, 'w') as f:
+                f.write('*** Keywords ***\nNew Keyword\n    No Operation\n')
+            kwdb = KeywordTable('sqlite:///:memory:', watch=False)
+            kwdb.reload_executor = self.scheduler.executor(scheduler.BACKGROUND)
+            release = self.block()
+            created = threading.Thread(target=WatchdogHandler(kwdb, tmpdir).on_created,
+                                       args=(FileCreatedEvent(path),))
+            created.start()
+            created.join(0.1)
+            # waits for the scheduler
+            self.assertTrue(created.is_alive())
+            self.assertEqual(kwdb.get_collections(), [])
+            release.set()
+            created.join()
+            self.assertEqual([c['name'] for c in kwdb.get_collections()], ['new'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class TokenBucketsTest(unittest.TestCase):
+
+    def test_should_limit_each_client(self):
+        buckets = TokenBuckets(rate=10, burst=2)
+        self.assertEqual(buckets.take('editor'), 0)
+        self.assertEqual(buckets.take('editor'), 0)
+        wait = buckets.take('editor')
+        self.assertTrue(0 < wait <= 0.1)
+        self.assertEqual(buckets.take('ci'), 0)
+        time.sleep(wait)
+        self.assertEqual(buckets.take('editor'), 0)
+
+    def test_should_let_large_requests_through_with_a_full_bucket(self):
+        buckets = TokenBuckets(rate=1)
+        self.assertEqual(buckets.take('ci', cost=10), 0)
+        self.assertAlmostEqual(buckets.take('ci', cost=10), 5, places=1)
+
+    def test_should_forget_clients_whose_buckets_are_full(self):
+        buckets = TokenBuckets(rate=1000, burst=1)
+        buckets.MAX_CLIENTS = 2
+        buckets.take('a')
+        buckets.take('b')
+        time.sleep(0.01)
+        buckets.take('c')
+        self.assertEqual(sorted(buckets._buckets), ['c'])
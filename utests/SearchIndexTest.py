@@ -0,0 +1,43 @@
+from rfhub import blueprints
+from rfhub.kwdb import KeywordTable
+import flask
+import gzip
+import json
+import unittest
+
+
+class SearchIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.kwdb = KeywordTable('sqlite:///:memory:')
+        self.collection_id = self.kwdb.add_collection(None, 'Browser', 'library', '')
+        self.kwdb.storage.add_keywords(self.collection_id, [
+            ('Click Element', 'Clicks an element\n\nMore', ['locator']),
+        ])
+        app = flask.Flask('rfhub')
+        app.kwdb = self.kwdb
+        app.register_blueprint(blueprints.api, url_prefix='/api')
+        app.register_blueprint(blueprints.doc, url_prefix='/doc')
+        self.client = app.test_client()
+
+    def test_should_list_keywords_by_library(self):
+        response = self.client.get('/api/search-index.json')
+        index = json.loads(response.get_data(as_text=True))
+        self.assertEqual(index['libraries'], [[self.collection_id, 'Browser']])
+        self.assertEqual(index['keywords'], [[0, 'Click Element', 'Clicks an element', 'clickelement']])
+        self.assertEqual(index['epoch'], self.kwdb.get_epoch())
+
+    def test_should_answer_304_until_the_data_changes(self):
+        etag = self.client.get('/api/search-index.json').headers['ETag']
+        response = self.client.get('/api/search-index.json', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.kwdb.storage.log_change(self.collection_id, 'Browser', 'updated')
+        response = self.client.get('/api/search-index.json', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_should_send_gzipped_index_if_accepted(self):
+        response = self.client.get('/api/search-index.json', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        index = json.loads(gzip.decompress(response.get_data()).decode('utf-8'))
+        self.assertEqual(index['libraries'], [[self.collection_id, 'Browser']])
@@ -0,0 +1,38 @@
+from rfhub import snapshot
+from rfhub.kwdb import KeywordTable
+from os.path import dirname, join
+import shutil
+import tempfile
+import unittest
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.kwdb = KeywordTable('sqlite:///:memory:')
+        self.kwdb.add(join(dirname(__file__), 'data', 'twokeywords.robot'))
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = join(self.tmpdir, 'catalog.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_should_serve_same_keywords_from_snapshot(self):
+        snapshot.export_snapshot(self.kwdb, self.filename)
+        copy = snapshot.open_snapshot(self.filename)
+        self.assertEqual(sorted(copy.get_keywords()), sorted(self.kwdb.get_keywords()))
+        self.assertEqual(copy.get_collections(), self.kwdb.get_collections())
+
+    def test_should_store_prerendered_html(self):
+        snapshot.export_snapshot(self.kwdb, self.filename)
+        copy = snapshot.open_snapshot(self.filename)
+        doc = 'Documentation for Keyword #1'
+        self.assertEqual(copy.storage.get_doc_html([doc]), {doc: '<p>Documentation for Keyword #1</p>'})
+
+    def test_should_reject_files_that_are_not_snapshots(self):
+        with open(self.filename, 'w') as f:
+            f.write('not a database')
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.snapshot_url(self.filename)
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.snapshot_url(join(self.tmpdir, 'missing.db'))
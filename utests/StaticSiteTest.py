@@ -0,0 +1,59 @@
+from rfhub import blueprints, staticsite
+from rfhub.kwdb import KeywordTable
+import flask
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class StaticSiteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        kwdb = KeywordTable('sqlite:///:memory:')
+        self.collection_id = kwdb.add_collection(None, 'Browser', 'library', 'A browser library')
+        kwdb.storage.add_keywords(self.collection_id, [
+            ('Click Element', 'Clicks an element', ['locator']),
+            ('Close Browser', 'Closes the browser', []),
+        ])
+        self.app = flask.Flask('rfhub')
+        self.app.kwdb = kwdb
+        self.app.register_blueprint(blueprints.api, url_prefix='/api')
+        self.app.register_blueprint(blueprints.doc, url_prefix='/doc')
+        staticsite.export_static(self.app, self.tmpdir, threads=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, *path):
+        with open(os.path.join(self.tmpdir, *path), encoding='utf-8') as f:
+            return f.read()
+
+    def test_should_write_the_pages_the_hub_serves(self):
+        client = self.app.test_client()
+        url = '/doc/keywords/%s/' % self.collection_id
+        self.assertEqual(self.read('doc', 'keywords', str(self.collection_id), 'index.html'),
+                         client.get(url).get_data(as_text=True))
+        self.assertIn('Browser', self.read('doc', 'keywords', 'index.html'))
+        self.assertIn('summary-libraries', self.read('doc', 'index'))
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'doc', 'static', 'doc.js')))
+
+    def test_should_send_keyword_pages_to_the_library_page(self):
+        page = self.read('doc', 'keywords', str(self.collection_id), 'Click Element', 'index.html')
+        self.assertIn('url=../#kw-click-element', page)
+
+    def test_should_mirror_the_api(self):
+        libraries = json.loads(self.read('api', 'libraries', 'index.json'))['libraries']
+        self.assertEqual([library['name'] for library in libraries], ['Browser'])
+        keywords = json.loads(self.read('api', 'keywords', '%s.json' % self.collection_id))['keywords']
+        self.assertEqual([keyword['name'] for keyword in keywords], ['Click Element', 'Close Browser'])
+        keyword = json.loads(self.read('api', 'keywords', str(self.collection_id), 'Close Browser.json'))
+        self.assertEqual(keyword['doc'], 'Closes the browser')
+
+    def test_should_write_a_search_index(self):
+        index = json.loads(self.read('api', 'search-index.json'))
+        self.assertEqual(index['libraries'], [[self.collection_id, 'Browser']])
+        self.assertEqual(index['keywords'], [[0, 'Click Element', 'Clicks an element', 'clickelement'],
+                                             [0, 'Close Browser', 'Closes the browser', 'closebrowser']])
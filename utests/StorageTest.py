@@ -0,0 +1,326 @@
+from rfhub.storage import MemoryStorage, ReplicatedStorage, SqlStorage, create_storage
+from sqlalchemy.exc import DataError
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+
+class StorageConformance(object):
+    """Tests every storage backend must pass
+
+    Subclasses provide create_storage()
+    """
+
+    def setUp(self):
+        self.storage = self.create_storage()
+        self.lib_id = self.storage.add_collection(None, 'MyLibrary', 'library', 'Library doc\n\nMore doc',
+                                                  '1.0', 'GLOBAL', 'yes', 'ROBOT')
+        self.storage.add_keywords(self.lib_id, [
+            ('Open Page', 'Opens a page\n\nDetails', ['url', 'browser=chrome']),
+            ('Close Page', 'Closes a page', []),
+        ])
+        self.res_id = self.storage.add_collection('/tmp/common.robot', 'common', 'resource', '')
+        self.storage.add_keywords(self.res_id, [
+            ('Login', 'Logs in', ['user', 'password']),
+        ])
+
+    def test_should_get_collection(self):
+        collection = self.storage.get_collection(self.lib_id)
+        self.assertEqual(collection['name'], 'MyLibrary')
+        self.assertEqual(collection['version'], '1.0')
+        self.assertEqual(collection['scope'], 'GLOBAL')
+        self.assertEqual(collection['doc_format'], 'ROBOT')
+        self.assertEqual(collection['synopsis'], 'Library doc')
+        self.assertIsNone(self.storage.get_collection(12345))
+
+    def test_should_list_collections_sorted_by_name(self):
+        names = [c['name'] for c in self.storage.get_collections()]
+        self.assertEqual(names, ['MyLibrary', 'common'])
+
+    def test_should_filter_collections_by_pattern_and_type(self):
+        self.assertEqual([c['name'] for c in self.storage.get_collections('mylib*')], ['MyLibrary'])
+        self.assertEqual([c['name'] for c in self.storage.get_collections(libtype='resource')], ['common'])
+        self.assertEqual(self.storage.get_collections('^library'), [])
+
+    def test_should_report_collection_synopsis(self):
+        collection = self.storage.get_collections('MyLibrary')[0]
+        self.assertEqual(collection['synopsis'], 'Library doc')
+
+    def test_should_get_keyword_ignoring_case(self):
+        keyword = self.storage.get_keyword(self.lib_id, 'open page')
+        self.assertEqual(keyword['name'], 'Open Page')
+        self.assertEqual(keyword['args'], ['url', 'browser=chrome'])
+        self.assertEqual(self.storage.get_keyword(self.lib_id, 'Login'), {})
+
+    def test_should_get_keyword_data_sorted_by_name(self):
+        data = self.storage.get_keyword_data(self.lib_id)
+        self.assertEqual([row[1] for row in data], ['Close Page', 'Open Page'])
+        self.assertEqual(data[1][2], ['url', 'browser=chrome'])
+
+    def test_should_get_keywords_by_pattern(self):
+        keywords = self.storage.get_keywords('*page')
+        self.assertEqual(sorted(kw[2] for kw in keywords), ['Close Page', 'Open Page'])
+        self.assertEqual(len(self.storage.get_keywords()), 3)
+
+    def test_should_get_keyword_hierarchy(self):
+        hierarchy = self.storage.get_keyword_hierarchy()
+        self.assertEqual([c['name'] for c in hierarchy], ['MyLibrary', 'common'])
+        self.assertEqual([kw['name'] for kw in hierarchy[0]['keywords']], ['Close Page', 'Open Page'])
+
+    def test_should_store_the_first_paragraph_of_docs_as_synopsis(self):
+        collection_id = self.storage.add_collection(None, 'Wrapped', 'library', 'Wrapped\nlibrary doc\n\nMore')
+        self.storage.add_keywords(collection_id, [('Wrap', '  Wrapped\nkeyword doc\n\nMore', [])])
+        self.assertEqual(self.storage.get_collections('wrapped')[0]['synopsis'], 'Wrapped library doc')
+        self.assertEqual(self.storage.get_keyword_fields(['synopsis'], collection_id=collection_id),
+                         [('Wrapped keyword doc',)])
+        hierarchy = self.storage.get_keyword_hierarchy('wrapped')
+        self.assertEqual(hierarchy[0]['keywords'], [{'name': 'Wrap', 'synopsis': 'Wrapped keyword doc'}])
+
+    def test_should_search_names_and_docs(self):
+        result = self.storage.search('details')
+        self.assertEqual(result, [(self.lib_id, 'MyLibrary', 'Open Page', 'Opens a page')])
+        self.assertEqual(self.storage.search('details', mode='name'), [])
+
+    def test_should_delete_keywords_but_keep_collection(self):
+        self.storage.delete_keywords(self.lib_id)
+        self.assertEqual(self.storage.get_keyword_data(self.lib_id), [])
+        self.assertIsNotNone(self.storage.get_collection(self.lib_id))
+
+    def test_should_delete_collections_by_path(self):
+        self.assertEqual(self.storage.get_collection_ids('/tmp/common.robot'), [self.res_id])
+        self.assertEqual(self.storage.delete_collections('/tmp/common.robot'), [self.res_id])
+        self.assertIsNone(self.storage.get_collection(self.res_id))
+        self.assertEqual(len(self.storage.get_keywords()), 2)
+
+    def test_should_drop_docs_no_keyword_uses_any_more(self):
+        lib2_id = self.storage.add_collection(None, 'OtherLibrary', 'library', '')
+        self.storage.add_keywords(lib2_id, [('Close Page', 'Closes a page', [])])
+        self.storage.set_doc_html([('Logs in', '<p>Logs in</p>'), ('Closes a page', '<p>Closes a page</p>')])
+        self.storage.delete_collections('/tmp/common.robot')
+        self.storage.delete_keywords(self.lib_id)
+        self.assertEqual(self.storage.get_doc_html(['Logs in', 'Closes a page']),
+                         {'Closes a page': '<p>Closes a page</p>'})
+        self.assertEqual(self.storage.get_keyword(lib2_id, 'Close Page')['args'], [])
+
+    def test_should_store_prerendered_doc_html(self):
+        self.assertEqual(self.storage.get_doc_html(['Logs in']), {})
+        self.storage.set_doc_html([('Logs in', '<p>Logs in</p>')])
+        self.assertEqual(self.storage.get_doc_html(['Logs in', 'Closes a page']), {'Logs in': '<p>Logs in</p>'})
+
+    def test_should_be_empty_after_reset(self):
+        self.storage.reset()
+        self.assertEqual(self.storage.get_collections(), [])
+        self.assertEqual(self.storage.get_keywords(), [])
+
+    def test_should_find_keywords_by_normalized_name(self):
+        found = self.storage.find_keywords(['openpage', 'login', 'nosuchkeyword'])
+        self.assertEqual(sorted(found), [
+            (self.lib_id, 'MyLibrary', 'Open Page', 'Opens a page\n\nDetails', ['url', 'browser=chrome']),
+            (self.res_id, 'common', 'Login', 'Logs in', ['user', 'password']),
+        ])
+
+    def test_should_return_only_the_requested_keyword_fields(self):
+        self.assertEqual(self.storage.get_keyword_fields(['name']),
+                         [('Close Page',), ('Open Page',), ('Login',)])
+        self.assertEqual(self.storage.get_keyword_fields(['library', 'args'], 'log*', str(self.res_id)),
+                         [('common', '["user", "password"]')])
+        self.assertEqual(self.storage.get_keyword_fields(['name'], collection_id='bogus'), [])
+
+    def test_should_sort_keyword_fields_by_name(self):
+        self.assertEqual(self.storage.get_keyword_fields(['library', 'name'], 'o', limit=2, by_name=True),
+                         [('MyLibrary', 'Close Page'), ('common', 'Login')])
+
+    def test_should_match_escaped_wildcards_literally(self):
+        self.storage.add_keywords(self.res_id, [('Log 100%_*', '', []), ('Log 100%x!', '', [])])
+        self.assertEqual(self.storage.get_keyword_fields(['name'], '^log 100%_\\*'), [('Log 100%_*',)])
+        self.assertEqual([row[2] for row in self.storage.search('100%_', mode='name')], ['Log 100%_*'])
+
+    def test_should_read_keyword_fields_a_chunk_at_a_time(self):
+        self.assertEqual(self.storage.get_keyword_fields(['name'], after=(self.lib_id, 'Close Page'), limit=1),
+                         [('Open Page',)])
+        chunks = list(self.storage.iter_keyword_fields(['synopsis'], chunk_size=2))
+        self.assertEqual(chunks, [[('Closes a page',), ('Opens a page',)], [('Logs in',)]])
+        self.assertEqual(list(self.storage.iter_keyword_fields(['name', 'collection_id'], 'page', chunk_size=1)),
+                         [[('Close Page', self.lib_id)], [('Open Page', self.lib_id)]])
+
+    def test_should_get_keyword_by_name_the_way_robot_matches_it(self):
+        self.assertEqual(self.storage.get_keyword(self.lib_id, 'open_page')['name'], 'Open Page')
+        self.assertEqual(self.storage.get_keyword(self.lib_id, 'OPENPAGE')['name'], 'Open Page')
+        # no wildcards
+        self.assertEqual(self.storage.get_keyword(self.lib_id, 'Open%'), {})
+        self.assertEqual(self.storage.get_keyword(self.lib_id, 'Open_Pag_'), {})
+
+    def test_should_keep_only_the_first_of_keywords_robot_cant_tell_apart(self):
+        collection_id = self.storage.add_collection(None, 'Dupes', 'library', '')
+        self.storage.add_keywords(collection_id, [('Do It', 'first', []), ('do_it', 'second', [])])
+        self.storage.add_keywords(collection_id, [('DoIt', 'third', [])])
+        self.assertEqual([(name, doc) for (kid, name, args, doc) in self.storage.get_keyword_data(collection_id)],
+                         [('Do It', 'first')])
+
+    def test_should_keep_versions_going_up_after_reset(self):
+        self.assertEqual(self.storage.get_version(), 0)
+        self.assertEqual(self.storage.log_change(self.lib_id, 'MyLibrary', 'added'), 1)
+        self.storage.reset()
+        self.assertEqual(self.storage.log_change(self.res_id, 'common', 'removed'), 2)
+        self.assertEqual(self.storage.get_changes(1), [(2, self.res_id, 'common', None, 'removed')])
+        self.assertTrue(self.storage.get_epoch())
+
+    def test_should_be_usable_from_another_thread(self):
+        # the watchdog observer updates the storage from its own thread
+        def reload():
+            self.storage.delete_keywords(self.res_id)
+            self.storage.add_keywords(self.res_id, [('Logout', 'Logs out', [])])
+        thread = threading.Thread(target=reload)
+        thread.start()
+        thread.join()
+        self.assertEqual(self.storage.get_keyword(self.res_id, 'Logout')['doc'], 'Logs out')
+        self.assertEqual(self.storage.get_keyword(self.res_id, 'Login'), {})
+
+
+    def test_should_replace_usages_of_a_file(self):
+        self.storage.set_usages('/tmp/a.robot', [('login', 'Login', 'Test 1', 3), ('logout', 'Logout', 'Test 1', 4)])
+        self.storage.set_usages('/tmp/b.robot', [('login', 'Login', None, 2)])
+        self.assertEqual(self.storage.get_usages(set(['login', 'logout'])),
+                         [('/tmp/a.robot', 'Test 1', 3, 'Login'), ('/tmp/a.robot', 'Test 1', 4, 'Logout'),
+                          ('/tmp/b.robot', None, 2, 'Login')])
+        self.assertEqual(self.storage.get_usages(set(['login']), offset=1, limit=1),
+                         [('/tmp/b.robot', None, 2, 'Login')])
+        self.storage.set_usages('/tmp/a.robot', [('logout', 'Logout', 'Test 2', 7)])
+        self.assertEqual(self.storage.get_usage_counts(), {'login': 1, 'logout': 1})
+        self.assertEqual(self.storage.get_usage_counts(['login', 'missing']), {'login': 1})
+        self.storage.reset()
+        self.assertEqual(self.storage.get_usages(), [])
+
+
+class SqlStorageTest(StorageConformance, unittest.TestCase):
+
+    def create_storage(self):
+        return SqlStorage('sqlite:///:memory:')
+
+    def test_should_delete_unused_docs_and_args(self):
+        self.storage.delete_collections('/tmp/common.robot')
+        self.storage.add_keywords(self.lib_id, [('Log Out', 'Logs out', ['user', 'password'])])
+        self.storage.add_keywords(self.lib_id, [('log_out', 'Logs out again', ['user'])])
+        self.assertEqual(self.storage.db.execute('select count(*) from keyword_docs').scalar(), 3)
+        self.assertEqual(self.storage.db.execute('select count(*) from keyword_args').scalar(), 3)
+        self.storage.delete_keywords(self.lib_id)
+        self.assertEqual(self.storage.db.execute('select count(*) from keyword_docs').scalar(), 0)
+        self.assertEqual(self.storage.db.execute('select count(*) from keyword_args').scalar(), 0)
+
+
+class SqlStorageSchemaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'old.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_should_replace_tables_from_older_versions(self):
+        conn = sqlite3.connect(self.filename)
+        conn.execute('CREATE TABLE keywords (keyword_id INTEGER PRIMARY KEY, name TEXT, '
+                     'collection_id INTEGER, doc_id TEXT, args_id TEXT)')
+        conn.commit()
+        conn.close()
+        storage = SqlStorage('sqlite:///' + self.filename)
+        collection_id = storage.add_collection(None, 'MyLibrary', 'library', '')
+        storage.add_keywords(collection_id, [('Open Page', '', [])])
+        self.assertEqual(storage.get_keyword(collection_id, 'open page')['name'], 'Open Page')
+
+
+class ReplicatedStorageTest(StorageConformance, unittest.TestCase):
+
+    def create_storage(self):
+        # a replica that is always up to date: the same sqlite file
+        self.tmpdir = tempfile.mkdtemp()
+        url = 'sqlite:///' + os.path.join(self.tmpdir, 'primary.db')
+        return create_storage(url, read_urls=[url])
+
+    def tearDown(self):
+        for storage in [self.storage.primary] + self.storage.replicas:
+            storage.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_should_not_create_tables_in_replicas(self):
+        filename = os.path.join(self.tmpdir, 'replica.db')
+        SqlStorage('sqlite:///' + filename, read_only=True).db.close()
+        conn = sqlite3.connect(filename)
+        self.assertEqual(conn.execute("SELECT name FROM sqlite_master").fetchall(), [])
+        conn.close()
+
+    def test_should_read_from_the_primary_if_replicas_fail(self):
+        # a replica that hasn't got any tables yet
+        broken = SqlStorage('sqlite:///' + os.path.join(self.tmpdir, 'replica.db'), read_only=True)
+        storage = ReplicatedStorage(self.storage.primary, [broken])
+        with self.assertLogs('rfhub.storage.replicated', 'WARNING'):
+            self.assertEqual([c['name'] for c in storage.get_collections()], ['MyLibrary', 'common'])
+        # and skip them for a while
+        self.assertEqual(list(storage._down), [0])
+        self.assertIsNone(storage._replica())
+        broken.db.close()
+
+    def test_should_not_skip_replicas_for_errors_in_the_query(self):
+        class Replica(object):
+            def get_collections(self, pattern, libtype):
+                raise DataError('SELECT ...', {}, ValueError('invalid input syntax for integer'))
+
+        storage = ReplicatedStorage(self.storage.primary, [Replica()])
+        self.assertRaises(DataError, storage.get_collections)
+        self.assertEqual(storage._down, {})
+
+    def test_should_read_all_chunks_of_a_list_from_one_replica(self):
+        url = 'sqlite:///' + os.path.join(self.tmpdir, 'primary.db')
+        replicas = [SqlStorage(url, read_only=True) for i in range(2)]
+        storage = ReplicatedStorage(self.storage.primary, replicas)
+        chunks = storage.iter_keyword_fields(['name'], chunk_size=1)
+        used = []
+        for replica in replicas:
+            replica.get_keyword_fields = lambda *args, replica=replica: (
+                used.append(replica), SqlStorage.get_keyword_fields(replica, *args))[1]
+        names = []
+        # as the handlers do, a chunk at a time on whichever thread is free
+        for i in range(4):
+            thread = threading.Thread(target=lambda: names.extend(next(chunks, [])))
+            thread.start()
+            thread.join()
+        self.assertEqual(names, [('Close Page',), ('Open Page',), ('Login',)])
+        self.assertEqual(len(set(used)), 1)
+        for replica in replicas:
+            replica.db.close()
+
+    def test_should_spread_threads_over_replicas(self):
+        url = 'sqlite:///' + os.path.join(self.tmpdir, 'primary.db')
+        replicas = [SqlStorage(url, read_only=True) for i in range(2)]
+        storage = ReplicatedStorage(self.storage.primary, replicas)
+        chosen = []
+        threads = [threading.Thread(target=lambda: chosen.append(storage._replica())) for i in range(2)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        self.assertEqual(sorted(chosen), [0, 1])
+        for replica in replicas:
+            replica.db.close()
+
+    def test_should_not_give_memory_storage_replicas(self):
+        with self.assertRaises(ValueError):
+            create_storage('memory://', read_urls=['sqlite:///:memory:'])
+
+
+class MemoryStorageTest(StorageConformance, unittest.TestCase):
+
+    def create_storage(self):
+        return MemoryStorage()
+
+    def test_should_be_empty_after_deleting_every_keyword(self):
+        self.storage.add_keywords(self.lib_id, [('open_page', 'Opens another page', ['url'])])
+        self.storage.delete_keywords(self.lib_id)
+        self.storage.delete_keywords(self.res_id)
+        self.assertEqual((self.storage._docs, self.storage._synopses, self.storage._arglists),
+                         ({}, {}, {}))
+
+    def test_should_be_selected_by_memory_url(self):
+        self.assertIsInstance(create_storage('memory://'), MemoryStorage)
@@ -0,0 +1,118 @@
+from rfhub import blueprints
+from rfhub.kwdb import KeywordTable
+from rfhub.usages import find_calls
+import flask
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+SUITE = '''\
+*** Settings ***
+Resource          common.robot
+Suite Setup       common.Login    admin    secret
+
+*** Test Cases ***
+Valid Login
+    Given Login    demo    mode
+    ${value}=    Get Value
+    [Teardown]    Logout
+
+Templated
+    [Template]    Login
+    alice    secret
+    bob      secret
+'''
+
+COMMON = '''\
+*** Keywords ***
+Login
+    [Arguments]    ${user}    ${password}
+    Log    ${user}
+
+Logout
+    No Operation
+
+Get Value
+    [Return]    42
+'''
+
+INIT = '''\
+*** Settings ***
+Resource          common.robot
+Suite Setup       Login    admin    secret
+Suite Teardown    Logout
+'''
+
+
+class UsagesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.suite = os.path.join(self.tmpdir, 'suite.robot')
+        with open(self.suite, 'w') as f:
+            f.write(SUITE)
+        with open(os.path.join(self.tmpdir, 'common.robot'), 'w') as f:
+            f.write(COMMON)
+        self.kwdb = KeywordTable('sqlite:///:memory:', watch=False, index_usages=True)
+        self.kwdb.add(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_should_find_calls_in_steps_fixtures_and_templates(self):
+        calls = [(name, owner) for (name, owner, lineno) in find_calls(self.suite)]
+        self.assertEqual(calls, [('common.Login', None),
+                                 ('Given Login', 'Valid Login'),
+                                 ('Get Value', 'Valid Login'),
+                                 ('Logout', 'Valid Login'),
+                                 ('Login', 'Templated')])
+
+    def test_should_find_suite_fixtures_in_init_files(self):
+        init = os.path.join(self.tmpdir, '__init__.robot')
+        with open(init, 'w') as f:
+            f.write(INIT)
+        calls = [(name, owner) for (name, owner, lineno) in find_calls(init)]
+        self.assertEqual(calls, [('Login', None), ('Logout', None)])
+
+    def test_should_index_resource_files_at_startup(self):
+        with open(os.path.join(self.tmpdir, 'more.resource'), 'w') as f:
+            f.write('*** Keywords ***\nLog Out Twice\n    Logout\n    Logout\n')
+        kwdb = KeywordTable('sqlite:///:memory:', watch=False, index_usages=True)
+        self.assertEqual(kwdb.count_files(self.tmpdir), 3)
+        kwdb.add(self.tmpdir)
+        self.assertEqual(kwdb.get_usages('common', 'Logout')[0], 3)
+
+    def test_should_match_calls_to_keywords_by_name(self):
+        (total, calls) = self.kwdb.get_usages('common', 'Login')
+        self.assertEqual(total, 3)
+        self.assertEqual([call[3] for call in calls], ['common.Login', 'Given Login', 'Login'])
+        self.assertEqual(self.kwdb.get_usages('other', 'Login')[0], 2)
+        self.assertEqual(self.kwdb.get_usages('common', 'Log')[0], 1)
+
+    def test_should_update_usages_when_files_change(self):
+        with open(self.suite, 'w') as f:
+            f.write(SUITE.replace('Logout', 'Log    bye'))
+        self.kwdb.on_change(self.suite, 'modified')
+        self.assertEqual(self.kwdb.get_usages('common', 'Logout')[0], 0)
+        self.assertEqual(self.kwdb.get_usages('common', 'Log')[0], 2)
+        self.kwdb.remove(self.suite)
+        self.assertEqual(self.kwdb.get_usages('common', 'Login')[0], 0)
+
+    def test_should_page_usages_in_the_api(self):
+        app = flask.Flask('rfhub')
+        app.register_blueprint(blueprints.api, url_prefix='/api')
+        app.kwdb = self.kwdb
+        client = app.test_client()
+        response = client.get('/api/keywords/common/Login/usages?limit=2')
+        page = json.loads(response.get_data(as_text=True))
+        self.assertEqual((page['total'], len(page['usages'])), (3, 2))
+        self.assertEqual(page['usages'][0]['path'], self.suite)
+        page = json.loads(client.get(page['next']).get_data(as_text=True))
+        self.assertEqual([usage['owner'] for usage in page['usages']], ['Templated'])
+        self.assertIsNone(page['next'])
+        self.assertEqual(client.get('/api/keywords/common/Nothing/usages').status_code, 404)
+        response = client.get('/api/keywords/?fields=name,usage_count&pattern=log*')
+        self.assertEqual(json.loads(response.get_data(as_text=True))['keywords'],
+                         [{'name': 'Login', 'usage_count': 3}, {'name': 'Logout', 'usage_count': 1}])
@@ -1 +1,17 @@
-from .KeywordTableTest import KeywordTableTest
\ No newline at end of file
+from .InstalledTest import InstalledTest
+from .KeywordTableTest import KeywordTableTest
+from .KeywordsApiTest import KeywordsApiTest
+from .CatalogTest import CatalogTest
+from .ChangesTest import ChangesTest
+from .DocPagesTest import DocPagesTest
+from .HandlersTest import HandlersTest, BusyHandlersTest, ProxiedHandlersTest
+from .LibspecTest import LibspecTest
+from .MetricsTest import MetricsTest
+from .SandboxTest import SandboxTest
+from .SchedulerTest import SchedulerTest, TokenBucketsTest
+from .SearchIndexTest import SearchIndexTest
+from .SnapshotTest import SnapshotTest
+from .StaticSiteTest import StaticSiteTest
+from .UsagesTest import UsagesTest
+from .DuplicatesTest import DuplicatesTest
+from .StorageTest import SqlStorageTest, SqlStorageSchemaTest, ReplicatedStorageTest, MemoryStorageTest